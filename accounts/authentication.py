@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import User
+from accounts.presence import presence
+
+
+TOKEN_VERSION_CLAIM = "ver"
+
+# Na ordem dos campos do model, como esperado por Model.from_db.
+SNAPSHOT_FIELDS = tuple(
+  field.attname
+  for field in User._meta.concrete_fields
+  if field.attname in {"id", "avatar", "avatar_variants", "name", "email", "is_superuser", "last_access", "token_version"}
+)
+
+
+class UserCache:
+  """
+  Cache em memória, por processo, dos dados do usuário usados na autenticação.
+  Limitado a `size` usuários (LRU) e com validade de `ttl` segundos, chaveado pelo
+  id do usuário e pela versão de tokens; cada processo só enxerga as próprias
+  invalidações, por isso o TTL deve ser curto.
+  """
+
+  def __init__(self, size, ttl):
+    self.size = size
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, user_id, version) -> User | None:
+    key = (str(user_id), version)
+
+    with self.lock:
+      entry = self.entries.get(key)
+
+      if entry is None:
+        return None
+
+      expires_at, values = entry
+
+      if expires_at < time.monotonic():
+        del self.entries[key]
+        return None
+
+      self.entries.move_to_end(key)
+
+    # Campos fora do snapshot (ex.: password) ficam adiados: um save() grava só os
+    # campos carregados e o acesso a um campo adiado busca o valor no banco.
+    return User.from_db("default", SNAPSHOT_FIELDS, values)
+
+  def set(self, user) -> None:
+    key = (str(user.id), user.token_version)
+    values = tuple(getattr(user, field) for field in SNAPSHOT_FIELDS)
+
+    with self.lock:
+      self.entries[key] = (time.monotonic() + self.ttl, values)
+      self.entries.move_to_end(key)
+
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+
+  def invalidate(self, user_id) -> None:
+    user_id = str(user_id)
+
+    with self.lock:
+      for key in [key for key in self.entries if key[0] == user_id]:
+        del self.entries[key]
+
+  def clear(self) -> None:
+    with self.lock:
+      self.entries.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+def invalidate_user(sender, instance, **kwargs) -> None:
+  user_cache.invalidate(instance.pk)
+
+
+# Atualizações via queryset.update() não disparam sinais e precisam invalidar manualmente.
+post_save.connect(invalidate_user, sender=User)
+post_delete.connect(invalidate_user, sender=User)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+  """
+  JWTAuthentication que busca o usuário no user_cache antes de ir ao banco.
+  Tokens de uma versão anterior à do usuário (ver SignOutEverywhereView e a troca de
+  senha em UserView) são recusados.
+  O acesso é registrado no presence, que grava `last_access` em lotes.
+  """
+
+  def get_user(self, validated_token):
+    try:
+      user_id = validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+      raise InvalidToken("Token sem identificação do usuário.")
+
+    version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+    user = user_cache.get(user_id, version)
+
+    if user is None:
+      user = super().get_user(validated_token)
+
+      if user.token_version != version:
+        raise AuthenticationFailed("Token inválido.", code="token_not_valid")
+
+      user_cache.set(user)
+
+    user.last_access = presence.touch(user.id)
+    return user
+
+
+class QueryStringJWTAuthentication(CachedJWTAuthentication):
+  """
+  Aceita também o token de acesso no parâmetro `token` da URL, para recursos carregados
+  direto pelo navegador (<img>, <audio>, downloads), que não enviam o cabeçalho Authorization.
+  """
+
+  def authenticate(self, request):
+    result = super().authenticate(request)
+
+    if result is not None:
+      return result
+
+    token = request.query_params.get("token")
+
+    if not token:
+      return None
+
+    validated_token = self.get_validated_token(token.encode())
+    return self.get_user(validated_token), validated_token
+
+
+class UserRefreshToken(RefreshToken):
+  """
+  Refresh token com a versão de tokens do usuário, copiada também para o access token.
+  """
+
+  @classmethod
+  def for_user(cls, user):
+    token = super().for_user(user)
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['avatar'], name='users_avatar_idx'),
+        ),
+    ]
@@ -15,10 +15,14 @@ class UserManager(BaseUserManager):
 
 class User(AbstractBaseUser):
   avatar = models.TextField(default="/media/avatars/default.png")
+  # Miniaturas WebP do avatar (attachments.thumbnails): {tamanho: {src, width, height}}.
+  avatar_variants = models.JSONField(default=dict, blank=True)
   name = models.CharField(max_length=100)
   email = models.EmailField(max_length=255, unique=True)
   is_superuser = models.BooleanField(default=False)
   last_access = models.DateTimeField(auto_now_add=True)
+  # Incrementada no logout: tokens emitidos com uma versão anterior deixam de valer.
+  token_version = models.PositiveIntegerField(default=0)
   
   objects = UserManager()
   
@@ -35,4 +39,6 @@ class User(AbstractBaseUser):
       return self.is_superuser
     
   class Meta:
-    db_table = 'users'
\ No newline at end of file
+    db_table = 'users'
+    # Avatares em blobs compartilhados são públicos (attachments.media.is_public).
+    indexes = [models.Index(fields=['avatar'], name='users_avatar_idx')]
\ No newline at end of file
@@ -0,0 +1,164 @@
+import atexit
+import logging
+import threading
+
+from django.db import connection
+from django.db.models import Case, F, Value, When
+from django.utils.timezone import now
+
+from accounts.models import User
+
+
+logger = logging.getLogger("accounts.presence")
+
+FLUSH_BATCH_SIZE = 1000
+
+
+class PresenceTracker:
+  """
+  Guarda em memória o último acesso e as conexões ativas de cada usuário.
+
+  O último acesso (alimentado pela autenticação das requisições e pelas conexões do
+  socket) é gravado em `users.last_access` em lotes por `flush`, que roda
+  periodicamente depois de `start`; assim uma sequência de requisições do mesmo
+  usuário vira uma única escrita. O status online vale para as conexões atendidas por
+  este processo.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.pending = {}
+    self.connections = {}
+    self.thread = None
+
+  def touch(self, user_id, at=None):
+    """
+    Registra um acesso do usuário e retorna o horário registrado.
+    """
+    at = at or now()
+
+    with self.lock:
+      if self.pending.get(user_id, at) <= at:
+        self.pending[user_id] = at
+
+    return at
+
+  def last_seen(self, user_id):
+    """
+    Retorna o último acesso ainda não gravado no banco, ou None.
+    """
+    with self.lock:
+      return self.pending.get(user_id)
+
+  def connect(self, user_id, sid) -> bool:
+    """
+    Registra uma conexão do usuário. Retorna True se ele acabou de ficar online.
+    """
+    self.touch(user_id)
+
+    with self.lock:
+      sids = self.connections.setdefault(user_id, set())
+      sids.add(sid)
+      return len(sids) == 1
+
+  def disconnect(self, user_id, sid) -> bool:
+    """
+    Remove uma conexão do usuário. Retorna True se ele acabou de ficar offline.
+    """
+    self.touch(user_id)
+
+    with self.lock:
+      sids = self.connections.get(user_id)
+
+      if not sids or sid not in sids:
+        return False
+
+      sids.discard(sid)
+
+      if sids:
+        return False
+
+      del self.connections[user_id]
+      return True
+
+  def is_online(self, user_id) -> bool:
+    with self.lock:
+      return user_id in self.connections
+
+  def flush(self) -> int:
+    """
+    Grava os acessos pendentes em `users.last_access`, sem voltar no tempo um valor
+    mais recente já gravado (ex.: pelo logout). Retorna a quantidade de usuários.
+    Se a gravação falhar, os acessos voltam para a fila.
+    """
+    with self.lock:
+      pending, self.pending = self.pending, {}
+
+    if not pending:
+      return 0
+
+    items = list(pending.items())
+
+    try:
+      for start in range(0, len(items), FLUSH_BATCH_SIZE):
+        update_last_access(items[start:start + FLUSH_BATCH_SIZE])
+    except Exception:
+      with self.lock:
+        for user_id, at in pending.items():
+          if self.pending.get(user_id, at) <= at:
+            self.pending[user_id] = at
+      raise
+
+    return len(items)
+
+  def start(self, interval) -> None:
+    """
+    Inicia a gravação periódica (thread, ou greenlet com o monkey patch do eventlet)
+    e a gravação final ao encerrar o processo.
+    """
+    if self.thread is not None or interval <= 0:
+      return
+
+    self.thread = threading.Thread(target=self.run, args=(interval,), name="presence-flush", daemon=True)
+    self.thread.start()
+    atexit.register(self.flush)
+
+  def run(self, interval) -> None:
+    stop = threading.Event()
+
+    while not stop.wait(interval):
+      try:
+        self.flush()
+      except Exception:
+        logger.exception("Erro ao gravar o último acesso dos usuários.")
+      finally:
+        connection.close()
+
+
+def update_last_access(items) -> None:
+  """
+  Atualiza `last_access` de vários usuários em um único UPDATE.
+  No PostgreSQL usa `UPDATE ... FROM (VALUES ...)`; nos demais bancos, CASE WHEN.
+  """
+  if connection.vendor == "postgresql":
+    table = connection.ops.quote_name(User._meta.db_table)
+    values = ", ".join(["(%s, %s::timestamptz)"] * len(items))
+
+    with connection.cursor() as cursor:
+      cursor.execute(
+        f"UPDATE {table} SET last_access = v.last_access "
+        f"FROM (VALUES {values}) AS v(id, last_access) "
+        f"WHERE {table}.id = v.id AND {table}.last_access < v.last_access",
+        [param for item in items for param in item],
+      )
+    return
+
+  User.objects.filter(id__in=[user_id for user_id, _ in items]).update(
+    last_access=Case(
+      *[When(id=user_id, last_access__lt=at, then=Value(at)) for user_id, at in items],
+      default=F("last_access"),
+    )
+  )
+
+
+presence = PresenceTracker()
@@ -1,9 +1,14 @@
+import threading
+from collections import OrderedDict
+
 from rest_framework import serializers
 from django.conf import settings
 from accounts.models import User
+from attachments.thumbnails import thumbnail_urls
+from core.metrics import MeasuredSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'email', 'name', 'avatar', 'is_superuser', 'last_access')
@@ -12,4 +17,92 @@ class UserSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data['avatar'] = f"{settings.CURRENT_URL}{instance.avatar}" if data['avatar'] else None
-        return data
\ No newline at end of file
+        data['avatar_thumbnails'] = thumbnail_urls(instance.avatar_variants)
+        return data
+
+
+class UserRepresentationCache:
+    """
+    Cache em memória, por processo, das representações de UserSerializer, limitado a
+    `size` usuários (LRU). A chave é o id do usuário e a versão dos campos
+    representados (nome, e-mail, avatar e suas miniaturas), assim uma edição feita em
+    outro processo nunca devolve dados antigos; `invalidate` (UserView.patch) apenas
+    libera as versões anteriores.
+
+    `last_access` muda a cada acesso e é formatado na leitura. As representações são
+    compartilhadas entre as respostas e não devem ser alteradas.
+    """
+
+    last_access_field = serializers.DateTimeField()
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def serialize(self, user, memo=None) -> dict:
+        """
+        Representação de `user`, igual a UserSerializer(user).data.
+        `memo` é um dicionário da requisição atual (ex.: uma página de mensagens), que
+        evita até a consulta ao LRU quando o mesmo usuário aparece em várias linhas.
+        """
+        key = (
+            user.id,
+            user.name,
+            user.email,
+            user.avatar,
+            user.is_superuser,
+            tuple(sorted(
+                (name, variant['src']) for name, variant in (user.avatar_variants or {}).items()
+            )),
+            user.last_access,
+        )
+
+        if memo is not None and key in memo:
+            return memo[key]
+
+        data = self.get(key[:-1])
+
+        if data is None:
+            data = dict(UserSerializer(user).data)
+            self.set(key[:-1], data)
+        else:
+            data = dict(data)
+            data['last_access'] = self.last_access_field.to_representation(user.last_access)
+
+        if memo is not None:
+            memo[key] = data
+
+        return data
+
+    def get(self, key) -> dict | None:
+        with self.lock:
+            data = self.entries.get(key)
+
+            if data is not None:
+                self.entries.move_to_end(key)
+
+            return data
+
+    def set(self, key, data) -> None:
+        if not self.size:
+            return
+
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == user_id]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+user_representations = UserRepresentationCache(settings.USER_REPRESENTATION_CACHE_SIZE)
@@ -1,3 +1,179 @@
+from datetime import timedelta
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.auth import AuthenticationService
+from accounts.authentication import CachedJWTAuthentication, UserRefreshToken, user_cache
+from accounts.models import User
+from accounts.presence import presence
+from accounts.serializers import UserSerializer, user_representations
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+        self.user = AuthenticationService().signup("Usuário", "usuario@email.com", "senha123")
+        self.refresh = UserRefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}")
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}"
+        )
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_cached_user_is_authenticated_without_queries(self):
+        self.authenticate()
+
+        with CaptureQueriesContext(connection) as queries:
+            user = self.authenticate()
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual((user.id, user.email, user.name), (self.user.id, "usuario@email.com", "Usuário"))
+
+    def test_patch_invalidates_cached_user(self):
+        self.authenticate()
+
+        response = self.client.patch("/api/v1/accounts/user", {"name": "Novo nome"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.authenticate().name, "Novo nome")
+        self.assertTrue(User.objects.get(id=self.user.id).check_password("senha123"))
+
+    def test_signout_ends_only_the_current_session(self):
+        other_session = UserRefreshToken.for_user(self.user)
+        self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 200)
+
+        response = self.client.post("/api/v1/accounts/signout", {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, 205)
+
+        # O refresh token deste dispositivo não pode ser usado de novo.
+        response = self.client.post("/api/v1/accounts/signout", {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, 401)
+
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f"Bearer {other_session.access_token}")
+        self.assertEqual(other.get("/api/v1/accounts/user").status_code, 200)
+
+    def test_signout_everywhere_revokes_every_session(self):
+        other_session = UserRefreshToken.for_user(self.user)
+
+        response = self.client.post("/api/v1/accounts/signout/all", {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, 205)
+
+        self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 401)
+
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f"Bearer {other_session.access_token}")
+        self.assertEqual(other.get("/api/v1/accounts/user").status_code, 401)
+
+        refresh = UserRefreshToken.for_user(User.objects.get(id=self.user.id))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 200)
+
+    def test_password_change_revokes_other_sessions(self):
+        self.authenticate()
+
+        response = self.client.patch("/api/v1/accounts/user", {"password": "nova-senha"})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['result']['access']}")
+        self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 200)
+
+
+class PresenceTrackerTestCase(TestCase):
+
+    def setUp(self):
+        presence.pending.clear()
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.addCleanup(presence.pending.clear)
+
+        self.user = User.objects.create(name="Usuário", email="usuario@email.com")
+        self.other_user = User.objects.create(name="Outro", email="outro@email.com")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {UserRefreshToken.for_user(self.user).access_token}"
+        )
+
+    def test_requests_do_not_write_last_access(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.assertEqual(self.client.get("/api/v1/accounts/user").status_code, 200)
+
+        self.assertFalse([query for query in queries if query["sql"].startswith("UPDATE")])
+        self.assertIn(self.user.id, presence.pending)
+
+    def test_flush_writes_pending_accesses_in_one_query(self):
+        last_access = now() + timedelta(minutes=5)
+        presence.touch(self.user.id, last_access - timedelta(minutes=1))
+        presence.touch(self.user.id, last_access)
+        presence.touch(self.other_user.id, last_access)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(presence.flush(), 2)
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            set(User.objects.values_list("last_access", flat=True)), {last_access}
+        )
+
+    def test_flush_does_not_move_last_access_back(self):
+        presence.touch(self.user.id, self.user.last_access - timedelta(minutes=1))
+        presence.flush()
+
+        self.assertEqual(User.objects.get(id=self.user.id).last_access, self.user.last_access)
+
+
+class UserRepresentationCacheTestCase(TestCase):
+
+    def setUp(self):
+        user_representations.clear()
+        self.addCleanup(user_representations.clear)
+
+        self.user = User.objects.create(name="Usuário", email="usuario@email.com", last_access=now())
+
+    def test_cached_representation_matches_serializer(self):
+        expected = UserSerializer(self.user).data
+        self.assertEqual(user_representations.serialize(self.user), expected)
+
+        # A segunda leitura vem do cache, com o último acesso atual.
+        self.user.last_access += timedelta(minutes=1)
+        data = user_representations.serialize(self.user)
+        self.assertEqual(data, UserSerializer(self.user).data)
+        self.assertEqual(list(data), list(expected))
+
+        memo = {}
+        self.assertIs(
+            user_representations.serialize(self.user, memo),
+            user_representations.serialize(self.user, memo),
+        )
+
+    def test_new_version_is_not_served_from_cache(self):
+        user_representations.serialize(self.user)
+
+        # Outro processo alterou o usuário: a versão muda sem invalidação local.
+        self.user.name = "Novo nome"
+        self.assertEqual(user_representations.serialize(self.user)["name"], "Novo nome")
+
+        self.user.avatar_variants = {"small": {"src": "/media/a/small.webp", "width": 64, "height": 64}}
+        self.assertIn("small", user_representations.serialize(self.user)["avatar_thumbnails"])
+
+        # Miniaturas regeradas (ex.: pelo generate_thumbnails) também mudam a versão.
+        self.user.avatar_variants = {"small": {"src": "/media/b/small.webp", "width": 64, "height": 64}}
+        self.assertTrue(
+            user_representations.serialize(self.user)["avatar_thumbnails"]["small"].endswith("/media/b/small.webp")
+        )
 
-# Create your tests here.
+        user_representations.invalidate(self.user.id)
+        self.assertEqual(user_representations.entries, {})
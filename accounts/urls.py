@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
   SignInView,
+  SignOutEverywhereView,
   SignOutView,
   SignUpView,
   UserView,
@@ -10,5 +11,6 @@ urlpatterns = [
   path('signin', SignInView.as_view(), name='signin'),
   path('signup', SignUpView.as_view(), name='signup'),
   path('signout', SignOutView.as_view(), name='logout'),
+  path('signout/all', SignOutEverywhereView.as_view(), name='logout-all'),
   path('user', UserView.as_view(), name='user'),
 ]
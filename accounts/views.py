@@ -1,18 +1,22 @@
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.authentication import UserRefreshToken, user_cache
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from django.core.files.storage import FileSystemStorage
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from accounts.serializers import UserSerializer
+from accounts.serializers import UserSerializer, user_representations
 from rest_framework.response import Response
 from core.exceptions import ValidationError
 from rest_framework.views import APIView
 from accounts.auth import AuthenticationService
 from django.utils.timezone import now
+from django.db.models import F
 from rest_framework import status
 from accounts.models import User
+from attachments.blobs import BlobStorage
+from attachments.thumbnails import delete_variants, generate_avatar_thumbnails
 from django.conf import settings
-import uuid
 import os
 
 
@@ -33,7 +37,7 @@ class SignInView(APIView):
             )
 
         user = UserSerializer(signin).data
-        refresh = RefreshToken.for_user(signin)
+        refresh = UserRefreshToken.for_user(signin)
 
         return Response(
             {
@@ -68,7 +72,7 @@ class SignUpView(APIView):
             )
 
         user = UserSerializer(singup).data
-        refresh = RefreshToken.for_user(singup)
+        refresh = UserRefreshToken.for_user(singup)
 
         return Response(
             {
@@ -83,9 +87,17 @@ class SignUpView(APIView):
 
 
 class SignOutView(APIView):
+    """
+    Encerra a sessão do dispositivo: invalida o refresh token enviado e remove o
+    usuário do cache de autenticação. As sessões dos outros dispositivos continuam
+    válidas; o access token deste dispositivo deve ser descartado pelo cliente.
+    """
 
     permission_classes = [IsAuthenticated]
 
+    # Encerra também as sessões dos outros dispositivos (ver SignOutEverywhereView).
+    everywhere = False
+
     def post(self, request):
         
         refresh_token = request.data.get("refresh")
@@ -98,26 +110,44 @@ class SignOutView(APIView):
             )
         try:
             token = RefreshToken(refresh_token)
-            user.last_access = now()
-            user.save()
+
+            if str(token.get(api_settings.USER_ID_CLAIM)) != str(user.id):
+                raise TokenError("Token de outro usuário.")
+
             token.blacklist()
         except TokenError:
             raise AuthenticationFailed(
                 "Erro ao invalidar o token.", code=status.HTTP_400_BAD_REQUEST
             )
 
+        changes = {"last_access": now()}
+
+        if self.everywhere:
+            # Incrementar a versão invalida todos os access e refresh tokens já emitidos.
+            changes["token_version"] = F("token_version") + 1
+
+        User.objects.filter(id=user.id).update(**changes)
+        user_cache.invalidate(user.id)
+
         return Response(
             status=status.HTTP_205_RESET_CONTENT
         )
 
 
+class SignOutEverywhereView(SignOutView):
+    """
+    Encerra a sessão em todos os dispositivos do usuário.
+    """
+
+    everywhere = True
+
+
 class UserView(APIView):
 
     def get(self, request):
+        # O último acesso já foi registrado na autenticação (accounts/presence.py).
         user = request.user
 
-        User.objects.filter(id=user.id).update(last_access=now())
-
         if not user:
             raise AuthenticationFailed(
                 "Usuário não autenticado.", code=status.HTTP_401_UNAUTHORIZED
@@ -128,13 +158,14 @@ class UserView(APIView):
         return Response({"result": user_data}, status=status.HTTP_200_OK)
 
     def patch(self, request):
-        user = request.user
-
-        if not user:
+        if not request.user:
             raise AuthenticationFailed(
                 "Usuário não autenticado.", code=status.HTTP_401_UNAUTHORIZED
             )
 
+        # request.user pode vir do cache de autenticação; a edição parte do registro atual.
+        user = User.objects.get(id=request.user.id)
+
         name = request.data.get("name", user.name)
         email = request.data.get("email", user.email)
         password = request.data.get("password")
@@ -145,11 +176,11 @@ class UserView(APIView):
         
         if password:
             user.set_password(password)
+            # A troca de senha encerra as sessões dos outros dispositivos; esta recebe
+            # novos tokens na resposta.
+            user.token_version += 1
 
-        storage = FileSystemStorage(
-            location=os.path.join(settings.MEDIA_ROOT, 'avatars'),
-            base_url=f"{settings.MEDIA_URL}avatars/"
-        )
+        previous_avatar = user.avatar
 
         if avatar:
             content_type = avatar.content_type
@@ -165,18 +196,44 @@ class UserView(APIView):
                     code=status.HTTP_400_BAD_REQUEST,
                 )
             
-            # Remove avatar anterior se existir e não for o padrão
-            if user.avatar and user.avatar != "/media/avatars/default.png":
-                old_file_path = user.avatar.replace(settings.MEDIA_URL, "")
-                if storage.exists(old_file_path):
-                    storage.delete(old_file_path)
-            
-            filename = f"{uuid.uuid4()}.{extension}"
-            file_path = storage.save(filename, avatar)
-            user.avatar = storage.url(file_path)
+            blob_storage = BlobStorage()
+            blob = blob_storage.save(avatar, extension)
+
+            # Libera o avatar anterior se existir e não for o padrão: blobs perdem uma
+            # referência (a coleta de lixo apaga os sem uso) e arquivos antigos são removidos.
+            if previous_avatar and previous_avatar != "/media/avatars/default.png":
+                if previous_avatar.startswith(f"{settings.MEDIA_URL}avatars/"):
+                    storage = FileSystemStorage(
+                        location=os.path.join(settings.MEDIA_ROOT, 'avatars'),
+                        base_url=f"{settings.MEDIA_URL}avatars/"
+                    )
+                    old_file_path = previous_avatar.replace(f"{settings.MEDIA_URL}avatars/", "")
+                    if storage.exists(old_file_path):
+                        storage.delete(old_file_path)
+                    delete_variants(previous_avatar)
+                else:
+                    blob_storage.release([previous_avatar])
+
+            if blob.src != previous_avatar:
+                user.avatar = blob.src
+                user.avatar_variants = {}
 
         user.save()
+        # As representações em cache já deixam de valer pela versão; aqui apenas são liberadas.
+        user_representations.invalidate(user.id)
+
+        if user.avatar != previous_avatar:
+            # As miniaturas são geradas depois do commit, fora da requisição.
+            generate_avatar_thumbnails(user)
 
         user_data = UserSerializer(user).data
 
+        if password:
+            refresh = UserRefreshToken.for_user(user)
+            user_data = {
+                **user_data,
+                "access": str(refresh.access_token),
+                "refresh": str(refresh),
+            }
+
         return Response({"result": user_data}, status=status.HTTP_200_OK)
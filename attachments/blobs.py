@@ -0,0 +1,209 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from attachments.models import Blob
+from attachments.thumbnails import delete_variants
+
+
+BLOBS_FOLDER = "blobs"
+BUFFER_SIZE = 64 * 1024
+
+# Idade mínima, em segundos, de um arquivo de blob sem linha no banco para ser apagado:
+# o arquivo é movido para o destino antes do commit da transação que cria a linha.
+ORPHAN_FILE_AGE = 60 * 60
+
+EXTENSION = re.compile(r"^[a-z0-9]{1,15}$")
+
+
+def blob_name(digest, extension) -> str:
+  """
+  Caminho do blob relativo a MEDIA_ROOT, em pastas pelos 4 primeiros dígitos do hash
+  para que nenhuma pasta acumule arquivos demais. A extensão é mantida para que o
+  tipo do arquivo seja reconhecido na entrega (attachments.media).
+  """
+  extension = (extension or "").lower()
+  suffix = f".{extension}" if EXTENSION.match(extension) else ""
+  return f"{BLOBS_FOLDER}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+
+def file_digest(path) -> str:
+  digest = hashlib.sha256()
+
+  with open(path, "rb") as source:
+    for data in iter(lambda: source.read(BUFFER_SIZE), b""):
+      digest.update(data)
+
+  return digest.hexdigest()
+
+
+class BlobStorage:
+  """
+  Armazenamento endereçado pelo conteúdo: arquivos iguais são gravados uma vez
+  (um blob por sha256) e cada anexo ou avatar que aponta para o blob conta uma
+  referência. Como o conteúdo de um `src` nunca muda, ele pode ficar em cache
+  indefinidamente nos clientes e proxies.
+
+  `save` e `save_path` retornam o blob com uma referência a mais, para o anexo que
+  será criado; `release` devolve as referências dos anexos removidos, e
+  `collect_garbage` apaga os blobs sem referências e os arquivos que ficaram sem
+  blob quando a transação que os gravou foi desfeita.
+  """
+
+  def save(self, file, extension) -> Blob:
+    """
+    Grava um arquivo enviado (UploadedFile), calculando o sha256 enquanto o copia.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, BLOBS_FOLDER)
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+      with os.fdopen(descriptor, "wb") as destination:
+        for chunk in file.chunks(BUFFER_SIZE):
+          digest.update(chunk)
+          destination.write(chunk)
+          size += len(chunk)
+
+      return self.store(temporary, digest.hexdigest(), size, extension)
+    finally:
+      if os.path.exists(temporary):
+        os.remove(temporary)
+
+  def save_path(self, path, extension, digest=None) -> Blob:
+    """
+    Move para o armazenamento um arquivo já gravado no disco (envio em partes).
+    """
+    return self.store(path, digest or file_digest(path), os.path.getsize(path), extension)
+
+  def store(self, path, digest, size, extension) -> Blob:
+    with transaction.atomic():
+      blob = Blob.objects.select_for_update().filter(digest=digest).first()
+
+      if blob is None:
+        name = blob_name(digest, extension)
+        destination = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(path, destination)
+        # O move preserva a data do arquivo recebido; collect_orphan_files usa a data
+        # em que o arquivo chegou em blobs/ para não apagar o de uma transação aberta.
+        os.utime(destination)
+
+        try:
+          with transaction.atomic():
+            blob = Blob.objects.create(digest=digest, src=settings.MEDIA_URL + name, size=size)
+        except IntegrityError:
+          # Outro envio do mesmo conteúdo criou o blob ao mesmo tempo; o arquivo é o mesmo.
+          blob = Blob.objects.select_for_update().get(digest=digest)
+
+          if blob.src != settings.MEDIA_URL + name:
+            os.remove(destination)
+      else:
+        # Conteúdo já armazenado: a cópia recebida é descartada.
+        os.remove(path)
+
+      Blob.objects.filter(digest=digest).update(refcount=F("refcount") + 1)
+      blob.refcount += 1
+
+    return blob
+
+  def release(self, srcs) -> None:
+    """
+    Devolve uma referência de cada `src` (anexos ou avatares removidos).
+    Arquivos anteriores ao armazenamento por conteúdo não têm blob e são ignorados.
+    """
+    for src, count in Counter(srcs).items():
+      Blob.objects.filter(src=src).update(
+        refcount=Greatest(F("refcount") - count, Value(0))
+      )
+
+  def collect_garbage(self, batch_size=1000) -> int:
+    """
+    Apaga os blobs sem referências, com seus arquivos e miniaturas, e depois os
+    arquivos sem blob (ver collect_orphan_files).
+    Os arquivos são removidos com a linha do blob bloqueada, antes do commit, assim um
+    envio simultâneo do mesmo conteúdo espera e grava o arquivo de novo.
+    Retorna a quantidade de blobs e arquivos apagados.
+    """
+    total = 0
+
+    while True:
+      with transaction.atomic():
+        blobs = list(
+          Blob.objects.select_for_update(skip_locked=True)
+          .filter(refcount=0)
+          .order_by("created_at")[:batch_size]
+        )
+
+        if not blobs:
+          return total + self.collect_orphan_files(batch_size)
+
+        for blob in blobs:
+          path = os.path.join(settings.MEDIA_ROOT, blob.src[len(settings.MEDIA_URL):])
+
+          if os.path.exists(path):
+            os.remove(path)
+
+          delete_variants(blob.src)
+
+        Blob.objects.filter(digest__in=[blob.digest for blob in blobs], refcount=0).delete()
+
+      total += len(blobs)
+
+  def collect_orphan_files(self, batch_size=1000, min_age=ORPHAN_FILE_AGE) -> int:
+    """
+    Apaga os arquivos de blobs sem linha no banco, com mais de `min_age` segundos.
+    `store` move o arquivo para o destino dentro da transação da requisição; se ela
+    for desfeita, o arquivo fica sem blob e nenhuma referência chega a ele.
+    Retorna a quantidade de arquivos apagados.
+    """
+    root = os.path.join(settings.MEDIA_ROOT, BLOBS_FOLDER)
+    oldest = time.time() - min_age
+    candidates = {}
+    total = 0
+
+    def remove_orphans():
+      existing = set(Blob.objects.filter(src__in=candidates).values_list("src", flat=True))
+      removed = 0
+
+      for src, path in candidates.items():
+        if src not in existing and os.path.exists(path):
+          os.remove(path)
+          removed += 1
+
+      candidates.clear()
+      return removed
+
+    for directory, _, names in os.walk(root):
+      # Os blobs ficam em blobs/xx/yy/; na raiz só há os temporários de `save`.
+      if directory == root:
+        continue
+
+      for name in names:
+        path = os.path.join(directory, name)
+
+        try:
+          if os.path.getmtime(path) > oldest:
+            continue
+        except FileNotFoundError:
+          continue
+
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+        candidates[settings.MEDIA_URL + relative] = path
+
+        if len(candidates) >= batch_size:
+          total += remove_orphans()
+
+    return total + remove_orphans()
@@ -0,0 +1,6 @@
+from rest_framework.exceptions import APIException
+
+class UploadNotFound(APIException):
+    status_code = 404
+    default_detail = 'Envio não encontrado'
+    default_code = 'upload_not_found'
@@ -0,0 +1,42 @@
+"""
+Geração das miniaturas em WebP. Este módulo não depende do Django: as funções rodam
+nos processos do pool de attachments.thumbnails, que importam apenas o Pillow.
+"""
+
+import os
+
+from PIL import Image, ImageOps
+
+
+WEBP_QUALITY = 80
+WEBP_METHOD = 4
+
+
+def render_variants(source, directory, sizes) -> dict:
+  """
+  Gera em `directory` uma cópia WebP da imagem `source` para cada tamanho de `sizes`
+  ({nome: maior lado em pixels}), sem ampliar imagens menores que o tamanho.
+  Retorna {nome: {"file": nome do arquivo, "width": largura, "height": altura}}.
+  """
+  os.makedirs(directory, exist_ok=True)
+  variants = {}
+
+  with Image.open(source) as image:
+    # Fotos de celular guardam a rotação no EXIF; a miniatura já sai na posição certa.
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("RGBA" if has_alpha(image) else "RGB")
+
+    # Do maior para o menor: cada miniatura é reduzida a partir da anterior.
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+      image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+      filename = f"{name}.webp"
+      image.save(os.path.join(directory, filename), "WEBP", quality=WEBP_QUALITY, method=WEBP_METHOD)
+
+      variants[name] = {"file": filename, "width": image.width, "height": image.height}
+
+  return variants
+
+
+def has_alpha(image) -> bool:
+  return image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
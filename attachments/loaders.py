@@ -0,0 +1,30 @@
+from collections import defaultdict
+
+from attachments.models import AudioAttachment, FileAttachment
+
+
+ATTACHMENT_MODELS = {
+  "FILE": FileAttachment,
+  "AUDIO": AudioAttachment,
+}
+
+
+def load_attachments(messages) -> dict:
+  """
+  Carrega em lote os anexos de uma lista ou queryset de mensagens.
+  Agrupa os ids por `attachment_code` e consulta cada tabela de anexo uma única vez.
+  Retorna um mapa {(attachment_code, attachment_id): anexo}.
+  """
+  ids_by_code = defaultdict(set)
+
+  for message in messages:
+    if message.attachment_code in ATTACHMENT_MODELS and message.attachment_id:
+      ids_by_code[message.attachment_code].add(message.attachment_id)
+
+  attachments = {}
+
+  for code, ids in ids_by_code.items():
+    for pk, attachment in ATTACHMENT_MODELS[code].objects.in_bulk(ids).items():
+      attachments[(code, pk)] = attachment
+
+  return attachments
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from attachments import imaging
+from attachments.thumbnails import FILE_SIZES
+
+
+def make_image(path, width, height):
+    """
+    Imagem sintética com gradientes e ruído, que comprime como uma foto.
+    """
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    radial = Image.radial_gradient("L").resize((width, height))
+    Image.merge("RGB", (gradient, noise, radial)).save(path, "JPEG", quality=90)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a vazão do pipeline de miniaturas (attachments/thumbnails): gera imagens "
+        "sintéticas e as processa sem pool e com pools de processos de vários tamanhos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=40, help="Quantidade de imagens.")
+        parser.add_argument("--width", type=int, default=3000)
+        parser.add_argument("--height", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            default="1,2,4",
+            help="Tamanhos do pool separados por vírgula (0 processa sem pool).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            workers = [int(value) for value in options["workers"].split(",")]
+        except ValueError:
+            raise CommandError("Informe --workers como números separados por vírgula.")
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.stdout.write(
+                f"Gerando {options['images']} imagens de {options['width']}x{options['height']}..."
+            )
+
+            sources = []
+            for index in range(options["images"]):
+                path = os.path.join(directory, f"{index}.jpg")
+                make_image(path, options["width"], options["height"])
+                sources.append(path)
+
+            baseline = None
+
+            for count in [0] + [count for count in workers if count > 0]:
+                elapsed = self.run(sources, directory, count)
+                baseline = baseline or elapsed
+
+                self.stdout.write(
+                    f"{'sem pool' if not count else f'{count} processos':>12}: "
+                    f"{len(sources) / elapsed:8.1f} imagens/s "
+                    f"({elapsed:.2f}s, {baseline / elapsed:.1f}x)"
+                )
+
+    def run(self, sources, directory, workers):
+        jobs = [
+            (source, os.path.join(directory, f"variants-{workers}", str(index)), FILE_SIZES)
+            for index, source in enumerate(sources)
+        ]
+
+        if not workers:
+            started_at = time.perf_counter()
+            for job in jobs:
+                imaging.render_variants(*job)
+            return time.perf_counter() - started_at
+
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            # A partida dos processos não entra na medição, como no servidor, onde o pool é reutilizado.
+            list(executor.map(int, range(workers)))
+
+            started_at = time.perf_counter()
+            list(executor.map(imaging.render_variants, *zip(*jobs)))
+            return time.perf_counter() - started_at
@@ -0,0 +1,50 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from attachments.models import FileAttachment
+from attachments.thumbnails import (
+    AVATAR_SIZES,
+    FILE_SIZES,
+    IMAGE_CONTENT_TYPES,
+    pipeline,
+    record_avatar,
+    record_file,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as miniaturas das imagens e avatares que ainda não as têm "
+        "(ex.: envios anteriores ao pool ou descartados com a fila cheia)."
+    )
+
+    def handle(self, *args, **options):
+        files = FileAttachment.objects.filter(
+            content_type__in=IMAGE_CONTENT_TYPES, variants={}
+        ).values_list("id", "src")
+
+        users = (
+            User.objects.filter(avatar_variants={})
+            .exclude(avatar="/media/avatars/default.png")
+            .values_list("id", "avatar")
+        )
+
+        jobs = [
+            (src, FILE_SIZES, partial(record_file, attachment_id))
+            for attachment_id, src in files.iterator()
+        ] + [
+            (src, AVATAR_SIZES, partial(record_avatar, user_id, src))
+            for user_id, src in users.iterator()
+        ]
+
+        for job in jobs:
+            # Com a fila cheia, espera o pool esvaziar antes de continuar.
+            while pipeline.submit(*job) is None and pipeline.futures:
+                pipeline.wait()
+
+        pipeline.wait()
+
+        self.stdout.write(self.style.SUCCESS(f"{len(jobs)} imagens processadas."))
+        return 0
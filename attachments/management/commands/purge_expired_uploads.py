@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from attachments.blobs import BlobStorage
+from attachments.uploads import ChunkedUploadService
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga os envios em partes não concluídos, ou concluídos e não anexados a "
+        "nenhuma mensagem, há mais de CHUNKED_UPLOAD_TTL_HOURS horas, e depois os "
+        "arquivos que ficaram sem referências."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Quantidade de envios apagados por vez.",
+        )
+
+    def handle(self, *args, **options):
+        uploads = ChunkedUploadService().purge_expired(options["batch_size"])
+        blobs = BlobStorage().collect_garbage(options["batch_size"])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{uploads} envios e {blobs} arquivos apagados.")
+        )
+        return 0
@@ -0,0 +1,201 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags
+
+from accounts.models import User
+from attachments.models import AudioAttachment, ChunkedUpload, FileAttachment
+from chats.models import ChatMessage
+from chats.services import user_chats
+
+
+# Pasta de MEDIA_ROOT -> anexos que podem apontar para os arquivos dela
+# (attachment_code, model). Os blobs (attachments.blobs) são compartilhados por
+# arquivos, áudios e avatares; os de avatares são públicos, como a pasta avatars.
+PROTECTED_FOLDERS = {
+  "files": [("FILE", FileAttachment)],
+  "audios": [("AUDIO", AudioAttachment)],
+  "blobs": [("FILE", FileAttachment), ("AUDIO", AudioAttachment)],
+}
+PUBLIC_FOLDERS = {"avatars"}
+
+# Um `src` de blob sempre tem o mesmo conteúdo.
+IMMUTABLE_FOLDERS = {"blobs"}
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def is_public(folder, path) -> bool:
+  if folder in PUBLIC_FOLDERS:
+    return True
+
+  return folder == "blobs" and User.objects.filter(avatar=settings.MEDIA_URL + path).exists()
+
+
+def can_access(user_id, folder, path) -> bool:
+  """
+  Indica se o usuário pode baixar o anexo: ele participa do chat ativo de uma mensagem
+  ativa com o anexo, ou é quem fez o envio (antes de a mensagem ser criada).
+  """
+  chats = user_chats(user_id).values("id")
+
+  for attachment_code, model in PROTECTED_FOLDERS[folder]:
+    attachment_ids = model.objects.filter(src=settings.MEDIA_URL + path).values("id")
+
+    if (
+      ChatMessage.objects.filter(
+        attachment_code=attachment_code,
+        attachment_id__in=attachment_ids,
+        chat__in=chats,
+        deleted_at__isnull=True,
+      ).exists()
+      or ChunkedUpload.objects.filter(
+        user_id=user_id,
+        attachment_code=attachment_code,
+        attachment_id__in=attachment_ids,
+      ).exists()
+    ):
+      return True
+
+  return False
+
+
+def cache_control(folder, public) -> str:
+  if folder in IMMUTABLE_FOLDERS:
+    return f"{'public' if public else 'private'}, max-age={IMMUTABLE_MAX_AGE}, immutable"
+
+  return f"{'public' if public else 'private'}, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+
+
+def serve(request, path, absolute_path, cache_control) -> HttpResponse:
+  """
+  Entrega um arquivo de MEDIA_ROOT já autorizado, conforme MEDIA_SERVE_MODE:
+  - "x-accel": o nginx envia o arquivo da location interna MEDIA_ACCEL_PREFIX;
+  - "x-sendfile": o Apache (mod_xsendfile) ou lighttpd envia o arquivo;
+  - "django": o próprio Django envia, com Range, ETag e If-None-Match (desenvolvimento).
+  """
+  mode = settings.MEDIA_SERVE_MODE
+
+  if mode == "x-accel":
+    response = HttpResponse()
+    # Sem Content-Type, o nginx usa o tipo pela extensão do arquivo.
+    del response["Content-Type"]
+    response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+  elif mode == "x-sendfile":
+    response = HttpResponse(content_type=guess_type(absolute_path))
+    response["X-Sendfile"] = os.fsencode(absolute_path).decode("latin-1")
+  else:
+    response = file_response(request, absolute_path)
+
+  response["Cache-Control"] = cache_control
+  return response
+
+
+def guess_type(path) -> str:
+  return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def file_etag(stat) -> str:
+  return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size) -> tuple[int, int] | None:
+  """
+  Converte um cabeçalho Range de um único intervalo em (início, tamanho).
+  Retorna None para cabeçalhos que não são entendidos (a resposta é o arquivo
+  inteiro) e gera ValueError para intervalos fora do arquivo.
+  """
+  match = RANGE.match(header.strip())
+
+  if not match or match.groups() == ("", ""):
+    return None
+
+  first, last = match.groups()
+
+  if not first:
+    length = min(int(last), size)
+    if not length:
+      raise ValueError
+    return size - length, length
+
+  start = int(first)
+  end = min(int(last), size - 1) if last else size - 1
+
+  if start >= size or end < start:
+    raise ValueError
+
+  return start, end - start + 1
+
+
+class RangeFileResponse(StreamingHttpResponse):
+  """
+  Envia `length` bytes do arquivo a partir de `start`.
+  Servidores WSGI com `wsgi.file_wrapper` (gunicorn, uWSGI) enviam `file_to_stream`
+  com os.sendfile, sem copiar o conteúdo para o Python, limitado pelo Content-Length.
+  """
+
+  block_size = 64 * 1024
+
+  def __init__(self, file, start, length, **kwargs):
+    super().__init__(**kwargs)
+    file.seek(start)
+    self.file_to_stream = file
+    self.streaming_content = self.read(file, length)
+    self["Content-Length"] = str(length)
+    self._resource_closers.append(file.close)
+
+  def read(self, file, length):
+    while length > 0:
+      chunk = file.read(min(self.block_size, length))
+      if not chunk:
+        return
+      length -= len(chunk)
+      yield chunk
+
+
+def file_response(request, absolute_path) -> HttpResponse:
+  stat = os.stat(absolute_path)
+  etag = file_etag(stat)
+
+  if_none_match = request.headers.get("If-None-Match")
+  if if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+  start, length, partial = 0, stat.st_size, False
+  range_header = request.headers.get("Range")
+  if_range = request.headers.get("If-Range")
+
+  if range_header and (not if_range or if_range.strip() == etag):
+    try:
+      byte_range = parse_range(range_header, stat.st_size)
+    except ValueError:
+      response = HttpResponse(status=416)
+      response["Content-Range"] = f"bytes */{stat.st_size}"
+      return response
+
+    if byte_range:
+      start, length = byte_range
+      partial = True
+
+  response = RangeFileResponse(
+    open(absolute_path, "rb"),
+    start,
+    length,
+    status=206 if partial else 200,
+    content_type=guess_type(absolute_path),
+  )
+
+  if partial:
+    response["Content-Range"] = f"bytes {start}-{start + length - 1}/{stat.st_size}"
+
+  response["Accept-Ranges"] = "bytes"
+  response["ETag"] = etag
+  response["Last-Modified"] = http_date(stat.st_mtime)
+  return response
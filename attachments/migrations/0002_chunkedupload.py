@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:19
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('attachment_code', models.CharField(choices=[('FILE', 'FILE'), ('AUDIO', 'AUDIO')], max_length=10)),
+                ('name', models.CharField(max_length=90)),
+                ('extension', models.CharField(max_length=15)),
+                ('content_type', models.CharField(max_length=100)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('received_chunks', models.JSONField(default=list)),
+                ('sha256', models.CharField(blank=True, max_length=64, null=True)),
+                ('attachment_id', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'chunked_uploads',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0002_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audioattachment',
+            index=models.Index(fields=['src'], name='audio_attachments_src_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileattachment',
+            index=models.Index(fields=['src'], name='file_attachments_src_idx'),
+        ),
+    ]
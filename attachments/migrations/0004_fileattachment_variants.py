@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0003_attachment_src_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileattachment',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
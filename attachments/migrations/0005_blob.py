@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0004_fileattachment_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('src', models.TextField(unique=True)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'blobs',
+                'indexes': [models.Index(condition=models.Q(('refcount', 0)), fields=['created_at'], name='blobs_unreferenced_idx')],
+            },
+        ),
+    ]
@@ -1,20 +1,94 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 
 
+class Blob(models.Model):
+  """
+  Conteúdo de um arquivo enviado, gravado uma única vez por sha256 em
+  MEDIA_ROOT/blobs/<aa>/<bb>/<sha256>.<extensão> (attachments.blobs).
+  `refcount` conta os anexos e avatares com este `src`; os blobs sem referências
+  são removidos por attachments.blobs.BlobStorage.collect_garbage.
+  """
+  digest = models.CharField(max_length=64, primary_key=True)
+  src = models.TextField(unique=True)
+  size = models.BigIntegerField()
+  refcount = models.PositiveIntegerField(default=0)
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    db_table = 'blobs'
+    indexes = [
+      models.Index(
+        fields=['created_at'],
+        condition=models.Q(refcount=0),
+        name='blobs_unreferenced_idx',
+      ),
+    ]
+
+
 class FileAttachment(models.Model):
   name = models.CharField(max_length=90)
   extension = models.CharField(max_length=15)
   size = models.FloatField()
   src = models.TextField()
   content_type = models.CharField(max_length=45)
+  # Miniaturas WebP das imagens (attachments.thumbnails): {tamanho: {src, width, height}}.
+  variants = models.JSONField(default=dict, blank=True)
   
   
   class Meta:    
     db_table = 'file_attachments'
+    # Autorização do download (attachments.media.can_access).
+    indexes = [models.Index(fields=['src'], name='file_attachments_src_idx')]
     
 
 class AudioAttachment(models.Model):
   src = models.TextField()
   
   class Meta:
-    db_table = 'audio_attachments'
\ No newline at end of file
+    db_table = 'audio_attachments'
+    indexes = [models.Index(fields=['src'], name='audio_attachments_src_idx')]
+
+class ChunkedUpload(models.Model):
+  """
+  Envio de anexo em partes: criado no início do envio, recebe as partes
+  em qualquer ordem (podendo retomar após uma queda de conexão) e, ao ser
+  concluído, gera o FileAttachment ou AudioAttachment correspondente.
+  """
+  id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+  user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='uploads', on_delete=models.CASCADE)
+  attachment_code = models.CharField(
+    choices=[
+      ("FILE", "FILE"), ('AUDIO', 'AUDIO'),
+      ],
+    max_length=10
+  )
+  name = models.CharField(max_length=90)
+  extension = models.CharField(max_length=15)
+  content_type = models.CharField(max_length=100)
+  size = models.BigIntegerField()
+  chunk_size = models.IntegerField()
+  received_chunks = models.JSONField(default=list)
+  sha256 = models.CharField(max_length=64, null=True, blank=True)
+  attachment_id = models.IntegerField(null=True, blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  completed_at = models.DateTimeField(null=True, blank=True)
+
+  class Meta:
+    db_table = 'chunked_uploads'
+
+  @property
+  def total_chunks(self) -> int:
+    return max(1, -(-self.size // self.chunk_size))
+
+  def chunk_length(self, index) -> int:
+    if index == self.total_chunks - 1:
+      return self.size - index * self.chunk_size
+    return self.chunk_size
+
+  @property
+  def path(self) -> str:
+    return os.path.join(settings.CHUNKED_UPLOAD_ROOT, f"{self.id}.part")
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from  attachments.models import FileAttachment, AudioAttachment
+from  attachments.models import FileAttachment, AudioAttachment, ChunkedUpload
+from attachments.thumbnails import thumbnail_urls
 from attachments.utils.formatter import Formatter
 from django.conf import settings
 
@@ -14,6 +15,7 @@ class FileAttachmentSerializer(serializers.ModelSerializer):
     data = super().to_representation(instance)
     data['size'] = Formatter.format_bytes(instance.size)
     data['src'] = f"{settings.CURRENT_URL}{instance.src}"
+    data['thumbnails'] = thumbnail_urls(data.pop('variants'))
     
     return data
   
@@ -27,4 +29,24 @@ class AudioAttachmentSerializer(serializers.ModelSerializer):
     data = super().to_representation(instance)
     data['src'] = f"{settings.CURRENT_URL}{instance.src}"
     
-    return data
\ No newline at end of file
+    return data
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+  total_chunks = serializers.IntegerField(read_only=True)
+
+  class Meta:
+    model = ChunkedUpload
+    fields = (
+      "id",
+      "attachment_code",
+      "name",
+      "extension",
+      "content_type",
+      "size",
+      "chunk_size",
+      "total_chunks",
+      "received_chunks",
+      "attachment_id",
+      "created_at",
+      "completed_at",
+    )
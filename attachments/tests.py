@@ -1,3 +1,534 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+from PIL import Image
+from rest_framework.test import APIClient
+
+from accounts.authentication import UserRefreshToken
+from accounts.models import User
+from attachments import thumbnails
+from attachments.blobs import BlobStorage
+from attachments.models import Blob, ChunkedUpload, FileAttachment
+from attachments.uploads import ChunkedUploadService
+from chats.models import Chat, ChatMessage
+
+
+class ChunkedUploadTestCase(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings_override = override_settings(
+            MEDIA_ROOT=Path(directory.name) / "media",
+            CHUNKED_UPLOAD_ROOT=Path(directory.name) / "uploads",
+            CHUNKED_UPLOAD_CHUNK_SIZE=4,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = b"conteudo do arquivo"
+
+    def start(self, **data):
+        payload = {
+            "name": "relatorio.txt",
+            "content_type": "text/plain",
+            "size": len(self.content),
+            "sha256": hashlib.sha256(self.content).hexdigest(),
+        }
+        payload.update(data)
+        return self.client.post("/api/v1/attachments/uploads", payload)
+
+    def put_chunk(self, upload_id, index, data, **headers):
+        return self.client.put(
+            f"/api/v1/attachments/uploads/{upload_id}/chunks/{index}",
+            data=data,
+            content_type="application/octet-stream",
+            **headers,
+        )
+
+    def test_upload_in_chunks_out_of_order_and_resume(self):
+        upload = self.start().data["result"]
+        self.assertEqual(upload["total_chunks"], 5)
+
+        chunks = [self.content[index:index + 4] for index in range(0, len(self.content), 4)]
+
+        for index in (4, 0, 2):
+            self.assertEqual(self.put_chunk(upload["id"], index, chunks[index]).status_code, 200)
+
+        response = self.client.post(f"/api/v1/attachments/uploads/{upload['id']}/complete")
+        self.assertEqual(response.status_code, 400)
+
+        # Parte corrompida é rejeitada e pode ser reenviada.
+        response = self.put_chunk(
+            upload["id"], 1, b"xxxx",
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(chunks[1]).hexdigest(),
+        )
+        self.assertEqual(response.status_code, 400)
+
+        status = self.client.get(f"/api/v1/attachments/uploads/{upload['id']}").data["result"]
+        self.assertEqual(status["received_chunks"], [0, 2, 4])
+
+        for index in (1, 3):
+            self.put_chunk(
+                upload["id"], index, chunks[index],
+                HTTP_X_CHUNK_SHA256=hashlib.sha256(chunks[index]).hexdigest(),
+            )
+
+        response = self.client.post(f"/api/v1/attachments/uploads/{upload['id']}/complete")
+        self.assertEqual(response.status_code, 200)
+
+        attachment = FileAttachment.objects.get(id=response.data["result"]["upload"]["attachment_id"])
+        self.assertEqual(attachment.size, len(self.content))
+
+        path = os.path.join(settings.MEDIA_ROOT, attachment.src.replace(settings.MEDIA_URL, ""))
+
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), self.content)
+
+        to_user = User.objects.create(name="Contato", email="contato@email.com")
+        chat = Chat.objects.create(from_user=self.user, to_user=to_user)
+
+        response = self.client.post(
+            f"/api/v1/chats/messages/{chat.id}", {"upload_id": upload["id"]}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["result"]["attachment"]["file"]["id"], attachment.id)
+        self.assertEqual(ChatMessage.objects.get().attachment_code, "FILE")
+
+    def test_chunk_with_wrong_size_is_rejected(self):
+        upload = self.start().data["result"]
+
+        self.assertEqual(self.put_chunk(upload["id"], 0, b"abc").status_code, 400)
+        self.assertEqual(self.put_chunk(upload["id"], 9, b"abcd").status_code, 400)
+
+    def test_bad_resend_does_not_overwrite_an_accepted_chunk(self):
+        upload = self.start().data["result"]
+        chunks = [self.content[index:index + 4] for index in range(0, len(self.content), 4)]
+
+        for index, chunk in enumerate(chunks):
+            self.assertEqual(self.put_chunk(upload["id"], index, chunk).status_code, 200)
+
+        response = self.put_chunk(
+            upload["id"], 1, b"xxxx",
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(chunks[1]).hexdigest(),
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(f"/api/v1/attachments/uploads/{upload['id']}/complete")
+        self.assertEqual(response.status_code, 200)
+
+        attachment = FileAttachment.objects.get(id=response.data["result"]["upload"]["attachment_id"])
+        path = os.path.join(settings.MEDIA_ROOT, attachment.src.replace(settings.MEDIA_URL, ""))
+
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_start_validates_type_and_size(self):
+        self.assertEqual(self.start(name="virus.exe").status_code, 400)
+
+        with override_settings(CHUNKED_UPLOAD_MAX_SIZE=10):
+            self.assertEqual(self.start().status_code, 400)
+
+    @override_settings(CHUNKED_UPLOAD_MAX_OPEN=2)
+    def test_open_uploads_per_user_are_limited(self):
+        self.assertEqual(self.start().status_code, 201)
+        first = self.start().data["result"]
+
+        self.assertEqual(self.start().status_code, 400)
+
+        ChunkedUpload.objects.filter(id=first["id"]).update(completed_at=now())
+        self.assertEqual(self.start().status_code, 201)
+
+    def test_expired_uploads_are_purged_with_their_files(self):
+        expired = self.start().data["result"]
+        current = self.start().data["result"]
+
+        ChunkedUpload.objects.filter(id=expired["id"]).update(
+            created_at=now() - timedelta(hours=settings.CHUNKED_UPLOAD_TTL_HOURS + 1)
+        )
+        expired_path = ChunkedUpload.objects.get(id=expired["id"]).path
+        self.assertTrue(os.path.exists(expired_path))
+
+        call_command("purge_expired_uploads", stdout=io.StringIO())
+
+        self.assertFalse(ChunkedUpload.objects.filter(id=expired["id"]).exists())
+        self.assertFalse(os.path.exists(expired_path))
+        self.assertTrue(os.path.exists(ChunkedUpload.objects.get(id=current["id"]).path))
+
+    def upload(self):
+        upload = self.start().data["result"]
+
+        for index in range(0, len(self.content), 4):
+            self.put_chunk(upload["id"], index // 4, self.content[index:index + 4])
+
+        return ChunkedUpload.objects.get(id=upload["id"])
+
+    def test_unsent_completed_uploads_expire_and_release_their_blob(self):
+        sent = self.upload()
+        self.client.post(f"/api/v1/attachments/uploads/{sent.id}/complete")
+        unsent = self.upload()
+        self.client.post(f"/api/v1/attachments/uploads/{unsent.id}/complete")
+
+        to_user = User.objects.create(name="Contato", email="contato@email.com")
+        chat = Chat.objects.create(from_user=self.user, to_user=to_user)
+        self.client.post(f"/api/v1/chats/messages/{chat.id}", {"upload_id": str(sent.id)})
+        sent.refresh_from_db()
+        unsent.refresh_from_db()
+
+        self.assertEqual(Blob.objects.get().refcount, 2)
+
+        expired = now() - timedelta(hours=settings.CHUNKED_UPLOAD_TTL_HOURS + 1)
+        ChunkedUpload.objects.update(completed_at=expired)
+
+        call_command("purge_expired_uploads", stdout=io.StringIO())
+
+        self.assertEqual(list(ChunkedUpload.objects.values_list("id", flat=True)), [sent.id])
+        self.assertFalse(FileAttachment.objects.filter(id=unsent.attachment_id).exists())
+        self.assertTrue(FileAttachment.objects.filter(id=sent.attachment_id).exists())
+        self.assertEqual(Blob.objects.get().refcount, 1)
+
+    def test_blob_placed_by_rolled_back_completion_is_not_collected_as_old(self):
+        upload = self.upload()
+
+        old = time.time() - 2 * 60 * 60
+        os.utime(upload.path, (old, old))
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            ChunkedUploadService().complete(upload)
+            raise RuntimeError()
+
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(BlobStorage().collect_orphan_files(), 0)
+
+
+class MediaServingTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings_override = override_settings(MEDIA_ROOT=Path(directory.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.content = b"0123456789"
+        for folder in ("files", "avatars"):
+            os.makedirs(Path(directory.name) / folder)
+            with open(Path(directory.name) / folder / "a.pdf", "wb") as file:
+                file.write(self.content)
+
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.other_user = User.objects.create(name="Outro", email="outro@email.com")
+        chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+
+        file = FileAttachment.objects.create(
+            name="a", extension="pdf", size=10, src="/media/files/a.pdf",
+            content_type="application/pdf",
+        )
+        ChatMessage.objects.create(
+            chat=chat, from_user=self.user, attachment_code="FILE", attachment_id=file.id
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.to_user)
+        self.url = "/media/files/a.pdf"
+
+    def test_participant_downloads_with_range_and_etag(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertTrue(response["Cache-Control"].startswith("private"))
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_access_is_limited_to_chat_participants(self):
+        self.client.force_authenticate(self.other_user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        response = self.client.get("/media/avatars/a.pdf")
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        token = UserRefreshToken.for_user(self.user).access_token
+        response = self.client.get(self.url, {"token": str(token)})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_attachments_of_deleted_chats_are_not_served(self):
+        Chat.objects.update(deleted_at=now())
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel")
+    def test_transfer_is_handed_to_the_proxy(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/files/a.pdf")
+        self.assertEqual(response.content, b"")
+
+        with override_settings(MEDIA_SERVE_MODE="x-sendfile"):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Sendfile"], os.path.join(settings.MEDIA_ROOT, "files", "a.pdf"))
+
+
+@override_settings(THUMBNAIL_WORKERS=0, SOCKETIO_BACKGROUND_EMITS=False)
+class ThumbnailPipelineTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings_override = override_settings(MEDIA_ROOT=Path(directory.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.other_user = User.objects.create(name="Outro", email="outro@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def image(self, name, size=(2000, 1000), color="teal"):
+        content = io.BytesIO()
+        Image.new("RGB", size, color).save(content, "PNG")
+        return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+    def test_image_attachment_gets_webp_thumbnails_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                f"/api/v1/chats/messages/{self.chat.id}",
+                {"file": self.image("foto.png")},
+                format="multipart",
+            )
+
+            self.assertEqual(response.status_code, 201)
+            attachment = FileAttachment.objects.get()
+            # Nada é redimensionado durante a requisição.
+            self.assertEqual(attachment.variants, {})
+
+        self.assertTrue(callbacks)
+        attachment.refresh_from_db()
+        self.assertEqual(set(attachment.variants), {"small", "medium", "large"})
+        self.assertEqual(
+            (attachment.variants["small"]["width"], attachment.variants["small"]["height"]), (160, 80)
+        )
+
+        response = self.client.get(f"/api/v1/chats/messages/{self.chat.id}")
+        thumbnails = response.data["results"][-1]["attachment"]["file"]["thumbnails"]
+        self.assertEqual(
+            thumbnails["medium"], f"{settings.CURRENT_URL}{attachment.variants['medium']['src']}"
+        )
+
+        url = attachment.variants["small"]["src"]
+        self.client.force_authenticate(self.to_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        response.close()
+
+        self.client.force_authenticate(self.other_user)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_other_files_are_not_processed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                f"/api/v1/chats/messages/{self.chat.id}",
+                {"file": SimpleUploadedFile("a.txt", b"texto", content_type="text/plain")},
+                format="multipart",
+            )
+
+        self.assertEqual(FileAttachment.objects.get().variants, {})
+        self.assertFalse(os.path.exists(Path(settings.MEDIA_ROOT) / thumbnails.THUMBNAILS_FOLDER))
+
+    def test_new_avatar_replaces_previous_thumbnails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch("/api/v1/accounts/user", {"avatar": self.image("a.png")}, format="multipart")
+
+        first = User.objects.get(id=self.user.id)
+        self.assertEqual(first.avatar_variants["small"]["width"], 64)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                "/api/v1/accounts/user",
+                {"avatar": self.image("b.png", color="orange")},
+                format="multipart",
+            )
+            self.assertEqual(response.data["result"]["avatar_thumbnails"], {})
+
+        user = User.objects.get(id=self.user.id)
+        self.assertNotEqual(user.avatar, first.avatar)
+        self.assertEqual(Blob.objects.get(src=first.avatar).refcount, 0)
+
+        # O avatar anterior e suas miniaturas são apagados pela coleta de lixo.
+        self.assertEqual(BlobStorage().collect_garbage(), 1)
+        self.assertFalse(os.path.exists(thumbnails.media_path(thumbnails.variants_path(first.avatar))))
+        self.assertFalse(os.path.exists(thumbnails.media_path(first.avatar[len(settings.MEDIA_URL):])))
+
+        self.client.force_authenticate(user)
+        response = self.client.get("/api/v1/accounts/user")
+        self.assertEqual(
+            response.data["result"]["avatar_thumbnails"]["medium"],
+            f"{settings.CURRENT_URL}{user.avatar_variants['medium']['src']}",
+        )
+
+        self.client.force_authenticate(None)
+        response = self.client.get(user.avatar_variants["small"]["src"])
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_pool_renders_in_worker_processes(self):
+        self.addCleanup(thumbnails.pipeline.shutdown)
+
+        path = Path(settings.MEDIA_ROOT) / "files" / "foto.png"
+        os.makedirs(path.parent)
+        with open(path, "wb") as file:
+            file.write(self.image("foto.png").read())
+
+        recorded = []
+        future = thumbnails.pipeline.submit("/media/files/foto.png", {"small": 100}, recorded.append)
+        thumbnails.pipeline.wait()
+
+        self.assertIsNotNone(future)
+        self.assertEqual(
+            recorded,
+            [{"small": {"src": "/media/thumbnails/files/foto.png/small.webp", "width": 100, "height": 50}}],
+        )
+
+
+@override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+class BlobStorageTestCase(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        settings_override = override_settings(MEDIA_ROOT=Path(directory.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.chats = [
+            Chat.objects.create(
+                from_user=self.user,
+                to_user=User.objects.create(name=f"Contato {index}", email=f"contato{index}@email.com"),
+            )
+            for index in range(2)
+        ]
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, chat, content=b"%PDF-1.4 relatorio"):
+        response = self.client.post(
+            f"/api/v1/chats/messages/{chat.id}",
+            {"file": SimpleUploadedFile("relatorio.pdf", content, content_type="application/pdf")},
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201)
+        return ChatMessage.objects.get(id=response.data["result"]["id"])
+
+    def test_same_file_sent_to_many_chats_is_stored_once(self):
+        messages = [self.send(chat) for chat in self.chats]
+
+        sources = {FileAttachment.objects.get(id=message.attachment_id).src for message in messages}
+        self.assertEqual(len(sources), 1)
+
+        blob = Blob.objects.get()
+        digest = hashlib.sha256(b"%PDF-1.4 relatorio").hexdigest()
+        self.assertEqual(blob.digest, digest)
+        self.assertEqual(blob.src, f"/media/blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf")
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(
+            [name for _, _, names in os.walk(settings.MEDIA_ROOT) for name in names], [f"{digest}.pdf"]
+        )
+
+        self.client.force_authenticate(self.chats[1].to_user)
+        response = self.client.get(blob.src)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private, max-age=31536000, immutable")
+        response.close()
+
+    def test_garbage_collection_removes_files_of_rolled_back_blobs(self):
+        kept = self.send(self.chats[0])
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            BlobStorage().save(SimpleUploadedFile("desfeito.pdf", b"%PDF-1.4 desfeito"), "pdf")
+            raise RuntimeError()
+
+        digest = hashlib.sha256(b"%PDF-1.4 desfeito").hexdigest()
+        orphan = Path(settings.MEDIA_ROOT) / "blobs" / digest[:2] / digest[2:4] / f"{digest}.pdf"
+        self.assertTrue(orphan.exists())
+        self.assertFalse(Blob.objects.filter(digest=digest).exists())
+
+        # Arquivos recentes podem ser de uma transação ainda em andamento.
+        self.assertEqual(BlobStorage().collect_garbage(), 0)
+        self.assertTrue(orphan.exists())
+
+        old = time.time() - 2 * 60 * 60
+        for path in Path(settings.MEDIA_ROOT).rglob("*.pdf"):
+            os.utime(path, (old, old))
+
+        self.assertEqual(BlobStorage().collect_garbage(), 1)
+        self.assertFalse(orphan.exists())
+
+        src = FileAttachment.objects.get(id=kept.attachment_id).src
+        self.assertTrue((Path(settings.MEDIA_ROOT) / src[len(settings.MEDIA_URL):]).exists())
+
+    def test_purge_collects_blobs_without_references(self):
+        messages = [self.send(chat) for chat in self.chats]
+        blob = Blob.objects.get()
+        path = Path(settings.MEDIA_ROOT) / blob.src[len(settings.MEDIA_URL):]
+
+        old = now() - timedelta(days=31)
+        ChatMessage.objects.filter(id=messages[0].id).update(deleted_at=old)
+        ChatMessage.objects.filter(id=messages[1].id).update(deleted_at=now())
+
+        call_command("purge_deleted_messages", "--days", "30", stdout=io.StringIO())
+
+        self.assertFalse(ChatMessage.objects.filter(id=messages[0].id).exists())
+        self.assertFalse(FileAttachment.objects.filter(id=messages[0].attachment_id).exists())
+        self.assertEqual(Blob.objects.get().refcount, 1)
+        self.assertTrue(path.exists())
+
+        ChatMessage.objects.filter(id=messages[1].id).update(deleted_at=old)
+        call_command("purge_deleted_messages", "--days", "30", stdout=io.StringIO())
+
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(path.exists())
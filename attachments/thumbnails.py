@@ -0,0 +1,222 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from accounts.authentication import user_cache
+from accounts.models import User
+from attachments import imaging
+from attachments.models import FileAttachment
+from chats.models import ChatMessage
+
+
+logger = logging.getLogger("attachments.thumbnails")
+
+# As miniaturas de MEDIA_ROOT/<pasta>/<arquivo> ficam em
+# MEDIA_ROOT/thumbnails/<pasta>/<arquivo>/<tamanho>.webp, com o mesmo acesso do original.
+THUMBNAILS_FOLDER = "thumbnails"
+
+IMAGE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif"}
+
+# Nome do tamanho -> maior lado em pixels.
+FILE_SIZES = {"small": 160, "medium": 480, "large": 1280}
+AVATAR_SIZES = {"small": 64, "medium": 256}
+
+
+def variants_path(src) -> str:
+  """
+  Caminho, relativo a MEDIA_URL, da pasta com as miniaturas do arquivo `src`.
+  """
+  return f"{THUMBNAILS_FOLDER}/{src[len(settings.MEDIA_URL):]}"
+
+
+def source_path(path) -> str | None:
+  """
+  Caminho do arquivo original de uma miniatura (relativo a MEDIA_ROOT), ou None.
+  """
+  parts = path.split("/")
+
+  if len(parts) < 4 or parts[0] != THUMBNAILS_FOLDER:
+    return None
+
+  return "/".join(parts[1:-1])
+
+
+def media_path(path) -> str:
+  return os.path.join(settings.MEDIA_ROOT, unquote(path))
+
+
+def thumbnail_urls(variants) -> dict[str, str]:
+  """
+  URL de cada tamanho, para os serializers.
+  """
+  return {name: f"{settings.CURRENT_URL}{variant['src']}" for name, variant in (variants or {}).items()}
+
+
+def delete_variants(src) -> None:
+  shutil.rmtree(media_path(variants_path(src)), ignore_errors=True)
+
+
+class ThumbnailPipeline:
+  """
+  Gera as miniaturas fora do caminho da requisição, em um pool de até
+  THUMBNAIL_WORKERS processos: o redimensionamento usa CPU e, em threads, disputaria
+  o GIL com as requisições (e bloquearia o hub do eventlet).
+
+  No máximo THUMBNAIL_QUEUE_SIZE imagens aguardam o pool; acima disso o pedido é
+  descartado e o anexo fica sem miniaturas (os clientes usam o original) até o
+  comando `generate_thumbnails`. Com THUMBNAIL_WORKERS=0 as miniaturas são geradas
+  na própria thread, sem pool (desenvolvimento e testes).
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.idle = threading.Condition(self.lock)
+    self.executor = None
+    self.futures = set()
+
+  def submit(self, src, sizes, record):
+    """
+    Agenda as miniaturas do arquivo `src`; ao terminar, `record(variants)` grava o
+    resultado. Retorna o Future, ou None se a geração foi feita na hora ou descartada.
+    """
+    args = (media_path(src[len(settings.MEDIA_URL):]), media_path(variants_path(src)), sizes)
+
+    if settings.THUMBNAIL_WORKERS <= 0:
+      try:
+        record(variants_for(src, imaging.render_variants(*args)))
+      except Exception:
+        logger.exception("Erro ao gerar as miniaturas de %s.", src)
+      return None
+
+    with self.lock:
+      if len(self.futures) >= settings.THUMBNAIL_QUEUE_SIZE:
+        logger.warning("Fila de miniaturas cheia; %s ficou sem miniaturas.", src)
+        return None
+
+      if self.executor is None:
+        # spawn: os processos não herdam o estado do servidor (eventlet, conexões, threads).
+        self.executor = ProcessPoolExecutor(
+          max_workers=settings.THUMBNAIL_WORKERS,
+          mp_context=multiprocessing.get_context("spawn"),
+        )
+
+      future = self.executor.submit(imaging.render_variants, *args)
+      self.futures.add(future)
+
+    future.add_done_callback(partial(self.done, src=src, record=record, thread=threading.current_thread()))
+    return future
+
+  def done(self, future, src, record, thread) -> None:
+    try:
+      record(variants_for(src, future.result()))
+    except Exception:
+      logger.exception("Erro ao gerar as miniaturas de %s.", src)
+    finally:
+      # O callback roda na thread de gerenciamento do pool, com conexão própria.
+      if threading.current_thread() is not thread:
+        connection.close()
+
+      with self.lock:
+        self.futures.discard(future)
+        self.idle.notify_all()
+
+  def wait(self) -> None:
+    """
+    Espera as miniaturas agendadas serem geradas e gravadas.
+    """
+    with self.lock:
+      self.idle.wait_for(lambda: not self.futures)
+
+  def shutdown(self) -> None:
+    self.wait()
+
+    with self.lock:
+      executor, self.executor = self.executor, None
+
+    if executor is not None:
+      executor.shutdown()
+
+
+def variants_for(src, rendered) -> dict:
+  base = f"{settings.MEDIA_URL}{variants_path(src)}/"
+
+  return {
+    name: {"src": base + variant["file"], "width": variant["width"], "height": variant["height"]}
+    for name, variant in rendered.items()
+  }
+
+
+pipeline = ThumbnailPipeline()
+
+
+def record_file(attachment_id, variants) -> None:
+  FileAttachment.objects.filter(id=attachment_id).update(variants=variants)
+  # Nova versão das mensagens com o anexo: sincronização (since), cache e ETags.
+  ChatMessage.objects.filter(attachment_code="FILE", attachment_id=attachment_id).update(
+    updated_at=now()
+  )
+
+
+def record_avatar(user_id, src, variants) -> None:
+  # Se o avatar foi trocado enquanto as miniaturas eram geradas, o resultado é descartado.
+  if User.objects.filter(id=user_id, avatar=src).update(avatar_variants=variants):
+    user_cache.invalidate(user_id)
+
+
+def generate_file_thumbnails(attachment) -> None:
+  """
+  Agenda, depois do commit, as miniaturas de um anexo de imagem.
+  Se outro anexo do mesmo blob já tem miniaturas, elas são reaproveitadas.
+  """
+  if attachment.content_type not in IMAGE_CONTENT_TYPES:
+    return
+
+  variants = (
+    FileAttachment.objects.filter(src=attachment.src)
+    .exclude(variants={})
+    .values_list("variants", flat=True)
+    .first()
+  )
+
+  if variants:
+    attachment.variants = variants
+    FileAttachment.objects.filter(id=attachment.id).update(variants=variants)
+    return
+
+  transaction.on_commit(
+    lambda: pipeline.submit(attachment.src, FILE_SIZES, partial(record_file, attachment.id))
+  )
+
+
+def generate_avatar_thumbnails(user) -> None:
+  """
+  Agenda, depois do commit, as miniaturas do avatar do usuário.
+  Se outro usuário tem o mesmo avatar com miniaturas, elas são reaproveitadas.
+  """
+  src = user.avatar
+
+  variants = (
+    User.objects.filter(avatar=src)
+    .exclude(avatar_variants={})
+    .values_list("avatar_variants", flat=True)
+    .first()
+  )
+
+  if variants:
+    user.avatar_variants = variants
+    User.objects.filter(id=user.id).update(avatar_variants=variants)
+    user_cache.invalidate(user.id)
+    return
+
+  transaction.on_commit(
+    lambda: pipeline.submit(src, AVATAR_SIZES, partial(record_avatar, user.id, src))
+  )
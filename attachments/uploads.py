@@ -0,0 +1,282 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils.timezone import now
+
+from attachments.blobs import BlobStorage
+from attachments.models import AudioAttachment, ChunkedUpload, FileAttachment
+from attachments.thumbnails import generate_file_thumbnails
+from attachments.validators import validate_audio, validate_file
+from chats.models import ChatMessage
+from core.exceptions import ValidationError
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+class ChunkedUploadService:
+  """
+  Regras do envio de anexos em partes.
+  Cada parte é lida da requisição em blocos de BUFFER_SIZE para um arquivo temporário,
+  conferida e só então copiada para a sua posição no arquivo do envio, então a memória
+  usada não depende do tamanho do arquivo e uma parte inválida nunca sobrescreve uma
+  parte já aceita.
+  """
+
+  def start(self, user, name: str, content_type: str, size, attachment_code="FILE", sha256=None) -> ChunkedUpload:
+    if not name or not content_type or size in (None, ""):
+      raise ValidationError("Nome, tipo e tamanho do arquivo são obrigatórios.")
+
+    try:
+      size = int(size)
+    except (TypeError, ValueError):
+      raise ValidationError("Tamanho do arquivo inválido.")
+
+    if size < 1:
+      raise ValidationError("Tamanho do arquivo inválido.")
+
+    extension = name.split(".")[-1]
+
+    open_uploads = ChunkedUpload.objects.filter(
+      user=user, completed_at__isnull=True, created_at__gte=self.expires_before()
+    )
+
+    if open_uploads.count() >= settings.CHUNKED_UPLOAD_MAX_OPEN:
+      raise ValidationError("Muitos envios em andamento. Conclua ou aguarde os anteriores.")
+
+    if attachment_code == "FILE":
+      validate_file(size, extension, content_type, settings.CHUNKED_UPLOAD_MAX_SIZE)
+    elif attachment_code == "AUDIO":
+      validate_audio(size, content_type, settings.CHUNKED_UPLOAD_MAX_SIZE)
+    else:
+      raise ValidationError("Tipo de anexo inválido.")
+
+    upload = ChunkedUpload.objects.create(
+      user=user,
+      attachment_code=attachment_code,
+      name=name.split(".")[0][:90],
+      extension=extension[:15],
+      content_type=content_type,
+      size=size,
+      chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+      sha256=sha256.lower() if sha256 else None,
+    )
+
+    os.makedirs(settings.CHUNKED_UPLOAD_ROOT, exist_ok=True)
+    with open(upload.path, "wb") as destination:
+      destination.truncate(size)
+
+    return upload
+
+  def write_chunk(self, upload: ChunkedUpload, index: int, stream, content_length=None, sha256=None) -> ChunkedUpload:
+    """
+    Grava a parte `index` lendo `stream` em blocos.
+    Se `sha256` for informado, a parte só é registrada quando o checksum confere;
+    uma parte rejeitada pode ser reenviada.
+    """
+    if upload.completed_at:
+      raise ValidationError("Envio já concluído.")
+
+    if index < 0 or index >= upload.total_chunks:
+      raise ValidationError("Parte inválida.")
+
+    expected = upload.chunk_length(index)
+
+    if content_length not in (None, "") and str(content_length) != str(expected):
+      raise ValidationError(f"A parte {index} deve ter {expected} bytes.")
+
+    digest = hashlib.sha256()
+    written = 0
+
+    with tempfile.TemporaryFile(dir=settings.CHUNKED_UPLOAD_ROOT) as chunk:
+      while written < expected:
+        data = stream.read(min(BUFFER_SIZE, expected - written))
+        if not data:
+          break
+        digest.update(data)
+        chunk.write(data)
+        written += len(data)
+
+      if written != expected or stream.read(1):
+        raise ValidationError(f"A parte {index} deve ter {expected} bytes.")
+
+      if sha256 and sha256.lower() != digest.hexdigest():
+        raise ValidationError("Checksum da parte inválido.")
+
+      chunk.seek(0)
+
+      with open(upload.path, "r+b") as destination:
+        destination.seek(index * upload.chunk_size)
+        shutil.copyfileobj(chunk, destination, BUFFER_SIZE)
+
+    with transaction.atomic():
+      upload = ChunkedUpload.objects.select_for_update().get(id=upload.id)
+
+      if index not in upload.received_chunks:
+        upload.received_chunks = sorted(upload.received_chunks + [index])
+        upload.save(update_fields=["received_chunks"])
+
+    return upload
+
+  def complete(self, upload: ChunkedUpload) -> ChunkedUpload:
+    """
+    Confere se todas as partes chegaram e o checksum do arquivo, move o arquivo
+    para a pasta de mídia e cria o anexo. Repetir a chamada retorna o mesmo envio.
+    """
+    with transaction.atomic():
+      upload = ChunkedUpload.objects.select_for_update().get(id=upload.id)
+
+      if upload.completed_at:
+        return upload
+
+      missing = sorted(set(range(upload.total_chunks)) - set(upload.received_chunks))
+
+      if missing:
+        raise ValidationError(f"Partes pendentes: {missing}.")
+
+      # O mesmo hash confere o checksum informado e endereça o blob.
+      digest = self.checksum(upload.path)
+
+      if upload.sha256 and upload.sha256 != digest:
+        raise ValidationError("Checksum do arquivo inválido.")
+
+      extension = upload.extension if upload.attachment_code == "FILE" else "mp3"
+      blob = BlobStorage().save_path(upload.path, extension, digest)
+
+      if upload.attachment_code == "FILE":
+        attachment = FileAttachment.objects.create(
+          name=upload.name,
+          extension=upload.extension,
+          size=upload.size,
+          src=blob.src,
+          content_type=upload.content_type,
+        )
+        generate_file_thumbnails(attachment)
+      else:
+        attachment = AudioAttachment.objects.create(src=blob.src)
+
+      upload.attachment_id = attachment.id
+      upload.completed_at = now()
+      upload.save(update_fields=["attachment_id", "completed_at"])
+
+    return upload
+
+  def get_completed(self, upload_id, user_id) -> ChunkedUpload:
+    """
+    Busca um envio concluído pelo usuário, para ser anexado a uma mensagem.
+    Lança ValidationError se o envio não existir ou não estiver concluído.
+    """
+    try:
+      upload = ChunkedUpload.objects.filter(
+        id=upload_id, user_id=user_id, completed_at__isnull=False
+      ).first()
+    except DjangoValidationError:
+      upload = None
+
+    if not upload:
+      raise ValidationError("Envio não encontrado ou não concluído.")
+
+    return upload
+
+  def expires_before(self):
+    """
+    Envios iniciados (ou concluídos) antes desta data e ainda não usados estão vencidos.
+    """
+    return now() - timedelta(hours=settings.CHUNKED_UPLOAD_TTL_HOURS)
+
+  def purge_expired(self, batch_size=1000) -> int:
+    """
+    Apaga os envios vencidos: os não concluídos, com seus arquivos temporários, e os
+    concluídos que não foram anexados a nenhuma mensagem, com seus anexos, devolvendo
+    as referências dos blobs (apagados depois por BlobStorage.collect_garbage).
+    Retorna a quantidade de envios apagados.
+    """
+    return self.purge_incomplete(batch_size) + self.purge_unsent(batch_size)
+
+  def purge_incomplete(self, batch_size) -> int:
+    total = 0
+
+    while True:
+      uploads = list(
+        ChunkedUpload.objects.filter(
+          completed_at__isnull=True, created_at__lt=self.expires_before()
+        ).order_by("created_at")[:batch_size]
+      )
+
+      if not uploads:
+        return total
+
+      ChunkedUpload.objects.filter(id__in=[upload.id for upload in uploads]).delete()
+
+      for upload in uploads:
+        if os.path.exists(upload.path):
+          os.remove(upload.path)
+
+      total += len(uploads)
+
+  def purge_unsent(self, batch_size) -> int:
+    total = 0
+    last_id = None
+
+    while True:
+      with transaction.atomic():
+        uploads = ChunkedUpload.objects.filter(completed_at__lt=self.expires_before())
+
+        if last_id is not None:
+          uploads = uploads.filter(id__gt=last_id)
+
+        uploads = list(
+          uploads.select_for_update(skip_locked=True)
+          .order_by("id")
+          .values("id", "attachment_code", "attachment_id")[:batch_size]
+        )
+
+        if not uploads:
+          return total
+
+        last_id = uploads[-1]["id"]
+        released = []
+
+        for attachment_code, model in (("FILE", FileAttachment), ("AUDIO", AudioAttachment)):
+          ids = {
+            upload["attachment_id"]
+            for upload in uploads
+            if upload["attachment_code"] == attachment_code
+          }
+
+          unsent = list(
+            model.objects.filter(id__in=ids)
+            .exclude(
+              id__in=ChatMessage.objects.filter(
+                attachment_code=attachment_code, attachment_id__in=ids
+              ).values("attachment_id")
+            )
+            .values_list("id", "src")
+          )
+
+          if not unsent:
+            continue
+
+          unsent_ids = [attachment_id for attachment_id, _ in unsent]
+          total += ChunkedUpload.objects.filter(
+            attachment_code=attachment_code, attachment_id__in=unsent_ids
+          ).delete()[0]
+          model.objects.filter(id__in=unsent_ids).delete()
+          released += [src for _, src in unsent]
+
+        BlobStorage().release(released)
+
+  def checksum(self, path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as source:
+      for data in iter(lambda: source.read(BUFFER_SIZE), b""):
+        digest.update(data)
+
+    return digest.hexdigest()
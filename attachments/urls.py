@@ -0,0 +1,14 @@
+from django.urls import path
+from .views import (
+  UploadChunkView,
+  UploadCompleteView,
+  UploadsView,
+  UploadView,
+)
+
+urlpatterns = [
+  path('uploads', UploadsView.as_view(), name='uploads'),
+  path('uploads/<uuid:upload_id>', UploadView.as_view(), name='upload'),
+  path('uploads/<uuid:upload_id>/chunks/<int:index>', UploadChunkView.as_view(), name='upload_chunk'),
+  path('uploads/<uuid:upload_id>/complete', UploadCompleteView.as_view(), name='upload_complete'),
+]
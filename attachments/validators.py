@@ -0,0 +1,51 @@
+from django.conf import settings
+from attachments.utils.formatter import Formatter
+from core.exceptions import ValidationError
+
+
+FILE_EXTENSIONS = ["jpg", "jpeg", "png", "gif", "pdf", "docx", "txt"]
+
+FILE_CONTENT_TYPES = [
+  "image/jpeg",
+  "image/png",
+  "image/gif",
+  "application/pdf",
+  "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+  "text/plain",
+]
+
+
+def validate_file(size, extension, content_type, max_size=None) -> None:
+  """
+  Valida se o arquivo enviado é do tipo permitido.
+  Lança uma exceção ValidationError se o arquivo não for válido.
+  Por padrão usa o limite de UPLOAD_MAX_SIZE (envio direto, em uma única requisição).
+  """
+  max_size = max_size or settings.UPLOAD_MAX_SIZE
+
+  if size > max_size:
+    raise ValidationError(
+      f"O arquivo não pode ser maior que {Formatter.format_bytes(max_size)}."
+    )
+
+  if extension.lower() not in FILE_EXTENSIONS:
+    raise ValidationError("Extensão de arquivo inválida.")
+
+  if content_type not in FILE_CONTENT_TYPES:
+    raise ValidationError("Tipo de arquivo inválido.")
+
+
+def validate_audio(size, content_type, max_size=None) -> None:
+  """
+  Valida se o áudio enviado é permitido.
+  Lança uma exceção ValidationError se o áudio não for válido.
+  """
+  max_size = max_size or settings.UPLOAD_MAX_SIZE
+
+  if size > max_size:
+    raise ValidationError(
+      f"O áudio não pode ser maior que {Formatter.format_bytes(max_size)}."
+    )
+
+  if not content_type or not content_type.startswith("audio/"):
+    raise ValidationError("Tipo de áudio inválido.")
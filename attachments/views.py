@@ -1,3 +1,188 @@
-from django.shortcuts import render
+import io
+import os
 
-# Create your views here.
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.http import Http404
+from django.utils._os import safe_join
+from django.utils.decorators import method_decorator
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework import status
+
+from accounts.authentication import QueryStringJWTAuthentication
+from attachments import media, thumbnails
+from attachments.exceptions import UploadNotFound
+from attachments.models import AudioAttachment, ChunkedUpload, FileAttachment
+from attachments.serializers import (
+  AudioAttachmentSerializer,
+  ChunkedUploadSerializer,
+  FileAttachmentSerializer,
+)
+from attachments.uploads import ChunkedUploadService
+
+
+class BaseUploadView(APIView):
+
+  def get_upload(self, upload_id, user_id) -> ChunkedUpload:
+    """
+    Busca um envio do usuário.
+    Se o envio não for encontrado, lança uma exceção UploadNotFound.
+    """
+    upload = ChunkedUpload.objects.filter(id=upload_id, user_id=user_id).first()
+
+    if not upload:
+      raise UploadNotFound
+
+    return upload
+
+
+class UploadsView(BaseUploadView):
+  """
+  Inicia um envio em partes.
+  - POST: recebe `name`, `content_type`, `size`, `attachment_code` (FILE ou AUDIO)
+    e, opcionalmente, o `sha256` do arquivo completo.
+    Retorna o id do envio, o tamanho de cada parte e a quantidade de partes.
+  """
+
+  def post(self, request):
+    upload = ChunkedUploadService().start(
+      user=request.user,
+      name=request.data.get("name"),
+      content_type=request.data.get("content_type"),
+      size=request.data.get("size"),
+      attachment_code=request.data.get("attachment_code", "FILE"),
+      sha256=request.data.get("sha256"),
+    )
+
+    return Response(
+      {"result": ChunkedUploadSerializer(upload).data},
+      status=status.HTTP_201_CREATED,
+    )
+
+
+class UploadView(BaseUploadView):
+  """
+  - GET: Retorna o estado do envio, com as partes já recebidas,
+    para que o cliente retome o envio após uma queda de conexão.
+  """
+
+  def get(self, request, upload_id):
+    upload = self.get_upload(upload_id, request.user.id)
+
+    return Response(
+      {"result": ChunkedUploadSerializer(upload).data},
+      status=status.HTTP_200_OK,
+    )
+
+
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class UploadChunkView(BaseUploadView):
+  """
+  - PUT: Recebe a parte `index` no corpo da requisição (bytes crus).
+    O cabeçalho opcional `X-Chunk-SHA256` é conferido antes de registrar a parte.
+    Não abre transação durante a leitura do corpo, que pode ser lenta.
+  """
+
+  def put(self, request, upload_id, index):
+    upload = self.get_upload(upload_id, request.user.id)
+
+    upload = ChunkedUploadService().write_chunk(
+      upload,
+      index,
+      request.stream or io.BytesIO(),
+      content_length=request.META.get("CONTENT_LENGTH"),
+      sha256=request.headers.get("X-Chunk-SHA256"),
+    )
+
+    return Response(
+      {"result": ChunkedUploadSerializer(upload).data},
+      status=status.HTTP_200_OK,
+    )
+
+
+class UploadCompleteView(BaseUploadView):
+  """
+  - POST: Conclui o envio e cria o anexo.
+    O `upload_id` pode então ser enviado em ChatMessagesView.post.
+  """
+
+  def post(self, request, upload_id):
+    upload = ChunkedUploadService().complete(
+      self.get_upload(upload_id, request.user.id)
+    )
+
+    if upload.attachment_code == "FILE":
+      attachment = {
+        "file": FileAttachmentSerializer(
+          FileAttachment.objects.get(id=upload.attachment_id)
+        ).data
+      }
+    else:
+      attachment = {
+        "audio": AudioAttachmentSerializer(
+          AudioAttachment.objects.get(id=upload.attachment_id)
+        ).data
+      }
+
+    return Response(
+      {
+        "result": {
+          "upload": ChunkedUploadSerializer(upload).data,
+          "attachment": attachment,
+        }
+      },
+      status=status.HTTP_200_OK,
+    )
+
+
+class MediaView(APIView):
+  """
+  Serve os arquivos de MEDIA_ROOT.
+  - GET: Avatares são públicos. Arquivos e áudios exigem autenticação (cabeçalho
+    Authorization ou parâmetro `token`) e só são entregues a quem participa do chat
+    da mensagem com o anexo; para os demais a resposta é 404. As miniaturas
+    (thumbnails/<pasta>/<arquivo>/<tamanho>.webp) seguem a regra do original.
+    Os blobs, endereçados pelo sha256, são enviados com cache imutável.
+    A transferência é feita conforme MEDIA_SERVE_MODE (ver attachments.media.serve).
+  """
+
+  authentication_classes = [QueryStringJWTAuthentication]
+  permission_classes = [AllowAny]
+
+  def get(self, request, path):
+    try:
+      absolute_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+      raise Http404
+
+    path = os.path.relpath(absolute_path, settings.MEDIA_ROOT).replace(os.sep, "/")
+
+    # Miniaturas têm o mesmo acesso do arquivo original.
+    source = thumbnails.source_path(path) if path.startswith(f"{thumbnails.THUMBNAILS_FOLDER}/") else path
+
+    if source is None:
+      raise Http404
+
+    folder = source.split("/", 1)[0]
+
+    if media.is_public(folder, source):
+      cache_control = media.cache_control(folder, public=True)
+    elif folder in media.PROTECTED_FOLDERS:
+      if not request.user.is_authenticated:
+        raise NotAuthenticated
+
+      if not media.can_access(request.user.id, folder, source):
+        raise Http404
+
+      cache_control = media.cache_control(folder, public=False)
+    else:
+      raise Http404
+
+    if not os.path.isfile(absolute_path):
+      raise Http404
+
+    return media.serve(request, path, absolute_path, cache_control)
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class MessageCache:
+  """
+  Cache em memória, por processo, das mensagens serializadas (ChatMessageSerializer),
+  limitado a `size` mensagens (LRU). A chave é o id da mensagem e `updated_at`, que
+  muda quando a mensagem é editada, deletada ou recebe as miniaturas do anexo; assim
+  uma versão em cache nunca fica desatualizada e não há invalidação entre processos.
+
+  Guarda apenas os campos que dependem só da mensagem. `from_user` (avatar e último
+  acesso) e `viewed_at` (confirmação de leitura do chat) mudam sem alterar a mensagem
+  e são montados a cada leitura. Os dicionários em cache são compartilhados entre as
+  respostas e não devem ser alterados.
+  """
+
+  def __init__(self, size):
+    self.size = size
+    self.entries = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, message) -> dict | None:
+    key = (message.id, message.updated_at)
+
+    with self.lock:
+      data = self.entries.get(key)
+
+      if data is not None:
+        self.entries.move_to_end(key)
+
+      return data
+
+  def get_many(self, messages) -> dict[int, dict]:
+    """
+    Retorna {id da mensagem: dados em cache} das mensagens encontradas.
+    """
+    found = {}
+
+    with self.lock:
+      for message in messages:
+        key = (message.id, message.updated_at)
+        data = self.entries.get(key)
+
+        if data is not None:
+          self.entries.move_to_end(key)
+          found[message.id] = data
+
+    return found
+
+  def set(self, message, data) -> None:
+    if not self.size:
+      return
+
+    key = (message.id, message.updated_at)
+
+    with self.lock:
+      self.entries[key] = data
+      self.entries.move_to_end(key)
+
+      while len(self.entries) > self.size:
+        self.entries.popitem(last=False)
+
+  def clear(self) -> None:
+    with self.lock:
+      self.entries.clear()
+
+
+message_cache = MessageCache(settings.MESSAGE_CACHE_SIZE)
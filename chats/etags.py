@@ -0,0 +1,80 @@
+"""
+Marcadores de versão das respostas de ChatsView.get e ChatMessagesView.get, usados nos
+ETags (ver BaseView.get_etag): mudam sempre que o conteúdo da resposta pode mudar e são
+lidos em uma única consulta, sem carregar nem serializar os chats e mensagens.
+"""
+
+from datetime import datetime
+
+from django.db.models import OuterRef, Subquery
+
+from chats.models import Chat, ChatMessage
+from chats.services import user_chats
+
+
+# Campos dos participantes que aparecem nas respostas (UserSerializer).
+USER_FIELDS = ("name", "email", "avatar", "is_superuser", "last_access", "avatar_variants")
+
+PARTICIPANT_FIELDS = tuple(
+  f"{participant}__{field}" for participant in ("from_user", "to_user") for field in USER_FIELDS
+)
+
+READ_FIELDS = (
+  "from_user_unread",
+  "to_user_unread",
+  "from_user_read_id",
+  "from_user_read_at",
+  "to_user_read_id",
+  "to_user_read_at",
+)
+
+# A edição, remoção ou miniatura de uma mensagem muda o seu updated_at.
+CHAT_FIELDS = (
+  "id",
+  "viewed_at",
+  "created_at",
+  "last_message_id",
+  "last_message__updated_at",
+  *READ_FIELDS,
+  *PARTICIPANT_FIELDS,
+)
+
+
+def last_modified(rows) -> datetime | None:
+  """
+  Data mais recente entre os marcadores, para o cabeçalho Last-Modified.
+  """
+  return max(
+    (value for row in rows for value in row if isinstance(value, datetime)),
+    default=None,
+  )
+
+
+def chats_version(user_id) -> tuple[list, datetime | None]:
+  """
+  Marcadores da lista de chats do usuário: cada chat ativo, com a versão da última
+  mensagem e dos participantes. Retorna (marcadores, data da última alteração).
+  """
+  rows = list(user_chats(user_id).order_by("id").values_list(*CHAT_FIELDS))
+  return rows, last_modified(rows)
+
+
+def messages_version(chat) -> tuple[tuple, datetime | None]:
+  """
+  Marcadores das mensagens de um chat: a alteração mais recente de uma mensagem (pelo
+  índice chat_messages_updated_idx), as confirmações de leitura e os participantes.
+  Retorna (marcadores, data da última alteração).
+  """
+  latest = ChatMessage.objects.filter(chat=OuterRef("id")).order_by("-updated_at", "-id")
+
+  row = (
+    Chat.objects.filter(id=chat.id)
+    .annotate(
+      last_change_at=Subquery(latest.values("updated_at")[:1]),
+      last_change_id=Subquery(latest.values("id")[:1]),
+    )
+    .values_list("last_change_at", "last_change_id", *READ_FIELDS, *PARTICIPANT_FIELDS)
+    .get()
+  )
+
+  return row, last_modified([row])
@@ -0,0 +1,145 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from accounts.serializers import user_representations
+from attachments.models import AudioAttachment, FileAttachment
+from chats.cache import message_cache
+from chats.models import Chat, ChatMessage
+from chats.rows import MESSAGE_FIELDS, serialize_chats, serialize_messages
+from chats.serializers import ChatMessageSerializer, ChatSerializer
+from chats.services import reconcile_counters
+from core.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a serialização das listas de mensagens e de chats pelos serializers do "
+        "DRF com o JSONRenderer e pelo caminho rápido (chats.rows com o FastJSONRenderer, "
+        "ver FAST_SERIALIZATION). Os dados criados são desfeitos ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000, help="Mensagens do chat.")
+        parser.add_argument("--chats", type=int, default=500, help="Chats do usuário.")
+        parser.add_argument("--rounds", type=int, default=3, help="Repetições de cada medição.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user, chat = self.seed(options["messages"], options["chats"])
+            messages = ChatMessage.objects.filter(chat=chat, deleted_at__isnull=True).order_by(
+                "created_at", "id"
+            )
+            chats = Chat.objects.filter(from_user=user, deleted_at__isnull=True).order_by("-viewed_at")
+
+            def serializers_messages():
+                # Sem os caches, como na primeira leitura de cada mensagem.
+                message_cache.clear()
+                user_representations.clear()
+                data = ChatMessageSerializer(
+                    messages.select_related("from_user"), many=True, context={"chat": chat}
+                ).data
+                return JSONRenderer().render({"results": data})
+
+            def cached_messages():
+                data = ChatMessageSerializer(
+                    messages.select_related("from_user"), many=True, context={"chat": chat}
+                ).data
+                return JSONRenderer().render({"results": data})
+
+            def rows_messages():
+                data = serialize_messages(chat, list(messages.values(*MESSAGE_FIELDS)))
+                return FastJSONRenderer().render({"results": data})
+
+            def serializers_chats():
+                message_cache.clear()
+                user_representations.clear()
+                data = ChatSerializer(
+                    chats.select_related("from_user", "to_user"), many=True, context={"user_id": user.id}
+                ).data
+                return JSONRenderer().render({"results": data})
+
+            def rows_chats():
+                return FastJSONRenderer().render({"results": serialize_chats(chats, user.id)})
+
+            self.stdout.write(f"Chat com {options['messages']} mensagens:")
+            expected = serializers_messages()
+            cached_messages()
+            baseline = self.measure("serializers", serializers_messages, options["rounds"])
+            self.measure("serializers com cache", cached_messages, options["rounds"], baseline)
+            self.measure("chats.rows + orjson", rows_messages, options["rounds"], baseline)
+            self.check_output(expected, rows_messages())
+
+            self.stdout.write(f"Lista com {options['chats']} chats:")
+            expected = serializers_chats()
+            baseline = self.measure("serializers", serializers_chats, options["rounds"])
+            self.measure("chats.rows + orjson", rows_chats, options["rounds"], baseline)
+            self.check_output(expected, rows_chats())
+
+            message_cache.clear()
+            user_representations.clear()
+            transaction.set_rollback(True)
+
+    def measure(self, label, render, rounds, baseline=None) -> float:
+        elapsed = []
+
+        for _ in range(rounds):
+            started_at = time.perf_counter()
+            render()
+            elapsed.append(time.perf_counter() - started_at)
+
+        best = min(elapsed)
+        speedup = f" ({baseline / best:.1f}x)" if baseline else ""
+
+        self.stdout.write(f"{label:>24}: {best * 1000:9.1f}ms{speedup}")
+        return best
+
+    def check_output(self, expected, output) -> None:
+        if output != expected:
+            self.stderr.write(self.style.ERROR("A resposta do caminho rápido é diferente!"))
+
+    def seed(self, total_messages, total_chats) -> tuple[User, Chat]:
+        suffix = time.time_ns()
+        users = User.objects.bulk_create(
+            User(name=f"Benchmark {index}", email=f"benchmark-{index}-{suffix}@email.com")
+            for index in range(total_chats + 1)
+        )
+        chats = Chat.objects.bulk_create(
+            Chat(from_user=users[0], to_user=to_user, viewed_at=now()) for to_user in users[1:]
+        )
+        files = FileAttachment.objects.bulk_create(
+            FileAttachment(
+                name=f"arquivo {index}", extension="pdf", size=1024 * index,
+                src=f"/media/files/{index}.pdf", content_type="application/pdf",
+            )
+            for index in range(100)
+        )
+        audio = AudioAttachment.objects.create(src="/media/audios/a.mp3")
+
+        def message(chat, index):
+            from_user = chat.from_user if index % 2 else chat.to_user
+
+            if index % 10 == 1:
+                return ChatMessage(
+                    chat=chat, from_user=from_user, attachment_code="FILE",
+                    attachment_id=files[index % len(files)].id,
+                )
+            if index % 10 == 2:
+                return ChatMessage(
+                    chat=chat, from_user=from_user, attachment_code="AUDIO", attachment_id=audio.id
+                )
+            return ChatMessage(chat=chat, from_user=from_user, body=f"Mensagem {index}")
+
+        ChatMessage.objects.bulk_create(
+            (message(chats[0], index) for index in range(total_messages)), batch_size=1000
+        )
+        ChatMessage.objects.bulk_create(
+            (message(chat, index) for chat in chats[1:] for index in range(3)), batch_size=1000
+        )
+        reconcile_counters(Chat.objects.filter(id__in=[chat.id for chat in chats]))
+
+        return users[0], chats[0]
@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.timezone import now
+
+from accounts.models import User
+from accounts.serializers import UserSerializer, user_representations
+from chats.cache import message_cache
+from chats.models import Chat, ChatMessage
+from chats.serializers import ChatMessageSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a serialização dos usuários nas páginas de mensagens: UserSerializer "
+        "a cada linha, o cache entre requisições (user_representations) e o cache da "
+        "requisição. Os dados criados são desfeitos ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000, help="Mensagens do chat.")
+        parser.add_argument("--page-size", type=int, default=200)
+        parser.add_argument("--rounds", type=int, default=20, help="Páginas serializadas por medição.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            chat = self.seed(options["messages"])
+            pages = self.pages(chat, options["page_size"])
+
+            self.stdout.write(
+                f"{len(pages)} páginas de {options['page_size']} mensagens, "
+                f"{options['rounds']} por medição."
+            )
+
+            user_representations.clear()
+            rounds = [pages[index % len(pages)] for index in range(options["rounds"])]
+
+            baseline = self.measure(
+                "UserSerializer por linha",
+                rounds,
+                lambda page: [UserSerializer(message.from_user).data for message in page],
+            )
+            self.measure(
+                "cache entre requisições",
+                rounds,
+                lambda page: [user_representations.serialize(message.from_user) for message in page],
+                baseline,
+            )
+
+            def with_memo(page):
+                memo = {}
+                return [user_representations.serialize(message.from_user, memo) for message in page]
+
+            self.measure("cache da requisição", rounds, with_memo, baseline)
+
+            # Página inteira, sem o cache de mensagens, para mostrar a parte dos usuários no total.
+            def full_page(page):
+                message_cache.clear()
+                return ChatMessageSerializer(page, many=True, context={"chat": chat}).data
+
+            self.measure("página inteira", rounds, full_page)
+
+            message_cache.clear()
+            user_representations.clear()
+            transaction.set_rollback(True)
+
+    def measure(self, label, rounds, serialize, baseline=None) -> float:
+        started_at = time.perf_counter()
+
+        for page in rounds:
+            serialize(page)
+
+        elapsed = time.perf_counter() - started_at
+        rows = sum(len(page) for page in rounds)
+        speedup = f", {baseline / elapsed:.1f}x" if baseline else ""
+
+        self.stdout.write(
+            f"{label:>26}: {rows / elapsed:10.0f} linhas/s ({elapsed * 1000:.1f}ms{speedup})"
+        )
+        return elapsed
+
+    def seed(self, total_messages) -> Chat:
+        users = User.objects.bulk_create(
+            User(name=f"Benchmark {index}", email=f"benchmark-{index}-{time.time_ns()}@email.com")
+            for index in range(2)
+        )
+        chat = Chat.objects.create(from_user=users[0], to_user=users[1], viewed_at=now())
+
+        ChatMessage.objects.bulk_create(
+            (
+                ChatMessage(chat=chat, from_user=users[index % 2], body=f"Mensagem {index}")
+                for index in range(total_messages)
+            ),
+            batch_size=1000,
+        )
+
+        return chat
+
+    def pages(self, chat, page_size) -> list[list[ChatMessage]]:
+        messages = list(
+            ChatMessage.objects.filter(chat=chat)
+            .select_related("from_user")
+            .order_by("created_at", "id")
+        )
+
+        return [messages[index:index + page_size] for index in range(0, len(messages), page_size)]
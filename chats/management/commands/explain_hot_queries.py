@@ -0,0 +1,180 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q, Subquery
+from django.utils.timezone import now
+
+from accounts.models import User
+from chats.models import Chat, ChatMessage
+from chats.services import latest_active_messages, unread_messages_count
+
+
+SEQ_SCAN_PATTERNS = [
+    # PostgreSQL
+    re.compile(r"Seq Scan on (?P<table>\w+)"),
+    # SQLite: "SCAN tabela" sem índice (SEARCH/USING INDEX indicam uso de índice)
+    re.compile(r"\bSCAN (?P<table>\w+)(?!.*USING (?:COVERING )?INDEX)"),
+]
+
+HOT_TABLES = {Chat._meta.db_table, ChatMessage._meta.db_table}
+
+# No SQLite o plano das subconsultas mostra só o alias do Django (U0, V0...).
+SUBQUERY_ALIAS = re.compile(r"[U-Z]\d+")
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa EXPLAIN nas consultas mais frequentes de chats e mensagens "
+        "e aponta leituras sequenciais nas tabelas chats e chat_messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Cria N chats temporários (desfeitos ao final) antes de executar o EXPLAIN.",
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=200,
+            help="Quantidade de mensagens por chat criado com --seed.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                self.seed(options["seed"], options["messages"])
+
+            offenders = self.explain_all()
+
+            # Os dados criados com --seed nunca são persistidos.
+            transaction.set_rollback(True)
+
+        if offenders:
+            raise CommandError(
+                "Leitura sequencial nas consultas: " + ", ".join(offenders)
+            )
+
+        self.stdout.write(self.style.SUCCESS("Todas as consultas usam índices."))
+
+    def hot_queries(self, chat, user_id):
+        """
+        Mesmas consultas executadas por ChatsView, ChatSerializer, BaseView, ChatMessagesView
+        e pela manutenção dos contadores (chats.services).
+        """
+        since = now() - timedelta(minutes=5)
+
+        return {
+            "lista de chats": Chat.objects.filter(
+                Q(from_user_id=user_id) | Q(to_user_id=user_id),
+                deleted_at__isnull=True,
+            ).order_by("-viewed_at"),
+            "última mensagem": ChatMessage.objects.filter(
+                chat_id=chat.id, deleted_at__isnull=True
+            ).order_by("-created_at", "-id")[:1],
+            "página de mensagens": ChatMessage.objects.filter(
+                chat_id=chat.id, deleted_at__isnull=True
+            ).order_by("-created_at", "-id")[:51],
+            "sincronização (since)": ChatMessage.objects.filter(
+                Q(updated_at__gt=since) | Q(updated_at=since, id__gt=0),
+                chat_id=chat.id,
+            ).order_by("updated_at", "id")[:51],
+            # Mesmas subconsultas de reconcile_counters; a última mensagem também é a
+            # de register_deleted_messages.
+            "não lidas (reconcile_counters)": Chat.objects.filter(id__in=[chat.id]).values(
+                "id",
+                from_user_unread_count=unread_messages_count("from_user"),
+                to_user_unread_count=unread_messages_count("to_user"),
+            ),
+            "última mensagem ativa (reconcile_counters)": Chat.objects.filter(
+                id__in=[chat.id]
+            ).values(
+                "id",
+                latest_id=Subquery(latest_active_messages().values("id")[:1]),
+                latest_at=Subquery(latest_active_messages().values("created_at")[:1]),
+            ),
+        }
+
+    def explain_all(self):
+        chat = Chat.objects.filter(deleted_at__isnull=True).order_by("-id").first()
+
+        if not chat:
+            raise CommandError("Nenhum chat encontrado. Use --seed para criar dados de teste.")
+
+        offenders = []
+
+        for name, queryset in self.hot_queries(chat, chat.from_user_id).items():
+            plan = queryset.explain()
+            tables = self.sequential_scans(plan)
+
+            if tables:
+                offenders.append(name)
+                self.stdout.write(self.style.ERROR(f"[SEQ SCAN] {name}: {', '.join(tables)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[OK] {name}"))
+
+            self.stdout.write(plan)
+            self.stdout.write("")
+
+        return offenders
+
+    def sequential_scans(self, plan):
+        tables = set()
+
+        for line in plan.splitlines():
+            for pattern in SEQ_SCAN_PATTERNS:
+                match = pattern.search(line)
+                if match and (
+                    match.group("table") in HOT_TABLES
+                    or SUBQUERY_ALIAS.fullmatch(match.group("table"))
+                ):
+                    tables.add(match.group("table"))
+
+        return sorted(tables)
+
+    def seed(self, total_chats, total_messages):
+        users = User.objects.bulk_create(
+            User(name=f"Seed {index}", email=f"seed-{index}@explain.local")
+            for index in range(max(total_chats, 2))
+        )
+
+        # Cada usuário participa de poucos chats, como em uma base real.
+        chats = Chat.objects.bulk_create(
+            Chat(
+                from_user=user,
+                to_user=users[(index + 1) % len(users)],
+                viewed_at=now(),
+            )
+            for index, user in enumerate(users[:total_chats])
+        )
+
+        for chat in chats:
+            messages = ChatMessage.objects.bulk_create(
+                ChatMessage(
+                    chat=chat,
+                    from_user=chat.from_user if index % 2 else chat.to_user,
+                    body=f"Mensagem {index}",
+                )
+                for index in range(total_messages)
+            )
+
+            # As 5 últimas mensagens ficam não lidas.
+            if len(messages) > 5:
+                Chat.objects.filter(id=chat.id).update(
+                    from_user_read_id=messages[-6].id,
+                    from_user_read_at=now(),
+                    to_user_read_id=messages[-6].id,
+                    to_user_read_at=now(),
+                )
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"ANALYZE {Chat._meta.db_table}, {ChatMessage._meta.db_table}"
+                )
+            else:
+                cursor.execute("ANALYZE")
@@ -0,0 +1,237 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import (
+    CloseConnection,
+    Ping,
+    RejectConnection,
+    Request,
+    TextMessage,
+)
+
+from accounts.authentication import UserRefreshToken
+from accounts.models import User
+from chats.models import Chat
+
+
+class SocketClient:
+    """
+    Cliente Socket.IO mínimo (engine.io v4 sobre websocket) que só conecta,
+    responde aos pings do servidor e fica ocioso.
+    """
+
+    def __init__(self, host, port, token):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.connection = WSConnection(ConnectionType.CLIENT)
+        self.reader = None
+        self.writer = None
+
+    async def send(self, event):
+        self.writer.write(self.connection.send(event))
+        await self.writer.drain()
+
+    async def events(self):
+        while True:
+            data = await self.reader.read(65536)
+            self.connection.receive_data(data or None)
+
+            for event in self.connection.events():
+                yield event
+
+            if not data:
+                return
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        await self.send(
+            Request(
+                host=f"{self.host}:{self.port}",
+                target=f"/socket.io/?EIO=4&transport=websocket&token={self.token}",
+            )
+        )
+
+        async for event in self.events():
+            if isinstance(event, RejectConnection):
+                raise ConnectionError(f"Handshake recusado ({event.status_code}).")
+
+            if isinstance(event, TextMessage):
+                if event.data.startswith("0"):
+                    await self.send(TextMessage("40"))
+                elif event.data.startswith("40"):
+                    return
+                elif event.data.startswith("44"):
+                    raise ConnectionError(f"Conexão recusada: {event.data[2:]}")
+
+        raise ConnectionError("Conexão encerrada durante o handshake.")
+
+    async def idle(self):
+        async for event in self.events():
+            if isinstance(event, TextMessage) and event.data == "2":
+                await self.send(TextMessage("3"))
+            elif isinstance(event, Ping):
+                await self.send(event.response())
+            elif isinstance(event, CloseConnection):
+                return
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def http_get(host, port, path, token):
+    reader, writer = await asyncio.open_connection(host, port)
+
+    try:
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                f"Authorization: Bearer {token}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+        )
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+
+    return int(response.split(b" ", 2)[1])
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def read_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga contra um servidor em execução: abre conexões Socket.IO ociosas "
+        "e, com elas abertas, mede a latência da lista de mensagens. Rode contra os dois "
+        "modos para comparar, ex.: `python -m core.wsgi` (eventlet) e "
+        "`uvicorn core.asgi:application` (ASGI), informando --server-pid para medir a memória."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--email", help="Usuário das requisições. Padrão: o primeiro com chats.")
+        parser.add_argument("--connections", type=int, default=1000, help="Conexões ociosas.")
+        parser.add_argument("--requests", type=int, default=500, help="Total de requisições GET.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Requisições simultâneas.")
+        parser.add_argument("--server-pid", type=int, help="PID do servidor, para medir a memória (Linux).")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Use uma URL http://host:porta.")
+
+        chats = Chat.objects.filter(deleted_at__isnull=True).select_related("from_user").order_by("id")
+        user = None
+
+        if options["email"]:
+            user = User.objects.filter(email=options["email"]).first()
+            if not user:
+                raise CommandError("Usuário não encontrado.")
+            chats = chats.filter(Q(from_user=user) | Q(to_user=user))
+
+        chat = chats.first()
+
+        if not chat:
+            raise CommandError("Nenhum chat encontrado para o teste.")
+
+        user = user or chat.from_user
+        token = str(UserRefreshToken.for_user(user).access_token)
+
+        result = asyncio.run(
+            self.run(url.hostname, url.port or 80, token, chat.id, options)
+        )
+
+        for label, value in result:
+            self.stdout.write(f"{label}: {value}")
+
+    async def run(self, host, port, token, chat_id, options):
+        pid = options["server_pid"]
+        rss_before = read_rss(pid) if pid else None
+
+        clients = [SocketClient(host, port, token) for _ in range(options["connections"])]
+        semaphore = asyncio.Semaphore(200)
+
+        async def connect(client):
+            async with semaphore:
+                await client.connect()
+
+        started_at = time.perf_counter()
+        connected = await asyncio.gather(
+            *(connect(client) for client in clients), return_exceptions=True
+        )
+        connect_time = time.perf_counter() - started_at
+
+        idle = [
+            asyncio.create_task(client.idle())
+            for client, error in zip(clients, connected)
+            if error is None
+        ]
+        failures = len(clients) - len(idle)
+        rss_connected = read_rss(pid) if pid else None
+
+        latencies = []
+        statuses = {}
+        pending = iter(range(options["requests"]))
+
+        async def worker():
+            for _ in pending:
+                request_started_at = time.perf_counter()
+                try:
+                    code = await http_get(host, port, f"/api/v1/chats/messages/{chat_id}", token)
+                except OSError:
+                    code = "erro"
+                latencies.append(time.perf_counter() - request_started_at)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(options["concurrency"])))
+        elapsed = time.perf_counter() - started_at
+
+        for task in idle:
+            task.cancel()
+        for client in clients:
+            client.close()
+
+        result = [
+            ("Conexões ociosas", f"{len(idle)} abertas, {failures} falhas em {connect_time:.2f}s"),
+            ("Requisições", f"{len(latencies)} em {elapsed:.2f}s ({len(latencies) / elapsed:.1f}/s)"),
+            ("Status", statuses),
+            ("Latência p50", f"{percentile(latencies, 50) * 1000:.1f} ms"),
+            ("Latência p95", f"{percentile(latencies, 95) * 1000:.1f} ms"),
+            ("Latência p99", f"{percentile(latencies, 99) * 1000:.1f} ms"),
+            ("Latência média", f"{statistics.fmean(latencies) * 1000 if latencies else 0:.1f} ms"),
+        ]
+
+        if rss_before and rss_connected:
+            per_connection = (rss_connected - rss_before) / max(len(idle), 1)
+            result.append(
+                ("Memória do servidor", f"{rss_before / 2**20:.1f} MB -> {rss_connected / 2**20:.1f} MB "
+                 f"({per_connection / 1024:.1f} KB por conexão)")
+            )
+
+        return result
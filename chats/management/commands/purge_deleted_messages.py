@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from attachments.blobs import BlobStorage
+from chats.services import purge_deleted_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga definitivamente as mensagens deletadas há mais de --days dias, os anexos "
+        "sem mensagens e os arquivos que nenhum anexo ou avatar usa mais. Clientes que "
+        "sincronizam (since) com um intervalo maior que --days não recebem essas exclusões."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Idade mínima, em dias, das mensagens deletadas.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Quantidade de mensagens apagadas por transação.",
+        )
+
+    def handle(self, *args, **options):
+        messages = purge_deleted_messages(
+            now() - timedelta(days=options["days"]), options["batch_size"]
+        )
+        blobs = BlobStorage().collect_garbage(options["batch_size"])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{messages} mensagens e {blobs} arquivos apagados.")
+        )
+        return 0
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chats.models import Chat
+from chats.services import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula a última mensagem e os contadores de não lidas dos chats "
+        "a partir de chat_messages, corrigindo qualquer divergência."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Quantidade de chats atualizados por transação.",
+        )
+        parser.add_argument(
+            "--chat",
+            type=int,
+            action="append",
+            dest="chat_ids",
+            help="Recalcula apenas o chat informado (pode ser repetido).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        chats = Chat.objects.order_by("id")
+
+        if options["chat_ids"]:
+            chats = chats.filter(id__in=options["chat_ids"])
+
+        total = 0
+        last_id = 0
+
+        while True:
+            ids = list(chats.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+
+            if not ids:
+                break
+
+            with transaction.atomic():
+                total += reconcile_counters(Chat.objects.filter(id__in=ids))
+
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"{total} chats recalculados."))
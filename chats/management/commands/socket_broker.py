@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.socket_managers import run_broker
+
+
+class Command(BaseCommand):
+    help = (
+        "Inicia o broker local que repassa os eventos do Socket.IO entre os processos "
+        "da API (usado quando SOCKETIO_CLIENT_MANAGER começa com unix://)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            help="Caminho do socket Unix. Padrão: o caminho de SOCKETIO_CLIENT_MANAGER.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+
+        if not path:
+            url = settings.SOCKETIO_CLIENT_MANAGER
+            if not url.startswith("unix://"):
+                raise CommandError(
+                    "Informe --path ou configure SOCKETIO_CLIENT_MANAGER=unix:///caminho.sock"
+                )
+            path = url[len("unix://"):]
+
+        self.stdout.write(f"Broker do Socket.IO ouvindo em {path}")
+        run_broker(path)
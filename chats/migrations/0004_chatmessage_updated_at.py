@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_rename_delete_at_chat_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
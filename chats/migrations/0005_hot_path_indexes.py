@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_chatmessage_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['from_user', '-viewed_at'], name='chats_from_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['to_user', '-viewed_at'], name='chats_to_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True), ('viewed_at__isnull', True)), fields=['chat', 'from_user'], name='chat_messages_unseen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['chat', 'created_at', 'id'], name='chat_messages_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat', 'updated_at', 'id'], name='chat_messages_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Cópia de chats.services.reconcile_counters da época desta migração, quando a
+    leitura era marcada em chat_messages.viewed_at.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatMessage = apps.get_model('chats', 'ChatMessage')
+
+    def unread_for(participant):
+        return Coalesce(
+            Subquery(
+                ChatMessage.objects.filter(
+                    chat=OuterRef('pk'), viewed_at__isnull=True, deleted_at__isnull=True
+                )
+                .exclude(from_user=OuterRef(participant))
+                .order_by()
+                .values('chat')
+                .annotate(count=Count('id'))
+                .values('count'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    latest = ChatMessage.objects.filter(
+        chat=OuterRef('pk'), deleted_at__isnull=True
+    ).order_by('-created_at', '-id')
+
+    Chat.objects.update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        from_user_unread=unread_for('from_user'),
+        to_user_unread=unread_for('to_user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='from_user_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='to_user_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
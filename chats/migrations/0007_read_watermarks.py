@@ -0,0 +1,106 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_watermarks(apps, schema_editor):
+    """
+    Converte chat_messages.viewed_at na confirmação de leitura de cada participante:
+    lido até a mensagem anterior à primeira não lida do outro participante.
+    """
+    Chat = apps.get_model('chats', 'Chat')
+    ChatMessage = apps.get_model('chats', 'ChatMessage')
+
+    changes = {}
+
+    for participant in ('from_user', 'to_user'):
+        received = ChatMessage.objects.filter(
+            chat=OuterRef('pk'), deleted_at__isnull=True
+        ).exclude(from_user=OuterRef(participant))
+
+        first_unread = received.filter(viewed_at__isnull=True).order_by('id').values('id')[:1]
+        last_read_at = received.filter(viewed_at__isnull=False).order_by('-viewed_at').values('viewed_at')[:1]
+        last_id = ChatMessage.objects.filter(chat=OuterRef('pk')).order_by('-id').values('id')[:1]
+
+        changes[f'{participant}_read_id'] = Coalesce(
+            Subquery(first_unread) - Value(1),
+            Subquery(last_id),
+            Value(0),
+            output_field=models.PositiveBigIntegerField(),
+        )
+        changes[f'{participant}_read_at'] = Subquery(last_read_at)
+
+    Chat.objects.update(**changes)
+    fill_counters(Chat, ChatMessage)
+
+
+def fill_counters(Chat, ChatMessage):
+    """
+    Cópia de chats.services.reconcile_counters da época desta migração: as não lidas
+    passam a ser as mensagens recebidas após a confirmação de leitura.
+    """
+    def unread_for(participant):
+        return Coalesce(
+            Subquery(
+                ChatMessage.objects.filter(
+                    chat=OuterRef('pk'),
+                    id__gt=OuterRef(f'{participant}_read_id'),
+                    deleted_at__isnull=True,
+                )
+                .exclude(from_user=OuterRef(participant))
+                .order_by()
+                .values('chat')
+                .annotate(count=Count('id'))
+                .values('count'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    latest = ChatMessage.objects.filter(
+        chat=OuterRef('pk'), deleted_at__isnull=True
+    ).order_by('-created_at', '-id')
+
+    Chat.objects.update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+        from_user_unread=unread_for('from_user'),
+        to_user_unread=unread_for('to_user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_chat_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='from_user_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='from_user_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='to_user_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='to_user_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_watermarks, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_messages_unseen_idx',
+        ),
+    ]
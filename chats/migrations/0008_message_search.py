@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:44
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from chats.search import SEARCH_CONFIG
+
+
+# Corpo (peso A) e nome do arquivo anexado (peso B) de uma mensagem.
+SEARCH_VECTOR_SQL = f"""
+CREATE OR REPLACE FUNCTION chat_message_search_vector(body text, attachment_code varchar, attachment_id integer)
+RETURNS tsvector LANGUAGE sql STABLE AS $$
+    SELECT setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(body, '')), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(
+            (SELECT name FROM file_attachments WHERE attachment_code = 'FILE' AND id = attachment_id), ''
+        )), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION chat_messages_search_vector_trigger() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := chat_message_search_vector(NEW.body, NEW.attachment_code, NEW.attachment_id);
+    RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER chat_messages_search_vector_update
+    BEFORE INSERT OR UPDATE OF body, attachment_code, attachment_id ON chat_messages
+    FOR EACH ROW EXECUTE FUNCTION chat_messages_search_vector_trigger();
+
+UPDATE chat_messages SET search_vector = chat_message_search_vector(body, attachment_code, attachment_id);
+
+CREATE INDEX chat_messages_search_idx ON chat_messages USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR_SQL = """
+DROP INDEX IF EXISTS chat_messages_search_idx;
+DROP TRIGGER IF EXISTS chat_messages_search_vector_update ON chat_messages;
+DROP FUNCTION IF EXISTS chat_messages_search_vector_trigger();
+DROP FUNCTION IF EXISTS chat_message_search_vector(text, varchar, integer);
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    # Gatilho e índice GIN só existem no PostgreSQL; nos demais bancos a busca usa
+    # o índice em memória de chats.search.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0007_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
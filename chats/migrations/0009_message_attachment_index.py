@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['attachment_code', 'attachment_id'], name='chat_messages_attachment_idx'),
+        ),
+    ]
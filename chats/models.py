@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from accounts.models import User
 
@@ -7,10 +8,36 @@ class Chat(models.Model):
     viewed_at = models.DateTimeField(null=True, blank=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Campos desnormalizados, mantidos por chats.services e corrigidos
+    # pelo comando reconcile_chat_counters.
+    last_message = models.ForeignKey('ChatMessage', related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    from_user_unread = models.PositiveIntegerField(default=0)
+    to_user_unread = models.PositiveIntegerField(default=0)
+    # Confirmação de leitura de cada participante: as mensagens do outro participante
+    # com id até `*_read_id` estão lidas, desde `*_read_at` (ver chats.services).
+    from_user_read_id = models.PositiveBigIntegerField(default=0)
+    from_user_read_at = models.DateTimeField(null=True, blank=True)
+    to_user_read_id = models.PositiveBigIntegerField(default=0)
+    to_user_read_at = models.DateTimeField(null=True, blank=True)
     
     
     class Meta:
       db_table = 'chats'
+      indexes = [
+        # Lista de chats do usuário (ChatsView.get): remetente ou destinatário,
+        # apenas chats ativos, ordenados pela última visualização.
+        models.Index(
+          fields=['from_user', '-viewed_at'],
+          condition=models.Q(deleted_at__isnull=True),
+          name='chats_from_user_active_idx',
+        ),
+        models.Index(
+          fields=['to_user', '-viewed_at'],
+          condition=models.Q(deleted_at__isnull=True),
+          name='chats_to_user_active_idx',
+        ),
+      ]
       
       
 class ChatMessage(models.Model):
@@ -23,12 +50,36 @@ class ChatMessage(models.Model):
       max_length=10, null=True, blank=True
     )
     attachment_id = models.IntegerField(null=True, blank=True)
+    # Legado: a leitura agora vem da confirmação de leitura do chat (Chat.*_read_id).
     viewed_at = models.DateTimeField(null=True, blank=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Corpo e nome do arquivo anexado para a busca textual (chats.search). No PostgreSQL
+    # é mantido por um gatilho e indexado com GIN (migração 0008); nos demais bancos fica vazio.
+    search_vector = SearchVectorField(null=True, editable=False)
     chat = models.ForeignKey(Chat, related_name='messages', on_delete=models.CASCADE)
     from_user = models.ForeignKey(User, related_name='messages_from_user_id', on_delete=models.CASCADE)
     
     class Meta:
         db_table = 'chat_messages'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Páginas de mensagens ativas e última mensagem do chat.
+            models.Index(
+                fields=['chat', 'created_at', 'id'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='chat_messages_active_idx',
+            ),
+            # Sincronização incremental (since) de ChatMessagesView.get.
+            models.Index(
+                fields=['chat', 'updated_at', 'id'],
+                name='chat_messages_updated_idx',
+            ),
+            # Mensagens de um anexo: miniaturas gravadas (attachments.thumbnails)
+            # e anexos sem mensagens (purge_deleted_messages).
+            models.Index(
+                fields=['attachment_code', 'attachment_id'],
+                name='chat_messages_attachment_idx',
+            ),
+        ]
\ No newline at end of file
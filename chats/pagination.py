@@ -0,0 +1,66 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from core.exceptions import ValidationError
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp: datetime, pk: int) -> str:
+    """
+    Gera um cursor opaco a partir de um par (data, id).
+    """
+    value = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Converte um cursor gerado por encode_cursor de volta para (data, id).
+    Lança uma exceção ValidationError se o cursor não for válido.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        value = base64.urlsafe_b64decode(cursor + padding).decode()
+        timestamp, pk = value.split("|")
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError("Cursor inválido.")
+
+
+def get_page_size(value) -> int:
+    """
+    Retorna o tamanho de página solicitado, limitado a MAX_PAGE_SIZE.
+    """
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError("Limite inválido.")
+
+    if page_size < 1:
+        raise ValidationError("Limite inválido.")
+
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def keyset_before(field: str, cursor: str) -> Q:
+    """
+    Filtro de keyset para registros anteriores ao cursor em (field, id).
+    """
+    timestamp, pk = decode_cursor(cursor)
+    return Q(**{f"{field}__lt": timestamp}) | Q(**{field: timestamp, "id__lt": pk})
+
+
+def keyset_after(field: str, cursor: str) -> Q:
+    """
+    Filtro de keyset para registros posteriores ao cursor em (field, id).
+    """
+    timestamp, pk = decode_cursor(cursor)
+    return Q(**{f"{field}__gt": timestamp}) | Q(**{field: timestamp, "id__gt": pk})
@@ -0,0 +1,200 @@
+"""
+Serialização rápida de chats e mensagens, usada por ChatsView e ChatMessagesView com
+FAST_SERIALIZATION: monta os dicionários direto das linhas de `.values()`, sem
+instanciar models nem passar pelos campos do DRF, e gera exatamente o mesmo conteúdo
+de ChatSerializer e ChatMessageSerializer (ver chats.tests).
+"""
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+from accounts.models import User
+from attachments.models import AudioAttachment, FileAttachment
+from attachments.thumbnails import thumbnail_urls
+from attachments.utils.formatter import Formatter
+from chats.models import ChatMessage
+
+
+MESSAGE_FIELDS = ("id", "body", "attachment_code", "attachment_id", "from_user_id", "viewed_at", "created_at")
+USER_FIELDS = ("id", "email", "name", "avatar", "is_superuser", "last_access", "avatar_variants")
+FILE_FIELDS = ("id", "name", "extension", "size", "src", "content_type", "variants")
+AUDIO_FIELDS = ("id", "src")
+CHAT_FIELDS = (
+  "id",
+  "from_user_id",
+  "to_user_id",
+  "viewed_at",
+  "created_at",
+  "last_message_id",
+  "from_user_unread",
+  "to_user_unread",
+  "from_user_read_id",
+  "from_user_read_at",
+  "to_user_read_id",
+  "to_user_read_at",
+)
+
+
+def datetime_formatter():
+  """
+  Retorna uma função que formata datas como serializers.DateTimeField, com o formato e
+  o fuso resolvidos uma única vez por resposta.
+  """
+  field = serializers.DateTimeField()
+  timezone = field.default_timezone()
+
+  if timezone is None or (api_settings.DATETIME_FORMAT or "").lower() != ISO_8601:
+    return field.to_representation
+
+  def format(value):
+    if not value:
+      return None
+
+    if value.tzinfo is None:
+      return field.to_representation(value)
+
+    value = value.astimezone(timezone).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+  return format
+
+
+class RowSerializer:
+  """
+  Carrega em lote os usuários e anexos de uma lista de linhas de mensagens e monta
+  cada mensagem como ChatMessageSerializer.
+  """
+
+  def __init__(self):
+    self.format = datetime_formatter()
+    self.users = {}
+    self.attachments = {}
+
+  def load_users(self, user_ids) -> None:
+    user_ids = set(user_ids) - self.users.keys()
+
+    for user in User.objects.filter(id__in=user_ids).values(*USER_FIELDS):
+      self.users[user["id"]] = {
+        "id": user["id"],
+        "email": user["email"],
+        "name": user["name"],
+        "avatar": f"{settings.CURRENT_URL}{user['avatar']}" if user["avatar"] else None,
+        "is_superuser": user["is_superuser"],
+        "last_access": self.format(user["last_access"]),
+        "avatar_thumbnails": thumbnail_urls(user["avatar_variants"]),
+      }
+
+  def load_attachments(self, rows) -> None:
+    file_ids = {row["attachment_id"] for row in rows if row["attachment_code"] == "FILE" and row["attachment_id"]}
+    audio_ids = {row["attachment_id"] for row in rows if row["attachment_code"] == "AUDIO" and row["attachment_id"]}
+
+    if file_ids:
+      for file in FileAttachment.objects.filter(id__in=file_ids).values(*FILE_FIELDS):
+        self.attachments[("FILE", file["id"])] = {
+          "file": {
+            "id": file["id"],
+            "name": file["name"],
+            "extension": file["extension"],
+            "size": Formatter.format_bytes(file["size"]),
+            "src": f"{settings.CURRENT_URL}{file['src']}",
+            "content_type": file["content_type"],
+            "thumbnails": thumbnail_urls(file["variants"]),
+          }
+        }
+
+    if audio_ids:
+      for audio in AudioAttachment.objects.filter(id__in=audio_ids).values(*AUDIO_FIELDS):
+        self.attachments[("AUDIO", audio["id"])] = {
+          "audio": {
+            "id": audio["id"],
+            "src": f"{settings.CURRENT_URL}{audio['src']}",
+          }
+        }
+
+  def load(self, rows) -> None:
+    self.load_users(row["from_user_id"] for row in rows)
+    self.load_attachments(rows)
+
+  def message(self, row, receipts) -> dict:
+    """
+    `receipts`: {id do remetente: (read_id, read_at) de quem recebe}, ver read_receipts_by_sender.
+    """
+    viewed_at = row["viewed_at"]
+
+    if not viewed_at:
+      read_id, read_at = receipts[row["from_user_id"]]
+      viewed_at = read_at if row["id"] <= read_id else None
+
+    return {
+      "id": row["id"],
+      "body": row["body"],
+      "attachment": self.attachments.get((row["attachment_code"], row["attachment_id"])),
+      "from_user": self.users[row["from_user_id"]],
+      "viewed_at": self.format(viewed_at),
+      "created_at": self.format(row["created_at"]),
+    }
+
+
+def read_receipts_by_sender(chat) -> dict:
+  """
+  Confirmação de leitura de quem recebe as mensagens de cada participante
+  (como chats.services.message_viewed_at), a partir de uma linha com CHAT_FIELDS.
+  """
+  return {
+    chat["from_user_id"]: (chat["to_user_read_id"], chat["to_user_read_at"]),
+    chat["to_user_id"]: (chat["from_user_read_id"], chat["from_user_read_at"]),
+  }
+
+
+def serialize_messages(chat, rows) -> list[dict]:
+  """
+  Mensagens de um chat, a partir de linhas com MESSAGE_FIELDS.
+  """
+  serializer = RowSerializer()
+  serializer.load(rows)
+  receipts = read_receipts_by_sender({field: getattr(chat, field) for field in CHAT_FIELDS})
+
+  return [serializer.message(row, receipts) for row in rows]
+
+
+def serialize_chats(chats, user_id) -> list[dict]:
+  """
+  Lista de chats do usuário, a partir de um queryset de Chat, como ChatSerializer(many=True).
+  """
+  chats = list(chats.values(*CHAT_FIELDS))
+  serializer = RowSerializer()
+
+  last_messages = {
+    row["id"]: row
+    for row in ChatMessage.objects.filter(
+      id__in=[chat["last_message_id"] for chat in chats if chat["last_message_id"]]
+    ).values(*MESSAGE_FIELDS)
+  }
+
+  serializer.load_users(
+    participant_id for chat in chats for participant_id in (chat["from_user_id"], chat["to_user_id"])
+  )
+  serializer.load_attachments(last_messages.values())
+
+  results = []
+
+  for chat in chats:
+    last_message = last_messages.get(chat["last_message_id"])
+    other_user_id = chat["to_user_id"] if chat["from_user_id"] == user_id else chat["from_user_id"]
+    prefix = "from_user" if chat["from_user_id"] == user_id else "to_user"
+
+    results.append({
+      "id": chat["id"],
+      "user": serializer.users[other_user_id],
+      "unseen_count": chat[f"{prefix}_unread"],
+      "last_message": (
+        serializer.message(last_message, read_receipts_by_sender(chat))
+        if last_message
+        else None
+      ),
+      "viewed_at": serializer.format(chat["viewed_at"]),
+      "created_at": serializer.format(chat["created_at"]),
+    })
+
+  return results
@@ -0,0 +1,240 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, CharField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat, Replace
+from django.utils.html import escape
+
+from attachments.models import FileAttachment
+from chats.models import Chat, ChatMessage
+
+
+# Configuração de busca textual do PostgreSQL usada pelo gatilho que mantém
+# chat_messages.search_vector (migração 0008) e pelas consultas.
+SEARCH_CONFIG = "portuguese"
+
+SNIPPET_START = "<b>"
+SNIPPET_STOP = "</b>"
+SNIPPET_WORDS = 20
+
+# Marcadores dos termos destacados antes do escape do trecho (ver highlight): caracteres
+# de controle removidos do texto das mensagens, trocados por SNIPPET_START e SNIPPET_STOP.
+MARK_START = "\x02"
+MARK_STOP = "\x03"
+
+WORD = re.compile(r"\w+")
+
+
+def user_chats(user_id):
+  return Chat.objects.filter(
+    Q(from_user_id=user_id) | Q(to_user_id=user_id),
+    deleted_at__isnull=True,
+  ).values("id")
+
+
+def search_messages(user_id, text, limit, offset=0) -> tuple[list[ChatMessage], bool]:
+  """
+  Busca mensagens pelo corpo e pelo nome do arquivo anexado em todos os chats
+  ativos do usuário. Retorna uma página das mensagens encontradas, da mais relevante
+  para a menos relevante, cada uma com `rank` e `snippet`, e se há mais resultados.
+  No PostgreSQL usa o índice GIN de search_vector; nos demais bancos, o InvertedIndex.
+  """
+  if connection.vendor == "postgresql":
+    messages = list(search_postgresql(user_id, text)[offset:offset + limit + 1])
+  else:
+    messages = search_in_memory(user_id, text, offset + limit + 1)[offset:]
+
+  for message in messages:
+    message.snippet = highlight(message.snippet)
+
+  return messages[:limit], len(messages) > limit
+
+
+def strip_marks(text):
+  """
+  Remove do texto os caracteres usados como MARK_START e MARK_STOP.
+  """
+  if isinstance(text, str):
+    return text.replace(MARK_START, "").replace(MARK_STOP, "")
+
+  return Replace(Replace(text, Value(MARK_START), Value("")), Value(MARK_STOP), Value(""))
+
+
+def highlight(snippet) -> str:
+  """
+  Escapa o HTML do trecho (o corpo e o nome do arquivo vêm dos usuários) e só então
+  troca os marcadores pelos destaques, assim `<b>` e `</b>` são as únicas tags do trecho.
+  """
+  return escape(snippet).replace(MARK_START, SNIPPET_START).replace(MARK_STOP, SNIPPET_STOP)
+
+
+def file_name():
+  return Case(
+    When(
+      attachment_code="FILE",
+      then=Subquery(FileAttachment.objects.filter(id=OuterRef("attachment_id")).values("name")[:1]),
+    ),
+    default=Value(""),
+    output_field=CharField(),
+  )
+
+
+def search_postgresql(user_id, text):
+  query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+
+  return (
+    ChatMessage.objects.filter(
+      chat__in=user_chats(user_id),
+      deleted_at__isnull=True,
+      search_vector=query,
+    )
+    .select_related("from_user", "chat")
+    .annotate(
+      rank=SearchRank(F("search_vector"), query),
+      snippet=SearchHeadline(
+        strip_marks(
+          Concat(Coalesce("body", Value("")), Value(" "), file_name(), output_field=CharField())
+        ),
+        query,
+        config=SEARCH_CONFIG,
+        start_sel=MARK_START,
+        stop_sel=MARK_STOP,
+        max_words=SNIPPET_WORDS,
+        min_words=SNIPPET_WORDS // 2,
+      ),
+    )
+    .order_by("-rank", "-id")
+  )
+
+
+def normalize(word) -> str:
+  """
+  Minúsculas e sem acentos, para que "Relatório" e "relatorio" sejam o mesmo termo.
+  """
+  word = unicodedata.normalize("NFKD", word.lower())
+  return "".join(char for char in word if not unicodedata.combining(char))
+
+
+def tokenize(text) -> list[str]:
+  return [normalize(word) for word in WORD.findall(text or "")]
+
+
+def snippet(text, terms) -> str:
+  """
+  Trecho do texto em volta do primeiro termo encontrado, com os termos entre
+  MARK_START e MARK_STOP, como no ts_headline do PostgreSQL (ver highlight).
+  """
+  text = strip_marks(text)
+  words = list(WORD.finditer(text))
+  matches = [index for index, word in enumerate(words) if normalize(word.group()) in terms]
+
+  if not matches:
+    return " ".join(word.group() for word in words[:SNIPPET_WORDS])
+
+  first = max(0, min(matches[0] - SNIPPET_WORDS // 4, len(words) - SNIPPET_WORDS))
+  window = words[first:first + SNIPPET_WORDS]
+  start, end = window[0].start(), window[-1].end()
+
+  return WORD.sub(
+    lambda word: (
+      f"{MARK_START}{word.group()}{MARK_STOP}" if normalize(word.group()) in terms else word.group()
+    ),
+    text[start:end],
+  )
+
+
+class InvertedIndex:
+  """
+  Índice invertido em memória, por processo, usado quando o banco não é o PostgreSQL
+  (desenvolvimento e testes com SQLite).
+
+  As mensagens não são editadas, então o índice só acompanha as novas: a cada busca
+  indexa as mensagens com id maior que o último indexado. Mensagens deletadas e chats
+  fora do alcance do usuário são filtrados no banco, na hora da busca.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.clear()
+
+  def clear(self) -> None:
+    self.postings = defaultdict(dict)
+    self.texts = {}
+    self.last_id = 0
+
+  def refresh(self) -> None:
+    messages = list(
+      ChatMessage.objects.filter(id__gt=self.last_id)
+      .order_by("id")
+      .values("id", "body", "attachment_code", "attachment_id")
+    )
+
+    file_names = FileAttachment.objects.in_bulk(
+      [message["attachment_id"] for message in messages if message["attachment_code"] == "FILE"]
+    )
+
+    for message in messages:
+      file = file_names.get(message["attachment_id"]) if message["attachment_code"] == "FILE" else None
+      text = " ".join(part for part in (message["body"], file and file.name) if part)
+
+      for term in tokenize(text):
+        postings = self.postings[term]
+        postings[message["id"]] = postings.get(message["id"], 0) + 1
+
+      self.texts[message["id"]] = text
+      self.last_id = message["id"]
+
+  def search(self, terms) -> dict[int, float]:
+    """
+    Retorna {id da mensagem: relevância} das mensagens com todos os termos (TF-IDF).
+    """
+    with self.lock:
+      self.refresh()
+
+      postings = [self.postings.get(term, {}) for term in terms]
+
+    if not postings or not all(postings):
+      return {}
+
+    ids = set.intersection(*(set(posting) for posting in postings))
+    total = len(self.texts)
+
+    return {
+      message_id: sum(
+        posting[message_id] * math.log(1 + total / len(posting)) for posting in postings
+      )
+      for message_id in ids
+    }
+
+
+index = InvertedIndex()
+
+
+def search_in_memory(user_id, text, limit) -> list[ChatMessage]:
+  terms = list(dict.fromkeys(tokenize(text)))
+  scores = index.search(terms)
+
+  if not scores:
+    return []
+
+  messages = (
+    ChatMessage.objects.filter(
+      id__in=scores,
+      chat__in=user_chats(user_id),
+      deleted_at__isnull=True,
+    )
+    .select_related("from_user", "chat")
+  )
+
+  messages = sorted(messages, key=lambda message: (-scores[message.id], -message.id))[:limit]
+
+  for message in messages:
+    message.rank = scores[message.id]
+    message.snippet = snippet(index.texts[message.id], set(terms))
+
+  return messages
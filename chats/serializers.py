@@ -1,17 +1,57 @@
 from rest_framework import serializers
-from accounts.serializers import UserSerializer
+from django.db import models
+from accounts.serializers import user_representations
+from chats.cache import message_cache
 from chats.models import Chat, ChatMessage
-from attachments.models import FileAttachment, AudioAttachment
+from chats.services import message_viewed_at, unread_field
+from attachments.loaders import load_attachments
 from attachments.serializers import FileAttachmentSerializer, AudioAttachmentSerializer
+from core.metrics import MeasuredSerializerMixin
 
 
-class ChatSerializer(serializers.ModelSerializer):
+class ChatListSerializer(MeasuredSerializerMixin, serializers.ListSerializer):
+    """
+    Serializa uma lista de chats carregando as últimas mensagens em lote
+    a partir de `Chat.last_message_id`, assim a lista inteira custa um número
+    fixo de consultas. Os anexos são carregados só para as mensagens fora do cache.
+    """
+
+    def to_representation(self, data):
+        chats = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        last_message_ids = [chat.last_message_id for chat in chats if chat.last_message_id]
+
+        last_messages = {}
+        if last_message_ids:
+            last_messages = ChatMessage.objects.select_related("from_user").in_bulk(
+                last_message_ids
+            )
+
+        for chat in chats:
+            chat._last_message = last_messages.get(chat.last_message_id)
+
+        cached_messages = message_cache.get_many(last_messages.values())
+
+        self._context = {
+            **self._context,
+            "cached_messages": cached_messages,
+            "attachments": load_attachments(
+                message for message in last_messages.values() if message.id not in cached_messages
+            ),
+            "users": {},
+        }
+
+        return super().to_representation(chats)
+
+
+class ChatSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
     unseen_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = Chat
+        list_serializer_class = ChatListSerializer
         fields = (
             "id",
             "user",
@@ -26,37 +66,73 @@ class ChatSerializer(serializers.ModelSerializer):
         if user.id == self.context["user_id"]:
             user = chat.to_user
 
-        return UserSerializer(user).data
+        return user_representations.serialize(user, self.context.get("users"))
 
     def get_unseen_count(self, chat):
-        unssen_count = (
-            ChatMessage.objects.filter(
-                chat_id=chat.id, viewed_at__isnull=True, deleted_at__isnull=True
-            )
-            .exclude(from_user=self.context["user_id"])
-            .count()
-        )
-        return unssen_count
+        return getattr(chat, unread_field(chat, self.context["user_id"]))
 
     def get_last_message(self, chat):
-        last_message = (
-            ChatMessage.objects.filter(chat_id=chat.id, deleted_at__isnull=True)
-            .order_by("-created_at")
-            .first()
-        )
+        if hasattr(chat, "_last_message"):
+            last_message = chat._last_message
+        else:
+            last_message = chat.last_message
 
         if not last_message:
             return None
 
-        return ChatMessageSerializer(last_message).data
+        return ChatMessageSerializer(
+            last_message,
+            context={
+                "attachments": self.context.get("attachments"),
+                "cached_messages": self.context.get("cached_messages"),
+                "users": self.context.get("users"),
+                "chat": chat,
+            },
+        ).data
+
+
+class ChatMessageListSerializer(MeasuredSerializerMixin, serializers.ListSerializer):
+    """
+    Serializa uma lista de mensagens carregando os anexos em lote,
+    com no máximo uma consulta por tipo de anexo, só para as mensagens fora do cache.
+    Cada usuário é serializado uma vez por lista (`users`, ver user_representations).
+    """
+
+    def to_representation(self, data):
+        messages = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        cached_messages = message_cache.get_many(messages)
+
+        self._context = {
+            **self._context,
+            "cached_messages": cached_messages,
+            "attachments": load_attachments(
+                message for message in messages if message.id not in cached_messages
+            ),
+            "users": {},
+        }
+
+        return super().to_representation(messages)
+
+
+class ChatMessageSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
+    """
+    `viewed_at` vem da confirmação de leitura do chat, informado no contexto em `chat`
+    (sem ele, usa `message.chat`).
+    Os demais campos vêm do message_cache (chats/cache.py) quando a mesma versão da
+    mensagem já foi serializada; em listas, a consulta ao cache é feita em lote e
+    informada no contexto em `cached_messages`.
+    """
 
+    # Campos montados a cada leitura, fora do cache.
+    per_read_fields = ("from_user", "viewed_at")
 
-class ChatMessageSerializer(serializers.ModelSerializer):
     from_user = serializers.SerializerMethodField()
     attachment = serializers.SerializerMethodField()
-    
+    viewed_at = serializers.SerializerMethodField()
+
     class Meta:
         model = ChatMessage
+        list_serializer_class = ChatMessageListSerializer
         fields = (
             "id",
             "body",
@@ -65,32 +141,60 @@ class ChatMessageSerializer(serializers.ModelSerializer):
             "viewed_at",
             "created_at",
         )
-        
+
+    def to_representation(self, message):
+        cached_messages = self.context.get("cached_messages")
+
+        if cached_messages is None:
+            cached = message_cache.get(message)
+        else:
+            cached = cached_messages.get(message.id)
+
+        if cached is None:
+            data = super().to_representation(message)
+            message_cache.set(
+                message,
+                {field: value for field, value in data.items() if field not in self.per_read_fields},
+            )
+            return data
+
+        return {
+            field: (
+                getattr(self, f"get_{field}")(message)
+                if field in self.per_read_fields
+                else cached[field]
+            )
+            for field in self.Meta.fields
+        }
+
     def get_from_user(self, message):
-       return UserSerializer(message.from_user).data
+        return user_representations.serialize(message.from_user, self.context.get("users"))
+
+    def get_viewed_at(self, message):
+        viewed_at = message_viewed_at(self.context.get("chat") or message.chat, message)
+
+        if viewed_at is None:
+            return None
+
+        return serializers.DateTimeField().to_representation(viewed_at)
 
     def get_attachment(self, message):
-      
+        attachments = self.context.get("attachments")
+
+        if attachments is None:
+            attachments = load_attachments([message])
+
+        attachment = attachments.get((message.attachment_code, message.attachment_id))
+
+        if not attachment:
+            return None
+
         if message.attachment_code == "FILE":
-          file_attachment = FileAttachment.objects.filter(
-              id=message.attachment_id
-          ).first()
-          
-          if not file_attachment:
-              return None
-            
           return {
-            "file": FileAttachmentSerializer(file_attachment).data
+            "file": FileAttachmentSerializer(attachment).data
           }
-      
+
         if message.attachment_code == "AUDIO":
-          audio_attachment = AudioAttachment.objects.filter(
-              id=message.attachment_id
-          ).first()
-          
-          if not audio_attachment:
-              return None
-            
           return {
-            "audio": AudioAttachmentSerializer(audio_attachment).data
-          }
\ No newline at end of file
+            "audio": AudioAttachmentSerializer(attachment).data
+          }
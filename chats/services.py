@@ -0,0 +1,385 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import (
+  BigIntegerField,
+  Case,
+  Count,
+  DateTimeField,
+  F,
+  IntegerField,
+  OuterRef,
+  PositiveBigIntegerField,
+  PositiveIntegerField,
+  Q,
+  Subquery,
+  Value,
+  When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.timezone import now
+
+from attachments.blobs import BlobStorage
+from attachments.models import AudioAttachment, ChunkedUpload, FileAttachment
+from attachments.thumbnails import generate_file_thumbnails
+from attachments.uploads import ChunkedUploadService
+from attachments.validators import validate_file
+from chats.models import Chat, ChatMessage
+from core.exceptions import ValidationError
+
+
+def user_chats(user_id):
+  """
+  Chats ativos do usuário, como remetente ou destinatário.
+  """
+  return Chat.objects.filter(
+    Q(from_user_id=user_id) | Q(to_user_id=user_id),
+    deleted_at__isnull=True,
+  )
+
+
+def participant(chat, user_id) -> str:
+  """
+  Retorna o prefixo dos campos do participante informado ("from_user" ou "to_user").
+  """
+  return "from_user" if chat.from_user_id == user_id else "to_user"
+
+
+def recipient(chat, sender_id) -> str:
+  """
+  Retorna o prefixo dos campos de quem recebe uma mensagem de sender_id.
+  """
+  return "to_user" if chat.from_user_id == sender_id else "from_user"
+
+
+def unread_field(chat, user_id) -> str:
+  """
+  Retorna o nome do contador de não lidas do participante informado.
+  """
+  return f"{participant(chat, user_id)}_unread"
+
+
+def recipient_unread_field(chat, sender_id) -> str:
+  """
+  Retorna o nome do contador de não lidas de quem recebe uma mensagem de sender_id.
+  """
+  return f"{recipient(chat, sender_id)}_unread"
+
+
+def is_read(chat, message) -> bool:
+  """
+  Indica se a mensagem já foi lida por quem a recebeu, pela confirmação de leitura do chat.
+  """
+  return message.id <= getattr(chat, f"{recipient(chat, message.from_user_id)}_read_id")
+
+
+def message_viewed_at(chat, message):
+  """
+  Retorna quando a mensagem foi lida por quem a recebeu, ou None.
+  Mensagens lidas antes da confirmação de leitura por chat mantêm o próprio viewed_at.
+  """
+  if message.viewed_at:
+    return message.viewed_at
+
+  if is_read(chat, message):
+    return getattr(chat, f"{recipient(chat, message.from_user_id)}_read_at")
+
+  return None
+
+
+def read_receipts(chat) -> list[dict]:
+  """
+  Retorna a confirmação de leitura de cada participante do chat.
+  """
+  return [
+    {
+      "user_id": getattr(chat, f"{prefix}_id"),
+      "message_id": getattr(chat, f"{prefix}_read_id"),
+      "read_at": getattr(chat, f"{prefix}_read_at"),
+    }
+    for prefix in ("from_user", "to_user")
+  ]
+
+
+def mark_messages_as_read(chat, user_id) -> bool:
+  """
+  Marca como lidas as mensagens do chat recebidas pelo usuário, avançando a confirmação
+  de leitura dele até a última mensagem, e zera o seu contador de não lidas.
+  É no máximo uma escrita na linha do chat, independente da quantidade de mensagens, e
+  nenhuma se já estava tudo lido. O horário da leitura só muda se havia mensagens não lidas.
+  Retorna se a confirmação de leitura mudou. `chat` é atualizado em memória.
+  """
+  prefix = participant(chat, user_id)
+  read_id, read_at, unread = f"{prefix}_read_id", f"{prefix}_read_at", f"{prefix}_unread"
+  viewed_at = now()
+
+  if not getattr(chat, unread) and getattr(chat, read_id) >= (chat.last_message_id or 0):
+    return False
+
+  # O filtro repete a verificação no banco, caso `chat` tenha sido lido antes de uma
+  # leitura concorrente.
+  changed = Chat.objects.filter(
+    Q(**{f"{unread}__gt": 0}) | Q(**{f"{read_id}__lt": Coalesce(F("last_message"), Value(0))}),
+    id=chat.id,
+  ).update(**{
+    read_id: Greatest(
+      F(read_id),
+      Coalesce(F("last_message"), Value(0)),
+      output_field=PositiveBigIntegerField(),
+    ),
+    read_at: Case(
+      When(**{f"{unread}__gt": 0}, then=Value(viewed_at)),
+      default=F(read_at),
+      output_field=DateTimeField(),
+    ),
+    unread: 0,
+  })
+
+  if not changed:
+    return False
+
+  setattr(chat, read_id, max(getattr(chat, read_id), chat.last_message_id or 0))
+
+  if getattr(chat, unread):
+    setattr(chat, read_at, viewed_at)
+
+  setattr(chat, unread, 0)
+
+  return True
+
+
+def create_message(chat, user_id, body=None, file=None, audio=None, upload_id=None) -> ChatMessage:
+  """
+  Valida e grava uma mensagem de `user_id` no chat, com o anexo enviado (`file` ou
+  `audio`) ou já enviado em partes (`upload_id`), e atualiza os campos
+  desnormalizados do chat. Usada pela API (ChatMessagesView) e pelo socket
+  (evento send_message). Lança ValidationError se a mensagem for inválida.
+  """
+  if body is not None and not isinstance(body, str):
+    raise ValidationError("Corpo da mensagem inválido.")
+
+  if not body and not file and not audio and not upload_id:
+    raise ValidationError("O corpo da mensagem não pode estar vazio.")
+
+  attachment = None
+  attachment_code = None
+  attachment_id = None
+
+  if upload_id:
+    upload = ChunkedUploadService().get_completed(upload_id, user_id)
+    attachment_code = upload.attachment_code
+    attachment_id = upload.attachment_id
+
+  elif file:
+    name = file.name.split(".")[0]
+    extension = file.name.split(".")[-1]
+
+    validate_file(file.size, extension, file.content_type)
+
+    blob = BlobStorage().save(file, extension)
+
+    attachment = FileAttachment.objects.create(
+      name=name,
+      extension=extension,
+      size=file.size,
+      src=blob.src,
+      content_type=file.content_type,
+    )
+    generate_file_thumbnails(attachment)
+    attachment_code = "FILE"
+
+  elif audio:
+    blob = BlobStorage().save(audio, "mp3")
+
+    attachment = AudioAttachment.objects.create(src=blob.src)
+    attachment_code = "AUDIO"
+
+  if attachment:
+    attachment_id = attachment.id
+
+  message = ChatMessage.objects.create(
+    chat_id=chat.id,
+    from_user_id=user_id,
+    body=body,
+    attachment_code=attachment_code,
+    attachment_id=attachment_id,
+  )
+
+  register_new_message(chat, message)
+
+  return message
+
+
+def register_new_message(chat, message) -> None:
+  register_new_messages(chat, [message])
+
+
+def register_new_messages(chat, messages) -> None:
+  """
+  Atualiza a última mensagem do chat e incrementa os contadores dos destinatários
+  em uma única instrução, sem depender dos valores já carregados em `chat`.
+  """
+  newest = max(messages, key=lambda message: (message.created_at, message.id))
+  is_newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=newest.created_at)
+
+  counts = Counter(recipient_unread_field(chat, message.from_user_id) for message in messages)
+
+  Chat.objects.filter(id=chat.id).update(
+    viewed_at=now(),
+    last_message=Case(
+      When(is_newer, then=Value(newest.id)),
+      default=F("last_message"),
+      output_field=BigIntegerField(),
+    ),
+    last_message_at=Case(
+      When(is_newer, then=Value(newest.created_at)),
+      default=F("last_message_at"),
+      output_field=DateTimeField(),
+    ),
+    **{field: F(field) + count for field, count in counts.items()},
+  )
+
+
+def register_deleted_message(chat, message) -> None:
+  register_deleted_messages(chat, [message])
+
+
+def register_deleted_messages(chat, messages) -> None:
+  """
+  Ajusta os campos desnormalizados do chat após a exclusão de mensagens, em uma
+  única instrução: decrementa o contador do destinatário pelas mensagens que não
+  tinham sido lidas e, se a última mensagem foi deletada, aponta para a mensagem
+  ativa anterior.
+  """
+  ids = [message.id for message in messages]
+  latest = ChatMessage.objects.filter(
+    chat_id=chat.id, deleted_at__isnull=True
+  ).order_by("-created_at", "-id")
+
+  changes = {
+    "last_message": Case(
+      When(last_message_id__in=ids, then=Subquery(latest.values("id")[:1])),
+      default=F("last_message"),
+      output_field=BigIntegerField(),
+    ),
+    "last_message_at": Case(
+      When(last_message_id__in=ids, then=Subquery(latest.values("created_at")[:1])),
+      default=F("last_message_at"),
+      output_field=DateTimeField(),
+    ),
+  }
+
+  counts = Counter(
+    recipient_unread_field(chat, message.from_user_id)
+    for message in messages
+    if not is_read(chat, message)
+  )
+
+  for field, count in counts.items():
+    changes[field] = Greatest(F(field) - count, Value(0), output_field=PositiveIntegerField())
+
+  Chat.objects.filter(id=chat.id).update(**changes)
+
+
+def unread_messages_count(participant):
+  """
+  Subconsulta, para um queryset de Chat, com a quantidade de mensagens ativas do outro
+  participante depois da confirmação de leitura de `participant` ("from_user" ou "to_user").
+  """
+  return Coalesce(
+    Subquery(
+      ChatMessage.objects.filter(
+        chat=OuterRef("pk"),
+        id__gt=OuterRef(f"{participant}_read_id"),
+        deleted_at__isnull=True,
+      )
+      .exclude(from_user=OuterRef(participant))
+      .order_by()
+      .values("chat")
+      .annotate(count=Count("id"))
+      .values("count"),
+      output_field=IntegerField(),
+    ),
+    Value(0),
+  )
+
+
+def latest_active_messages():
+  """
+  Mensagens ativas do chat de um queryset de Chat, da mais recente para a mais antiga.
+  """
+  return ChatMessage.objects.filter(
+    chat=OuterRef("pk"), deleted_at__isnull=True
+  ).order_by("-created_at", "-id")
+
+
+def reconcile_counters(chats) -> int:
+  """
+  Recalcula em lote, a partir de chat_messages, a última mensagem e os contadores
+  de não lidas dos chats do queryset. Retorna a quantidade de chats atualizados.
+  """
+  latest = latest_active_messages()
+
+  return chats.update(
+    last_message=Subquery(latest.values("id")[:1]),
+    last_message_at=Subquery(latest.values("created_at")[:1]),
+    from_user_unread=unread_messages_count("from_user"),
+    to_user_unread=unread_messages_count("to_user"),
+  )
+
+
+def purge_deleted_messages(before, batch_size=1000) -> int:
+  """
+  Apaga do banco as mensagens deletadas antes de `before` e os anexos que ficaram
+  sem mensagens (com os envios em partes que os criaram), devolvendo as referências
+  dos blobs desses anexos. Os blobs que ficarem sem referências são apagados por
+  BlobStorage.collect_garbage. Retorna a quantidade de mensagens apagadas.
+  """
+  total = 0
+
+  while True:
+    with transaction.atomic():
+      messages = list(
+        ChatMessage.objects.filter(deleted_at__lt=before)
+        .order_by("id")
+        .values("id", "attachment_code", "attachment_id")[:batch_size]
+      )
+
+      if not messages:
+        return total
+
+      ChatMessage.objects.filter(id__in=[message["id"] for message in messages]).delete()
+
+      released = []
+
+      for attachment_code, model in (("FILE", FileAttachment), ("AUDIO", AudioAttachment)):
+        ids = {
+          message["attachment_id"]
+          for message in messages
+          if message["attachment_code"] == attachment_code
+        }
+
+        # Um envio em partes pode ter sido usado em mais de uma mensagem.
+        orphans = list(
+          model.objects.filter(id__in=ids)
+          .exclude(
+            id__in=ChatMessage.objects.filter(
+              attachment_code=attachment_code, attachment_id__in=ids
+            ).values("attachment_id")
+          )
+          .values_list("id", "src")
+        )
+
+        if not orphans:
+          continue
+
+        orphan_ids = [attachment_id for attachment_id, _ in orphans]
+        ChunkedUpload.objects.filter(
+          attachment_code=attachment_code, attachment_id__in=orphan_ids
+        ).delete()
+        model.objects.filter(id__in=orphan_ids).delete()
+        released += [src for _, src in orphans]
+
+      BlobStorage().release(released)
+
+    total += len(messages)
@@ -1,3 +1,1328 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import socketio
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.postgresql import base as postgresql_base
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from accounts.presence import presence
+from accounts.serializers import user_representations
+from attachments.thumbnails import record_file
+from attachments.models import AudioAttachment, FileAttachment
+from chats.cache import message_cache
+from chats.management.commands.explain_hot_queries import Command as ExplainHotQueriesCommand
+from chats.models import Chat, ChatMessage
+from chats import search
+from chats.services import reconcile_counters
+from chats.views.chats import ChatsView
+from chats.views.messages import ChatMessagesView
+from core import metrics
+from core.db_pool import ConnectionPool, PoolTimeout
+from core.postgresql.base import DatabaseWrapper as PooledDatabaseWrapper
+from core.socket import (
+    EmitBuffer,
+    connect,
+    disconnect,
+    emit_to_chat,
+    emit_to_users,
+    get_presence,
+    send_message,
+    socket,
+    update_messages_as_read,
+)
+from core.socket_managers import UnixSocketManager, run_broker
+
+
+class ChatsViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_chats(self, total):
+        for _ in range(total):
+            index = User.objects.count()
+            to_user = User.objects.create(
+                name=f"Contato {index}", email=f"contato{index}@email.com"
+            )
+            chat = Chat.objects.create(from_user=self.user, to_user=to_user)
+
+            file = FileAttachment.objects.create(
+                name="arquivo", extension="pdf", size=1024, src="/media/files/a.pdf",
+                content_type="application/pdf",
+            )
+            audio = AudioAttachment.objects.create(src="/media/audios/a.mp3")
+
+            ChatMessage.objects.create(chat=chat, from_user=to_user, body="Olá")
+            ChatMessage.objects.create(
+                chat=chat, from_user=to_user, attachment_code="FILE", attachment_id=file.id
+            )
+            ChatMessage.objects.create(
+                chat=chat, from_user=to_user, attachment_code="AUDIO", attachment_id=audio.id
+            )
+
+        reconcile_counters(Chat.objects.all())
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/v1/chats/")
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data["results"]
+
+    def test_list_chats_runs_constant_number_of_queries(self):
+        self.create_chats(2)
+        queries_with_few_chats, results = self.count_queries()
+
+        self.create_chats(20)
+        queries_with_many_chats, results = self.count_queries()
+
+        self.assertEqual(len(results), 22)
+        self.assertEqual(queries_with_few_chats, queries_with_many_chats)
+        self.assertLessEqual(queries_with_many_chats, 8)
+
+    def test_unchanged_chat_list_returns_not_modified(self):
+        self.create_chats(2)
+        etag = self.client.get("/api/v1/chats/")["ETag"]
+
+        response = self.client.get("/api/v1/chats/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # O ETag é do usuário: outro usuário com o mesmo ETag recebe a própria lista.
+        other = APIClient()
+        other.force_authenticate(User.objects.exclude(id=self.user.id).first())
+        self.assertEqual(other.get("/api/v1/chats/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        User.objects.exclude(id=self.user.id).update(name="Novo nome")
+        response = self.client.get("/api/v1/chats/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["user"]["name"], "Novo nome")
+
+        Chat.objects.filter(id=response.data["results"][0]["id"]).update(deleted_at=now())
+        response = self.client.get("/api/v1/chats/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_list_chats_returns_unseen_count_and_last_message(self):
+        self.create_chats(1)
+        _, results = self.count_queries()
+
+        chat = results[0]
+        self.assertEqual(chat["unseen_count"], 3)
+        self.assertEqual(chat["user"]["email"], "contato1@email.com")
+        self.assertEqual(chat["last_message"]["attachment"]["audio"]["src"][-5:], "a.mp3")
+
+
+class ChatMessagesViewTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        self.messages = [
+            ChatMessage.objects.create(chat=self.chat, from_user=self.to_user, body=str(index))
+            for index in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/chats/messages/{self.chat.id}"
+
+    def bodies(self, response):
+        return [message["body"] for message in response.data["results"]]
+
+    def test_list_messages_paginates_with_before_and_after_cursors(self):
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(self.bodies(response), ["4", "5", "6"])
+        self.assertTrue(response.data["has_more"])
+
+        response = self.client.get(self.url, {"limit": 3, "before": response.data["before"]})
+        self.assertEqual(self.bodies(response), ["1", "2", "3"])
+
+        response = self.client.get(self.url, {"limit": 3, "before": response.data["before"]})
+        self.assertEqual(self.bodies(response), ["0"])
+        self.assertFalse(response.data["has_more"])
+
+        response = self.client.get(self.url, {"limit": 3, "after": response.data["after"]})
+        self.assertEqual(self.bodies(response), ["1", "2", "3"])
+
+    def test_list_messages_loads_attachments_in_bulk(self):
+        def create_attachments(total):
+            for _ in range(total):
+                file = FileAttachment.objects.create(
+                    name="arquivo", extension="pdf", size=1024, src="/media/files/a.pdf",
+                    content_type="application/pdf",
+                )
+                audio = AudioAttachment.objects.create(src="/media/audios/a.mp3")
+                ChatMessage.objects.create(
+                    chat=self.chat, from_user=self.user, attachment_code="FILE", attachment_id=file.id
+                )
+                ChatMessage.objects.create(
+                    chat=self.chat, from_user=self.to_user, attachment_code="AUDIO", attachment_id=audio.id
+                )
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.url)
+            return len(context.captured_queries), response.data["results"]
+
+        create_attachments(1)
+        queries_with_few_attachments, _ = count_queries()
+
+        create_attachments(10)
+        queries_with_many_attachments, results = count_queries()
+
+        self.assertEqual(queries_with_few_attachments, queries_with_many_attachments)
+        self.assertEqual(results[-1]["attachment"]["audio"]["src"][-5:], "a.mp3")
+        self.assertEqual(results[-2]["attachment"]["file"]["name"], "arquivo")
+
+    def test_list_messages_caps_page_size(self):
+        response = self.client.get(self.url, {"limit": 1000})
+        self.assertEqual(len(response.data["results"]), 7)
+
+        response = self.client.get(self.url, {"before": "cursor-invalido"})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(MESSAGE_SYNC_WINDOW_SECONDS=0)
+    def test_list_messages_since_returns_only_changes(self):
+        since = self.client.get(self.url).data["since"]
+
+        response = self.client.get(self.url, {"since": since})
+        self.assertEqual(response.data["results"], [])
+
+        new_message = ChatMessage.objects.create(
+            chat=self.chat, from_user=self.to_user, body="nova"
+        )
+        ChatMessage.objects.filter(id=self.messages[1].id).update(
+            deleted_at=new_message.created_at, updated_at=new_message.created_at
+        )
+
+        response = self.client.get(self.url, {"since": since})
+        self.assertEqual(self.bodies(response), ["nova"])
+        self.assertEqual(response.data["deleted"], [self.messages[1].id])
+
+    def test_changes_committed_late_are_delivered_by_the_next_sync(self):
+        since = self.client.get(self.url).data["since"]
+
+        # Gravada com um updated_at anterior à última sincronização, como uma transação
+        # que começou antes dela e terminou depois.
+        late = ChatMessage.objects.create(chat=self.chat, from_user=self.to_user, body="atrasada")
+        ChatMessage.objects.filter(id=late.id).update(updated_at=self.messages[0].updated_at)
+
+        response = self.client.get(self.url, {"since": since})
+        self.assertIn("atrasada", self.bodies(response))
+
+        # Fora da janela, o cursor avança até a última alteração.
+        with override_settings(MESSAGE_SYNC_WINDOW_SECONDS=0):
+            since = self.client.get(self.url, {"since": since}).data["since"]
+
+        self.assertEqual(self.client.get(self.url, {"since": since}).data["results"], [])
+
+    def test_unchanged_messages_return_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+        self.assertFalse(
+            any("chat_messages" in query["sql"] and "LIMIT 51" in query["sql"]
+                for query in context.captured_queries)
+        )
+
+        # Outra página tem outro ETag.
+        self.assertEqual(self.client.get(self.url, {"limit": 3}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Nova mensagem, leitura pelo outro participante e miniaturas mudam a versão.
+        self.client.post(self.url, {"body": "nova"})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        other = APIClient()
+        other.force_authenticate(self.to_user)
+        other.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data["results"][-1]["viewed_at"])
+        etag = response["ETag"]
+
+        file = FileAttachment.objects.create(
+            name="foto", extension="png", size=1024, src="/media/files/a.png", content_type="image/png",
+        )
+        ChatMessage.objects.filter(id=self.messages[0].id).update(
+            attachment_code="FILE", attachment_id=file.id
+        )
+        record_file(file.id, {"small": {"src": "/media/a/small.webp", "width": 1, "height": 1}})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("small", response.data["results"][0]["attachment"]["file"]["thumbnails"])
+
+    def test_polling_read_chat_does_not_write_or_emit(self):
+        reconcile_counters(Chat.objects.all())
+
+        with mock.patch("chats.views.messages.emit_to_users") as emit:
+            etag = self.client.get(self.url)["ETag"]
+            self.assertEqual(emit.call_count, 1)
+
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(emit.call_count, 1)
+        self.assertFalse(
+            any(query["sql"].startswith("UPDATE") for query in context.captured_queries)
+        )
+
+    def test_serialized_messages_are_cached_by_version(self):
+        self.addCleanup(message_cache.clear)
+        message_cache.clear()
+
+        file = FileAttachment.objects.create(
+            name="arquivo", extension="pdf", size=1024, src="/media/files/a.pdf",
+            content_type="application/pdf",
+        )
+        message = ChatMessage.objects.create(
+            chat=self.chat, from_user=self.to_user, attachment_code="FILE", attachment_id=file.id
+        )
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(self.url)
+            return len(context.captured_queries), response.data["results"]
+
+        queries_without_cache, results = count_queries()
+        queries_with_cache, cached_results = count_queries()
+
+        # O anexo não é consultado de novo; from_user e viewed_at continuam atuais.
+        self.assertEqual(queries_with_cache, queries_without_cache - 1)
+        self.assertEqual(cached_results, results)
+        self.assertEqual(list(cached_results[-1]), list(results[-1]))
+
+        # A edição muda updated_at e, com ele, a versão em cache.
+        ChatMessage.objects.filter(id=message.id).update(body="editada", updated_at=now())
+        _, results = count_queries()
+        self.assertEqual(results[-1]["body"], "editada")
+
+        # A lista de chats reaproveita a última mensagem serializada.
+        self.chat.last_message = message
+        self.chat.save()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/v1/chats/")
+        self.assertEqual(response.data["results"][0]["last_message"]["body"], "editada")
+        self.assertFalse(
+            any("attachments" in query["sql"] for query in context.captured_queries)
+        )
+
+
+class ChatSearchTestCase(TestCase):
+
+    def setUp(self):
+        search.index.clear()
+        self.addCleanup(search.index.clear)
+
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.other_user = User.objects.create(name="Outro", email="outro@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        self.second_chat = Chat.objects.create(from_user=self.other_user, to_user=self.user)
+        self.foreign_chat = Chat.objects.create(from_user=self.other_user, to_user=self.to_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def message(self, chat, body, **fields):
+        return ChatMessage.objects.create(chat=chat, from_user=chat.from_user, body=body, **fields)
+
+    def search(self, text, **params):
+        response = self.client.get("/api/v1/chats/search", {"q": text, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_search_ranks_hits_across_user_chats(self):
+        once = self.message(self.chat, "Segue o orçamento da viagem")
+        twice = self.message(self.second_chat, "Orçamento aprovado, o orçamento final vai amanhã")
+        self.message(self.foreign_chat, "Orçamento de outra conversa")
+        self.message(self.chat, "Orçamento apagado", deleted_at=now())
+        self.message(self.chat, "Sem relação")
+
+        data = self.search("orcamento")
+
+        self.assertEqual([hit["message"]["id"] for hit in data["results"]], [twice.id, once.id])
+        self.assertEqual(data["results"][0]["chat_id"], self.second_chat.id)
+        self.assertIn("<b>orçamento</b>", data["results"][1]["snippet"])
+
+    def test_search_matches_attachment_names_and_paginates(self):
+        file = FileAttachment.objects.create(
+            name="Relatório anual", extension="pdf", size=1024, src="/media/files/a.pdf",
+            content_type="application/pdf",
+        )
+        attached = self.message(self.chat, "Segue", attachment_code="FILE", attachment_id=file.id)
+        mentioned = self.message(self.chat, "Você leu o relatório?")
+
+        first_page = self.search("relatorio", limit=1)
+        self.assertTrue(first_page["has_more"])
+
+        second_page = self.search("relatorio", limit=1, offset=first_page["next_offset"])
+        self.assertFalse(second_page["has_more"])
+
+        self.assertCountEqual(
+            [hit["message"]["id"] for hit in first_page["results"] + second_page["results"]],
+            [attached.id, mentioned.id],
+        )
+
+    def test_search_requires_a_term(self):
+        response = self.client.get("/api/v1/chats/search", {"q": " "})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_snippet_escapes_message_html(self):
+        self.message(self.chat, 'Veja <img src=x onerror="alert(1)"> \x02orçamento\x03 <b>aqui</b>')
+
+        snippet = self.search("orcamento")["results"][0]["snippet"]
+
+        self.assertNotIn("<img", snippet)
+        self.assertNotIn("\x02", snippet)
+        self.assertIn("&lt;img src=x onerror=&quot;alert(1)&quot;&gt;", snippet)
+        self.assertIn("<b>orçamento</b>", snippet)
+        self.assertIn("&lt;b&gt;aqui&lt;/b", snippet)
+
+    def test_search_serializes_hits_in_batch(self):
+        file = FileAttachment.objects.create(
+            name="proposta.pdf", extension="pdf", size=1024, src="/media/files/p.pdf",
+            content_type="application/pdf",
+        )
+
+        for chat in (self.chat, self.second_chat):
+            for _ in range(5):
+                self.message(chat, "Nova proposta")
+                self.message(chat, "Proposta", attachment_code="FILE", attachment_id=file.id)
+
+        message_cache.clear()
+        user_representations.clear()
+
+        # Savepoint da requisição (2), índice invertido (2), busca e anexos, com 20 resultados.
+        with self.assertNumQueries(6):
+            self.assertEqual(len(self.search("proposta", limit=50)["results"]), 20)
+
+
+class ChatCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        self.client = APIClient()
+        self.to_user_client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.to_user_client.force_authenticate(self.to_user)
+        self.url = f"/api/v1/chats/messages/{self.chat.id}"
+
+    def test_counters_follow_posts_reads_and_deletes(self):
+        first = self.client.post(self.url, {"body": "1"}).data["result"]
+        second = self.client.post(self.url, {"body": "2"}).data["result"]
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 2)
+        self.assertEqual(self.chat.from_user_unread, 0)
+        self.assertEqual(self.chat.last_message_id, second["id"])
+
+        self.client.delete(f"/api/v1/chats/{self.chat.id}/messages/{second['id']}/")
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 1)
+        self.assertEqual(self.chat.last_message_id, first["id"])
+
+        self.to_user_client.post(self.url, {"body": "3"})
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 0)
+        self.assertEqual(self.chat.from_user_unread, 1)
+
+        chats = self.client.get("/api/v1/chats/").data["results"]
+        self.assertEqual(chats[0]["unseen_count"], 1)
+        self.assertEqual(chats[0]["last_message"]["body"], "3")
+
+    @override_settings(MESSAGE_SYNC_WINDOW_SECONDS=0)
+    def test_reading_a_chat_moves_the_watermark_with_one_write(self):
+        for body in ("1", "2", "3"):
+            self.client.post(self.url, {"body": body})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.to_user_client.get(self.url)
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"chats"', updates[0])
+        self.assertEqual(ChatMessage.objects.filter(viewed_at__isnull=False).count(), 0)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_read_id, self.chat.last_message_id)
+        self.assertEqual(self.chat.to_user_unread, 0)
+        self.assertTrue(all(message["viewed_at"] for message in response.data["results"]))
+
+        self.to_user_client.post(self.url, {"body": "4"})
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.from_user_unread, 1)
+        self.assertLess(self.chat.from_user_read_id, self.chat.last_message_id)
+
+        response = self.client.get(self.url, {"since": response.data["since"]})
+
+        self.assertEqual([message["body"] for message in response.data["results"]], ["4"])
+        self.chat.refresh_from_db()
+        self.assertEqual(
+            {receipt["user_id"]: receipt["message_id"] for receipt in response.data["read"]},
+            {self.user.id: self.chat.last_message_id, self.to_user.id: self.chat.to_user_read_id},
+        )
+
+        # Uma nova leitura sem mensagens novas não muda o horário da confirmação.
+        read_at = self.chat.to_user_read_at
+        self.to_user_client.get(self.url)
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_read_at, read_at)
+
+    def test_batch_send_and_delete_write_in_a_fixed_number_of_queries(self):
+        def send(total):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    f"{self.url}/batch",
+                    {"messages": [{"body": str(index)} for index in range(total)]},
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 201)
+            return len(queries), response.data["result"]
+
+        send(1)
+        queries_for_few, _ = send(2)
+        queries_for_many, messages = send(20)
+
+        self.assertEqual(queries_for_few, queries_for_many)
+        self.assertEqual([message["body"] for message in messages], [str(index) for index in range(20)])
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 23)
+        self.assertEqual(self.chat.last_message_id, messages[-1]["id"])
+
+        ids = [message["id"] for message in messages[-5:]]
+        other = ChatMessage.objects.create(chat=self.chat, from_user=self.to_user, body="outro")
+
+        # Mensagens de outro usuário não podem ser deletadas: nada é deletado.
+        response = self.client.delete(f"{self.url}/batch", {"ids": ids + [other.id]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChatMessage.objects.filter(deleted_at__isnull=False).count(), 0)
+        other.delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f"{self.url}/batch", {"ids": ids}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len([query for query in queries if query["sql"].startswith("UPDATE")]), 2
+        )
+        self.assertEqual(ChatMessage.objects.filter(deleted_at__isnull=False).count(), 5)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 18)
+        self.assertEqual(self.chat.last_message_id, messages[-6]["id"])
+
+    def test_batch_validates_every_message_before_writing(self):
+        response = self.client.post(
+            f"{self.url}/batch",
+            {"messages": [{"body": "1"}, {"body": ""}, {"upload_id": "inexistente"}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(MESSAGE_BATCH_MAX_SIZE=2):
+            response = self.client.post(
+                f"{self.url}/batch", {"messages": [{"body": "1"}] * 3}, format="json"
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_reconcile_command_fixes_drift(self):
+        self.client.post(self.url, {"body": "1"})
+        Chat.objects.update(to_user_unread=42, last_message=None)
+
+        call_command("reconcile_chat_counters", batch_size=1, stdout=io.StringIO())
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.to_user_unread, 1)
+        self.assertIsNotNone(self.chat.last_message_id)
+
+
+class FakeEngineSocket:
+    closed = False
+
+    def __init__(self, sent):
+        self.session = {}
+        self.sent = sent
+
+    def send(self, packet):
+        self.sent.append((self, packet))
+
+
+class ChatSocketRoomsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.other_user = User.objects.create(name="Outro", email="outro@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.connections = []
+        self.sent = []
+        self.addCleanup(presence.connections.clear)
+
+    def tearDown(self):
+        for sid, eio_sid in self.connections:
+            socket.manager.disconnect(sid, "/")
+            socket.eio.sockets.pop(eio_sid, None)
+
+    def connect_user(self, user):
+        eio_sid = f"eio-{user.id}-{len(self.connections)}"
+        socket.eio.sockets[eio_sid] = FakeEngineSocket(self.sent)
+        sid = socket.manager.connect(eio_sid, "/")
+        connect(sid, {}, {"token": str(AccessToken.for_user(user))})
+        self.connections.append((sid, eio_sid))
+        return sid, eio_sid
+
+    def received(self, event):
+        eio_sids = {
+            engine_socket: eio_sid for eio_sid, engine_socket in socket.eio.sockets.items()
+        }
+        return [
+            eio_sids[engine_socket]
+            for engine_socket, packet in self.sent
+            if json.loads(packet.data[packet.data.index("["):])[0] == event
+        ]
+
+    def test_connect_joins_user_and_chat_rooms(self):
+        sid, _ = self.connect_user(self.user)
+
+        self.assertIn(f"user:{self.user.id}", socket.rooms(sid))
+        self.assertIn(f"chat:{self.chat.id}", socket.rooms(sid))
+
+    def test_connect_without_token_is_refused(self):
+        with self.assertRaises(socketio.exceptions.ConnectionRefusedError):
+            connect("sid", {}, {})
+
+    def test_new_message_is_sent_only_to_chat_participants(self):
+        sender_sid, sender_eio = self.connect_user(self.user)
+        _, to_user_eio = self.connect_user(self.to_user)
+        _, other_eio = self.connect_user(self.other_user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/v1/chats/messages/{self.chat.id}",
+                {"body": "Olá"},
+                HTTP_X_SOCKET_ID=sender_sid,
+            )
+
+            # Nada é enviado antes do commit.
+            self.assertEqual(self.sent, [])
+
+        # O envio roda em segundo plano, fora da resposta.
+        self.assertEqual(self.sent, [])
+        socket.sleep(0)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.received("update_chat_message"), [to_user_eio])
+        self.assertCountEqual(self.received("update_chat"), [sender_eio, to_user_eio])
+        self.assertNotIn(other_eio, self.received("update_chat"))
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_batch_send_emits_one_event_per_chat(self):
+        sender_sid, _ = self.connect_user(self.user)
+        _, to_user_eio = self.connect_user(self.to_user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/v1/chats/messages/{self.chat.id}/batch",
+                {"messages": [{"body": str(index)} for index in range(10)]},
+                format="json",
+                HTTP_X_SOCKET_ID=sender_sid,
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.received("update_chat_message"), [to_user_eio])
+
+        packet = next(
+            json.loads(packet.data[packet.data.index("["):])[1]
+            for _, packet in self.sent
+            if '"update_chat_message"' in packet.data
+        )
+        self.assertEqual(packet["type"], "create_batch")
+        self.assertEqual(len(packet["messages"]), 10)
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_send_message_event_persists_and_acknowledges(self):
+        sender_sid, sender_eio = self.connect_user(self.user)
+        _, to_user_eio = self.connect_user(self.to_user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ack = send_message(
+                sender_sid, {"chat_id": self.chat.id, "body": "Olá", "client_id": "c1"}
+            )
+
+        message = ChatMessage.objects.get(chat=self.chat)
+        self.assertEqual(ack["client_id"], "c1")
+        self.assertEqual(ack["result"]["id"], message.id)
+        self.assertEqual(ack["result"]["body"], "Olá")
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.last_message_id, message.id)
+        self.assertEqual(self.chat.to_user_unread, 1)
+
+        self.assertEqual(self.received("update_chat_message"), [to_user_eio])
+        self.assertCountEqual(self.received("update_chat"), [sender_eio, to_user_eio])
+
+        # Mesma validação da API: nada é gravado nem emitido.
+        self.sent.clear()
+
+        for data in (
+            {"chat_id": self.chat.id, "body": ""},
+            {"chat_id": self.chat.id, "body": "Olá", "upload_id": "inexistente"},
+        ):
+            ack = send_message(sender_sid, data)
+            self.assertEqual(ack["error"]["code"], "validation_error")
+
+        other_chat = Chat.objects.create(from_user=self.to_user, to_user=self.other_user)
+        for chat_id in (other_chat.id, "abc", None):
+            ack = send_message(sender_sid, {"chat_id": chat_id, "body": "Olá"})
+            self.assertEqual(ack["error"]["code"], "chat_not_found")
+
+        self.assertEqual(ChatMessage.objects.count(), 1)
+        self.assertEqual(self.sent, [])
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_emits_wait_for_commit_and_merge_duplicates(self):
+        _, eio_sid = self.connect_user(self.user)
+        data = {"query": {"users": [self.user.id]}}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                emit_to_users("update_chat", data, [self.user.id])
+                emit_to_users("update_chat", {"query": {"users": [self.user.id]}}, [self.user.id])
+                emit_to_chat("mark_messages_as_read", data, self.chat.id)
+
+            self.assertEqual(self.sent, [])
+
+        self.assertEqual(self.received("update_chat"), [eio_sid])
+        self.assertEqual(self.received("mark_messages_as_read"), [eio_sid])
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_emits_are_dropped_on_rollback(self):
+        self.connect_user(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                emit_to_users("update_chat", {"type": "ok"}, [self.user.id])
+
+                try:
+                    with transaction.atomic():
+                        emit_to_users("update_chat", {"type": "desfeito"}, [self.user.id])
+                        raise ValueError
+                except ValueError:
+                    pass
+
+        self.assertEqual(
+            [json.loads(packet.data[packet.data.index("["):])[1] for _, packet in self.sent],
+            [{"type": "ok"}],
+        )
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_emit_buffers_are_released_on_commit_and_rollback(self):
+        self.connect_user(self.user)
+        connection = transaction.get_connection()
+
+        def open_buffers():
+            return len(EmitBuffer.registry.get(connection, {}))
+
+        opened = open_buffers()
+
+        try:
+            with transaction.atomic():
+                emit_to_users("update_chat", {"type": "desfeito"}, [self.user.id])
+                self.assertEqual(open_buffers(), opened + 1)
+                raise ValueError
+        except ValueError:
+            pass
+
+        self.assertEqual(open_buffers(), opened)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                emit_to_users("update_chat", {"type": "desfeito"}, [self.user.id])
+
+        self.assertEqual(open_buffers(), opened)
+        self.assertEqual(len(self.received("update_chat")), 1)
+
+    @override_settings(SOCKETIO_BACKGROUND_EMITS=False)
+    def test_presence_is_sent_to_contacts_on_first_connect_and_last_disconnect(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user_sid, user_eio = self.connect_user(self.user)
+            _, other_eio = self.connect_user(self.other_user)
+            to_user_sid, _ = self.connect_user(self.to_user)
+            second_sid, _ = self.connect_user(self.to_user)
+
+        self.assertEqual(self.received("user_presence").count(user_eio), 1)
+        self.assertNotIn(other_eio, self.received("user_presence"))
+        self.assertEqual(
+            [(status["user_id"], status["online"]) for status in get_presence(
+                user_sid, {"user_ids": [self.to_user.id, self.other_user.id]}
+            )],
+            [(self.to_user.id, True)],
+        )
+
+        self.sent.clear()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            disconnect(to_user_sid)
+
+        self.assertEqual(self.received("user_presence"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            disconnect(second_sid)
+
+        packet = self.sent[0][1].data
+        self.assertEqual(self.received("user_presence"), [user_eio])
+        self.assertFalse(json.loads(packet[packet.index("["):])[1]["online"])
+
+
+@override_settings(MESSAGE_SYNC_WINDOW_SECONDS=0)
+class FastSerializationTestCase(TestCase):
+    """
+    FAST_SERIALIZATION deve gerar exatamente os mesmos bytes dos serializers do DRF.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(
+            name="Contato  ", email="contato@email.com", avatar="",
+            avatar_variants={"small": {"src": "/media/a/small.webp", "width": 64, "height": 64}},
+        )
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user, viewed_at=now())
+        Chat.objects.create(from_user=self.to_user, to_user=self.user)
+
+        file = FileAttachment.objects.create(
+            name="foto", extension="png", size=123456, src="/media/files/a.png",
+            content_type="image/png",
+            variants={"small": {"src": "/media/thumbnails/a/small.webp", "width": 160, "height": 90}},
+        )
+        audio = AudioAttachment.objects.create(src="/media/audios/a.mp3")
+
+        for body in ("Olá 🎉", "aspas \" barra \\ \n\t\x01  ", None):
+            ChatMessage.objects.create(chat=self.chat, from_user=self.to_user, body=body)
+        ChatMessage.objects.create(
+            chat=self.chat, from_user=self.user, attachment_code="FILE", attachment_id=file.id
+        )
+        ChatMessage.objects.create(
+            chat=self.chat, from_user=self.to_user, attachment_code="AUDIO", attachment_id=audio.id
+        )
+        ChatMessage.objects.create(
+            chat=self.chat, from_user=self.user, attachment_code="FILE", attachment_id=999
+        )
+        reconcile_counters(Chat.objects.all())
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/chats/messages/{self.chat.id}"
+
+        # Parte das mensagens lida pelo destinatário.
+        self.client.force_authenticate(self.to_user)
+        self.client.get(self.url, {"limit": 5})
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None):
+        message_cache.clear()
+        user_representations.clear()
+        self.addCleanup(message_cache.clear)
+        self.addCleanup(user_representations.clear)
+
+        with override_settings(FAST_SERIALIZATION=False):
+            expected = self.client.get(url, params)
+
+        with override_settings(FAST_SERIALIZATION=True):
+            response = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_message_pages_and_changes_match_serializers(self):
+        response = self.get(self.url, {"limit": 4})
+        self.assertTrue(any(message["viewed_at"] for message in response.data["results"]))
+        self.get(self.url, {"before": response.data["before"]})
+        self.get(self.url, {"after": response.data["before"]})
+
+        since = response.data["since"]
+        ChatMessage.objects.filter(body=None, attachment_code=None).update(deleted_at=now(), updated_at=now())
+        response = self.get(self.url, {"since": since})
+        self.assertEqual(len(response.data["deleted"]), 1)
+
+    def test_chat_list_matches_serializers(self):
+        self.get("/api/v1/chats/")
+
+    def test_renderer_matches_json_renderer(self):
+        import datetime
+        import decimal
+        import uuid
+
+        from rest_framework.renderers import JSONRenderer
+        from core.renderers import FastJSONRenderer
+
+        data = {
+            "text": "Olá     \x00 \x1f \x7f </script>",
+            "datetime": datetime.datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            "date": datetime.date(2025, 1, 2),
+            "decimal": decimal.Decimal("1.5"),
+            "uuid": uuid.UUID(int=1),
+            "nested": [{"a": (1, 2)}, None, True, 2**40],
+            1: "chave numérica",
+        }
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+
+@override_settings(ASYNC_VIEWS=True, SOCKETIO_BACKGROUND_EMITS=False, MESSAGE_SYNC_WINDOW_SECONDS=0)
+class AsyncViewsTestCase(TestCase):
+    """
+    Views no modo ASGI: os mesmos endpoints atendidos por aget/apost.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        for index in range(3):
+            ChatMessage.objects.create(chat=self.chat, from_user=self.to_user, body=str(index))
+
+        self.factory = AsyncRequestFactory()
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def call(self, view_class, request, **kwargs):
+        view = view_class.as_view()
+
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertIn("default", view._non_atomic_requests)
+
+        response = async_to_sync(view)(request, **kwargs)
+        response.render()
+        return response
+
+    def test_message_list_matches_sync_view(self):
+        url = f"/api/v1/chats/messages/{self.chat.id}"
+
+        response = self.call(ChatMessagesView, self.factory.get(url, headers=self.headers), chat_id=self.chat.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.client.get(url).data)
+        self.assertEqual(Chat.objects.get().from_user_unread, 0)
+
+    def test_post_message_and_inbox(self):
+        url = f"/api/v1/chats/messages/{self.chat.id}"
+
+        response = self.call(
+            ChatMessagesView, self.factory.post(url, {"body": "Olá"}, headers=self.headers), chat_id=self.chat.id
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Chat.objects.get().last_message_id, response.data["result"]["id"])
+
+        response = self.call(ChatsView, self.factory.get("/api/v1/chats/", headers=self.headers))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["last_message"]["body"], "Olá")
+
+    def test_errors_and_authentication(self):
+        url = "/api/v1/chats/messages/999"
+
+        response = self.call(ChatMessagesView, self.factory.post(url, {"body": "Olá"}, headers=self.headers), chat_id=999)
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(self.call(ChatsView, self.factory.get("/api/v1/chats/")).status_code, 401)
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.user = User.objects.create(name="Dono", email="dono@email.com")
+        self.to_user = User.objects.create(name="Contato", email="contato@email.com")
+        self.chat = Chat.objects.create(from_user=self.user, to_user=self.to_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/chats/messages/{self.chat.id}"
+
+    def series(self, name, endpoint):
+        return float(next(
+            line.rsplit(" ", 1)[1]
+            for line in metrics.render().splitlines()
+            if line.startswith(f'{name}{{endpoint="{endpoint}"}}')
+        ))
+
+    def test_requests_and_socket_events_are_measured(self):
+        self.client.post(self.url, {"body": "Olá"})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+            self.client.get(self.url)
+
+        self.assertEqual(self.series("chat_api_request_duration_seconds_count", "ChatMessagesView.get"), 2)
+        self.assertEqual(self.series("chat_api_db_queries_sum", "ChatMessagesView.get"), len(queries))
+        self.assertEqual(self.series("chat_api_socket_emits_sum", "ChatMessagesView.post"), 2)
+        self.assertGreater(self.series("chat_api_socket_emit_bytes_sum", "ChatMessagesView.post"), 0)
+        self.assertGreater(self.series("chat_api_serialization_duration_seconds_sum", "ChatMessagesView.get"), 0)
+
+        update_messages_as_read("sid", {"chat_id": self.chat.id})
+        self.assertEqual(self.series("chat_api_request_duration_seconds_count", "socket:update_messages_as_read"), 1)
+
+    def test_emitted_payload_is_encoded_once(self):
+        with mock.patch("core.socket.json.dumps", wraps=json.dumps) as dumps:
+            self.client.post(self.url, {"body": "Olá"})
+
+        self.assertEqual(self.series("chat_api_socket_emits_sum", "ChatMessagesView.post"), 2)
+        # Cada evento é codificado uma vez, para a chave do EmitBuffer e para o tamanho.
+        encoded = [call for call in dumps.call_args_list if call.kwargs.get("default") is str]
+        self.assertEqual(len(encoded), 2)
+
+    @override_settings(METRICS_TOKEN="segredo")
+    def test_metrics_endpoint_requires_the_token(self):
+        self.client.get(self.url)
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredo")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'chat_api_db_queries_bucket{endpoint="ChatMessagesView.get",le="+Inf"} 1',
+            response.content.decode(),
+        )
+        self.assertNotIn('endpoint="metrics', response.content.decode())
+
+        # Atrás do proxy as requisições externas também chegam de 127.0.0.1.
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(
+            self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer outro").status_code, 403
+        )
+
+        with override_settings(METRICS_ALLOWED_IPS=["10.0.0.2"]):
+            self.assertEqual(
+                self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer segredo").status_code, 403
+            )
+
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(
+                self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 404
+            )
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_top_queries(self):
+        with self.assertLogs("core.metrics", "WARNING") as logs:
+            self.client.get(self.url)
+
+        self.assertIn("ChatMessagesView.get", logs.output[0])
+        self.assertIn("chat_messages", logs.output[0])
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    """
+    Usa conexões SQLite no lugar do PostgreSQL.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "pool.sqlite3")
+        self.opened = []
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.opened.append(connection)
+        return connection
+
+    def check(self, connection):
+        connection.execute("SELECT 1")
+        return True
+
+    def test_concurrent_workers_share_a_bounded_number_of_connections(self):
+        pool = ConnectionPool(self.connect, size=3, max_overflow=2, timeout=5, check=self.check)
+        self.addCleanup(pool.close)
+        peak = []
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    connection = pool.acquire()
+                    peak.append(pool.opened)
+                    connection.execute("SELECT 1")
+                    time.sleep(0.001)
+                    pool.release(connection)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=worker) for _ in range(30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(max(peak), 5)
+        self.assertLessEqual(pool.opened, 3)
+        self.assertEqual(pool.in_use, 0)
+
+    def test_acquire_waits_and_times_out_when_exhausted(self):
+        pool = ConnectionPool(self.connect, size=1, max_overflow=0, timeout=0.05)
+        self.addCleanup(pool.close)
+        connection = pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+        threading.Timer(0.01, pool.release, [connection]).start()
+        pool.timeout = 1
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_broken_idle_connections_are_replaced(self):
+        pool = ConnectionPool(self.connect, size=2, max_overflow=0, check_interval=0, check=self.check)
+        self.addCleanup(pool.close)
+
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+
+        connection.close()
+        pool.release(connection)
+
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertEqual(pool.opened, 1)
+
+
+class PooledDatabaseWrapperTestCase(SimpleTestCase):
+    """
+    Backend core.postgresql com conexões falsas no lugar do psycopg2.
+    """
+
+    class Connection:
+        closed = False
+
+        class info:
+            transaction_status = TRANSACTION_STATUS_IDLE
+
+        def close(self):
+            self.closed = True
+
+    def setUp(self):
+        self.opened = []
+
+        def connect(wrapper, conn_params):
+            self.opened.append(self.Connection())
+            return self.opened[-1]
+
+        patcher = mock.patch.object(postgresql_base.DatabaseWrapper, "get_new_connection", connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(PooledDatabaseWrapper._green_pools.pop, "pooled", None)
+
+        self.settings_dict = {
+            "ENGINE": "core.postgresql", "NAME": "chat", "USER": "chat", "PASSWORD": "",
+            "HOST": "", "PORT": "", "OPTIONS": {}, "TIME_ZONE": None, "CONN_MAX_AGE": 0,
+            "CONN_HEALTH_CHECKS": False, "AUTOCOMMIT": True, "ATOMIC_REQUESTS": False,
+            "TEST": {}, "POOL": {"size": 2, "max_overflow": 0, "timeout": 1},
+        }
+
+    def wrapper(self):
+        return PooledDatabaseWrapper(self.settings_dict, alias="pooled")
+
+    def connect(self, wrapper):
+        wrapper.connection = wrapper.get_new_connection({})
+        return wrapper.connection
+
+    def test_closed_connections_return_to_the_pool(self):
+        wrapper = self.wrapper()
+        connection = self.connect(wrapper)
+
+        wrapper._close()
+        self.assertIsNone(wrapper.connection)
+        self.assertFalse(connection.closed)
+
+        self.assertIs(self.connect(self.wrapper()), connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_changed_settings_replace_the_pool(self):
+        idle = self.connect(self.wrapper())
+        in_use = self.wrapper()
+        self.connect(in_use)
+        idle_wrapper = self.wrapper()
+        idle_wrapper.connection = idle
+        idle_wrapper._close()
+
+        # Como na criação do banco de testes, que troca o NAME do mesmo alias.
+        self.settings_dict["NAME"] = "test_chat"
+        connection = self.connect(self.wrapper())
+
+        self.assertNotIn(connection, self.opened[:2])
+        self.assertTrue(idle.closed)
+
+        # A conexão do pool antigo é fechada ao ser devolvida, não entra no pool novo.
+        in_use._close()
+        self.assertTrue(self.opened[1].closed)
+
+def run_socket_receiver(url, received):
+    """
+    Processo que simula um worker com um cliente conectado na sala user:1.
+    """
+    server = socketio.Server(async_mode="threading", client_manager=UnixSocketManager(url))
+
+    class EngineSocket:
+        closed = False
+        session = {}
+
+        def send(self, packet):
+            received.put(packet.data)
+
+    server.eio.sockets["eio-receiver"] = EngineSocket()
+    sid = server.manager.connect("eio-receiver", "/")
+    server.manager.enter_room(sid, "/", "user:1")
+    server._handle_eio_connect("eio-receiver", {})
+
+    while True:
+        time.sleep(1)
+
+
+def run_socket_emitter(url):
+    """
+    Processo que simula um worker da API emitindo eventos sem clientes conectados.
+    """
+    server = socketio.Server(async_mode="threading", client_manager=UnixSocketManager(url))
+
+    while True:
+        try:
+            server.manager.join_room_members(["user:1"], "chat:9")
+            server.emit("update_chat", {"query": {"users": [1]}}, to="user:1")
+            server.emit("update_chat_message", {"query": {"chat_id": 9}}, to="chat:9")
+            server.emit("update_chat", {"query": {"users": [2]}}, to="user:2")
+        except OSError:
+            # Broker reiniciando.
+            pass
+        time.sleep(0.1)
+
+
+class SocketClientManagerTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.context = multiprocessing.get_context("fork")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "socketio.sock")
+        self.url = f"unix://{self.path}"
+        self.processes = []
+
+    def tearDown(self):
+        for process in self.processes:
+            process.terminate()
+            process.join()
+
+    def start(self, target, *args):
+        process = self.context.Process(target=target, args=args, daemon=True)
+        process.start()
+        self.processes.append(process)
+        return process
+
+    def start_broker(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        broker = self.start(run_broker, self.path)
+        while not os.path.exists(self.path):
+            time.sleep(0.01)
+
+        return broker
+
+    def receive_events(self, received, timeout=10):
+        events = set()
+        deadline = time.monotonic() + timeout
+        while events != {"update_chat", "update_chat_message"} and time.monotonic() < deadline:
+            try:
+                packet = received.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            event, data = json.loads(packet[packet.index("["):])
+            events.add(event)
+            self.assertNotEqual(data["query"].get("users"), [2])
+
+        return events
+
+    def test_events_emitted_in_one_process_reach_clients_of_another(self):
+        received = self.context.Queue()
+
+        self.start_broker()
+        self.start(run_socket_receiver, self.url, received)
+        self.start(run_socket_emitter, self.url)
+
+        self.assertEqual(self.receive_events(received), {"update_chat", "update_chat_message"})
+
+    def test_delivery_resumes_after_the_broker_restarts(self):
+        received = self.context.Queue()
+
+        broker = self.start_broker()
+        self.start(run_socket_receiver, self.url, received)
+        self.start(run_socket_emitter, self.url)
+        self.assertEqual(self.receive_events(received), {"update_chat", "update_chat_message"})
+
+        broker.terminate()
+        broker.join()
+        self.start_broker()
+
+        # Descarta o que chegou antes da queda.
+        while True:
+            try:
+                received.get(timeout=0.2)
+            except queue.Empty:
+                break
+
+        self.assertEqual(self.receive_events(received, timeout=15), {"update_chat", "update_chat_message"})
+
+
+class ExplainHotQueriesCommandTestCase(TestCase):
+
+    def test_hot_queries_use_indexes_on_seeded_dataset(self):
+        output = io.StringIO()
+        call_command("explain_hot_queries", seed=300, messages=20, stdout=output)
+
+        self.assertNotIn("[SEQ SCAN]", output.getvalue())
+        self.assertIn("[OK] não lidas (reconcile_counters)", output.getvalue())
+        self.assertEqual(Chat.objects.count(), 0)
+
+    def test_sequential_scans_inside_subqueries_are_reported(self):
+        plan = "SEARCH chats USING INTEGER PRIMARY KEY (rowid=?)\nCORRELATED SCALAR SUBQUERY 1\nSCAN U0"
+        self.assertEqual(ExplainHotQueriesCommand().sequential_scans(plan), ["U0"])
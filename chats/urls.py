@@ -4,13 +4,17 @@ from chats.views.chats import (
   ChatView,
 )
 from chats.views.messages import (
+  ChatMessagesBatchView,
   ChatMessagesView, 
   ChatMessageView
   )
+from chats.views.search import ChatSearchView
 
 urlpatterns = [
   path('', ChatsView.as_view(), name='chats'),
+  path('search', ChatSearchView.as_view(), name='chat_search'),
   path('<int:chat_id>/', ChatView.as_view(), name='chat'),
   path('messages/<int:chat_id>', ChatMessagesView.as_view(), name='chat_messages'),
+  path('messages/<int:chat_id>/batch', ChatMessagesBatchView.as_view(), name='chat_messages_batch'),
   path('<int:chat_id>/messages/<int:message_id>/', ChatMessageView.as_view(), name='chat_message'),
 ]
\ No newline at end of file
@@ -1,17 +1,80 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
-from django.utils.timezone import now
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import classproperty
+from django.utils.http import http_date
 
 from accounts.models import User
 
-from chats.models import Chat, ChatMessage
+from chats import services
+from chats.models import Chat
 from chats.serializers import ChatSerializer
 from chats.exceptions import ChatNotFound,UserNotFound
-from core.exceptions import ValidationError
+from attachments.models import ChunkedUpload
+from attachments.uploads import ChunkedUploadService
+from attachments.validators import validate_file
+from core.renderers import FastJSONRenderer
+from core.socket import aget_session_user_id, get_session_user_id
 
 
 class BaseView(APIView):
+
+  def get_renderers(self):
+    """
+    Com FAST_SERIALIZATION, as respostas JSON são geradas pelo FastJSONRenderer,
+    com os mesmos bytes do JSONRenderer.
+    """
+    if not settings.FAST_SERIALIZATION:
+      return super().get_renderers()
+
+    return [
+      FastJSONRenderer() if renderer is JSONRenderer else renderer()
+      for renderer in self.renderer_classes
+    ]
+
+  def get_etag(self, request, version) -> str:
+    """
+    ETag fraco da resposta a partir dos marcadores de versão dos dados (chats.etags),
+    do usuário e da URL com os parâmetros.
+    """
+    digest = hashlib.sha256(
+      repr((request.user.id, request.get_full_path(), version)).encode()
+    ).hexdigest()
+
+    return f'W/"{digest}"'
+
+  def not_modified(self, request, etag):
+    """
+    Retorna um 304 se o If-None-Match do cliente tem o ETag atual, sem serializar a resposta.
+    If-Modified-Since é ignorado: a remoção de um chat ou mensagem não muda o Last-Modified.
+    """
+    if not request.headers.get("If-None-Match"):
+      return None
+
+    return get_conditional_response(request, etag=etag)
+
+  def set_validators(self, response, etag, last_modified):
+    """
+    Adiciona o ETag e o Last-Modified à resposta (ou ao 304). O cliente deve revalidar
+    a cada uso, e a resposta é própria do usuário.
+    """
+    if response.status_code not in (200, 304):
+      return response
+
+    response["ETag"] = etag
+
+    if last_modified:
+      response["Last-Modified"] = http_date(last_modified.timestamp())
+
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
   
   def get_user(self, raise_exception=True, **kwargs) -> User | None:
     """
@@ -51,11 +114,7 @@ class BaseView(APIView):
     O chat deve estar ativo (deleted_at é None).
     """
     
-    chat = Chat.objects.filter(
-      Q(from_user=user_id) | Q(to_user=user_id),
-      id=chat_id,
-      deleted_at__isnull=True
-    ).first()
+    chat = services.user_chats(user_id).filter(id=chat_id).first()
     
     if not chat:
       raise ChatNotFound
@@ -63,35 +122,115 @@ class BaseView(APIView):
     return chat
   
   
-  def mark_messages_as_read(self, chat_id, user_id) -> None:
+  def mark_messages_as_read(self, chat, user_id) -> bool:
     """"
     Marca as mensagens de um chat como lidas.
-    Marca todas as mensagens não visualizadas de um chat específico como lidas,
-    exceto aquelas enviadas pelo próprio usuário.
-    """
-    ChatMessage.objects.filter(
-      chat_id=chat_id,
-      viewed_at__isnull=True,
-      deleted_at__isnull=True,
-    ).exclude(
-      from_user=user_id
-    ).update(
-      viewed_at=now()
-    )
-    
-  
+    Avança a confirmação de leitura do usuário até a última mensagem do chat
+    e zera o contador de não lidas do usuário.
+    Retorna se a confirmação de leitura mudou.
+    """
+    return services.mark_messages_as_read(chat, user_id)
+
+  def get_sender_sid(self, request) -> str | None:
+    """
+    Retorna o sid da conexão Socket.IO de quem fez a requisição (cabeçalho X-Socket-Id),
+    para que essa conexão não receba o eco dos próprios eventos.
+    O sid só é aceito se a conexão pertencer ao usuário autenticado.
+    """
+    sid = request.headers.get("X-Socket-Id")
+
+    if sid and get_session_user_id(sid) == request.user.id:
+      return sid
+
+    return None
+
+  def get_completed_upload(self, upload_id, user_id) -> ChunkedUpload:
+    """
+    Busca um envio em partes concluído pelo usuário.
+    Lança uma exceção ValidationError se o envio não existir ou não estiver concluído.
+    """
+    return ChunkedUploadService().get_completed(upload_id, user_id)
+
   def validate_file(self, size,extension,content_type) -> None:
     """
     Valida se o arquivo enviado é do tipo permitido.
     Lança uma exceção ValidationError se o arquivo não for válido.
     """
-    
-    if size > 10 * 1024 * 1024:  # 10 MB
-        raise ValidationError("O arquivo não pode ser maior que 10 MB.")
-      
-    if extension.lower() not in ["jpg", "jpeg", "png", "gif", "pdf", "docx", "txt"]:
-      raise ValidationError("Extensão de arquivo inválida.")
-    
-    if content_type not in ["image/jpeg", "image/png", "image/gif", "application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text/plain"]:
-      raise ValidationError("Tipo de arquivo inválido.")
-    
\ No newline at end of file
+    validate_file(size, extension, content_type)
+
+
+class AsyncBaseView(BaseView):
+  """
+  View atendida de forma assíncrona quando o servidor roda em ASGI (settings.ASYNC_VIEWS).
+  Nesse modo cada método HTTP é atendido por `a<método>` (aget, apost...), se existir,
+  e a autenticação e o tratamento de erros rodam via sync_to_async.
+  No servidor eventlet os métodos síncronos continuam sendo usados.
+  ATOMIC_REQUESTS não vale para views assíncronas: as escritas usam transaction.atomic.
+  """
+
+  # Definido em as_view, para que a view siga o modo em que foi criada.
+  run_async = False
+
+  @classproperty
+  def view_is_async(cls):
+    return settings.ASYNC_VIEWS
+
+  @classmethod
+  def as_view(cls, **initkwargs):
+    view = super().as_view(run_async=cls.view_is_async, **initkwargs)
+
+    if cls.view_is_async:
+      view = transaction.non_atomic_requests(view)
+
+    return view
+
+  def dispatch(self, request, *args, **kwargs):
+    if not self.run_async:
+      return super().dispatch(request, *args, **kwargs)
+
+    return self.adispatch(request, *args, **kwargs)
+
+  async def adispatch(self, request, *args, **kwargs):
+    """
+    Equivalente assíncrono de APIView.dispatch.
+    """
+    self.args = args
+    self.kwargs = kwargs
+    request = self.initialize_request(request, *args, **kwargs)
+    self.request = request
+    self.headers = self.default_response_headers
+
+    try:
+      await sync_to_async(self.initial)(request, *args, **kwargs)
+
+      method = request.method.lower()
+
+      if method in self.http_method_names:
+        handler = getattr(self, f"a{method}", None) or sync_to_async(
+          getattr(self, method, self.http_method_not_allowed)
+        )
+      else:
+        handler = sync_to_async(self.http_method_not_allowed)
+
+      response = await handler(request, *args, **kwargs)
+    except Exception as exc:
+      response = await sync_to_async(self.handle_exception)(exc)
+
+    self.response = self.finalize_response(request, response, *args, **kwargs)
+    return self.response
+
+  async def achat_belongs_to_user(self, chat_id, user_id) -> Chat:
+    chat = await services.user_chats(user_id).filter(id=chat_id).afirst()
+
+    if not chat:
+      raise ChatNotFound
+
+    return chat
+
+  async def aget_sender_sid(self, request) -> str | None:
+    sid = request.headers.get("X-Socket-Id")
+
+    if sid and await aget_session_user_id(sid) == request.user.id:
+      return sid
+
+    return None
@@ -1,20 +1,33 @@
 from rest_framework.response import Response
 from rest_framework import status
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 from django.utils.timezone import now
 
-from chats.views.base import BaseView
+from chats.views.base import AsyncBaseView, BaseView
+from chats.etags import chats_version
 from chats.models import Chat
+from chats.rows import serialize_chats
 from chats.serializers import ChatSerializer
+from core.metrics import measure_serialization
 
-from core.socket import socket
+from core.socket import (
+    aemit_to_users,
+    ajoin_chat_room,
+    close_chat_room,
+    emit_to_users,
+    join_chat_room,
+)
 
 
-class ChatsView(BaseView):
+class ChatsView(AsyncBaseView):
     """
     View para gerenciar a lista de chats do usuário.
-    Herda de BaseView para reutilizar métodos comuns.
+    Herda de AsyncBaseView: no ASGI é atendida por aget e apost.
     Esta view permite listar chats existentes e criar novos chats com base no email do usuário.
     - GET: Retorna a lista de chats do usuário autenticado.
     - POST: Cria um novo chat com o usuário especificado pelo email.
@@ -26,52 +39,105 @@ class ChatsView(BaseView):
     A criação de um novo chat também emite um evento via socket para atualizar a interface do usuário.
     """
 
-    def get(self, request):
-
-        chats = (
+    def get_queryset(self, request):
+        return (
             Chat.objects.filter(
                 Q(from_user_id=request.user.id) | Q(to_user_id=request.user.id),
                 deleted_at__isnull=True,
             )
+            .select_related("from_user", "to_user")
             .order_by("-viewed_at")
-            .all()
         )
 
-        serializer = ChatSerializer(
-            chats, context={"user_id": request.user.id}, many=True
-        )
+    def get(self, request):
+        """
+        Com o If-None-Match da última resposta, retorna 304 se nenhum chat mudou (chats.etags).
+        """
+        version, last_modified = chats_version(request.user.id)
+        etag = self.get_etag(request, version)
+        response = self.not_modified(request, etag)
+
+        if response is None:
+            response = self.list_chats(request, self.get_queryset(request))
+
+        return self.set_validators(response, etag, last_modified)
+
+    async def aget(self, request):
+        version, last_modified = await sync_to_async(chats_version)(request.user.id)
+        etag = self.get_etag(request, version)
+        response = self.not_modified(request, etag)
+
+        if response is None:
+            if settings.FAST_SERIALIZATION:
+                chats = self.get_queryset(request)
+            else:
+                chats = [chat async for chat in self.get_queryset(request)]
+
+            response = await sync_to_async(self.list_chats)(request, chats)
+
+        return self.set_validators(response, etag, last_modified)
+
+    def list_chats(self, request, chats):
+        """
+        Com FAST_SERIALIZATION, `chats` deve ser o queryset e a lista é montada
+        a partir de `.values()` (chats.rows), com o mesmo conteúdo de ChatSerializer.
+        """
+        if settings.FAST_SERIALIZATION:
+            with measure_serialization():
+                results = serialize_chats(chats, request.user.id)
+        else:
+            results = ChatSerializer(
+                chats, context={"user_id": request.user.id}, many=True
+            ).data
 
         return Response(
             {
-                "results": serializer.data,
+                "results": results,
             },
             status=status.HTTP_200_OK,
         )
 
     def post(self, request):
 
-        email = request.data.get("email")
-
-        user = self.get_user(email=email)
+        user, serializer, created = self.create_chat(request)
 
-        chat = self.has_existing_chat(user_id=request.user.id, to_user=user.id)
+        if created:
+            join_chat_room(serializer["id"], [request.user.id, user.id])
 
-        if not chat:
-            chat = Chat.objects.create(
-                from_user=request.user,
-                to_user=user,
-                viewed_at=now(),
+            emit_to_users(
+                "update_chat",
+                {
+                    "query": {
+                        "users": [request.user.id, user.id],
+                    }
+                },
+                [request.user.id, user.id],
+                skip_sid=self.get_sender_sid(request),
             )
 
-            serializer = ChatSerializer(chat, context={"user_id": request.user.id}).data
+        return Response(
+            {
+                "result": serializer,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    async def apost(self, request):
 
-            socket.emit(
+        user, serializer, created = await sync_to_async(transaction.atomic(self.create_chat))(request)
+
+        if created:
+            await ajoin_chat_room(serializer["id"], [request.user.id, user.id])
+
+            await aemit_to_users(
                 "update_chat",
                 {
                     "query": {
                         "users": [request.user.id, user.id],
                     }
                 },
+                [request.user.id, user.id],
+                skip_sid=await self.aget_sender_sid(request),
             )
 
         return Response(
@@ -81,6 +147,28 @@ class ChatsView(BaseView):
             status=status.HTTP_201_CREATED,
         )
 
+    def create_chat(self, request):
+        """
+        Cria o chat com o usuário do email informado, se ainda não existir.
+        Retorna o usuário, o chat serializado e se o chat foi criado.
+        """
+        email = request.data.get("email")
+
+        user = self.get_user(email=email)
+
+        chat = self.has_existing_chat(user_id=request.user.id, to_user=user.id)
+
+        if chat:
+            return user, chat, False
+
+        chat = Chat.objects.create(
+            from_user=request.user,
+            to_user=user,
+            viewed_at=now(),
+        )
+
+        return user, ChatSerializer(chat, context={"user_id": request.user.id}).data, True
+
 class ChatView(BaseView):
     """
     View para gerenciar um chat específico.
@@ -105,16 +193,19 @@ class ChatView(BaseView):
         )
         
         if deleted:
-            socket.emit(
+            emit_to_users(
                 "update_chat",
                 {
                     "type": "delete",
                     "query": {
                         "chat_id": chat.id,
-                        "users": [chat.from_user.id, chat.to_user.id],
+                        "users": [chat.from_user_id, chat.to_user_id],
                     }
                 },
+                [chat.from_user_id, chat.to_user_id],
+                skip_sid=self.get_sender_sid(request),
             )
+            close_chat_room(chat.id)
         return Response(
             {
                 "message": "Chat deletado com sucesso.",
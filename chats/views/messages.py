@@ -1,137 +1,309 @@
-from core.socket import socket
+from core.socket import aemit_to_chat, aemit_to_users, emit_to_chat, emit_to_users
 from core.exceptions import ValidationError
+from core.metrics import measure_serialization
 
-from chats.views.base import BaseView
-from chats.models import (
-    ChatMessage,
-    Chat,
-)
+from chats import services
+from chats.views.base import AsyncBaseView, BaseView
+from chats.etags import messages_version
+from chats.models import ChatMessage
+from chats.rows import MESSAGE_FIELDS, serialize_messages
 from chats.serializers import ChatMessageSerializer
-
-from attachments.models import (
-    AudioAttachment,
-    FileAttachment,
+from chats.pagination import (
+    decode_cursor,
+    encode_cursor,
+    get_page_size,
+    keyset_after,
+    keyset_before,
 )
 
+from attachments.models import ChunkedUpload
+
 from rest_framework.response import Response
 from rest_framework import status
 
+from asgiref.sync import sync_to_async
+
+from django.db import transaction
 from django.utils.timezone import now
-from django.core.files.storage import FileSystemStorage
 from django.conf import settings
 
+from datetime import timedelta
 import uuid
 
 
-class ChatMessagesView(BaseView):
+class ChatMessagesView(AsyncBaseView):
     """
     View para gerenciar mensagens de chat.
-    Herda de BaseView para reutilizar métodos comuns.
+    Herda de AsyncBaseView: no ASGI é atendida por aget e apost.
     Esta view permite listar mensagens de um chat específico e criar novas mensagens.
-
+    - GET: Retorna as mensagens paginadas por cursor (`before`, `after` e `limit`),
+      ou, com `since`, apenas as mensagens alteradas desde a última sincronização.
+      Com If-None-Match, responde 304 se nada mudou desde a última resposta.
+    - POST: Cria uma nova mensagem no chat.
     """
 
     def get(self, request, chat_id):
 
         chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
-        self.mark_messages_as_read(chat_id, request.user.id)
 
-        socket.emit(
-            "mark_messages_as_read",
-            {"query": {"chat_id": chat_id, "exclude_user_id": request.user.id}},
+        # Sem mensagens novas, a leitura não grava nada nem avisa os participantes,
+        # e a resposta pode ser um 304.
+        if self.mark_messages_as_read(chat, request.user.id):
+            emit_to_chat(
+                "mark_messages_as_read",
+                {"query": {"chat_id": chat_id, "exclude_user_id": request.user.id}},
+                chat_id,
+                skip_sid=self.get_sender_sid(request),
+            )
+
+            emit_to_users(
+                "update_chat",
+                {
+                    "query": {
+                        "users": [chat.from_user_id, chat.to_user_id],
+                    }
+                },
+                [chat.from_user_id, chat.to_user_id],
+            )
+
+        return self.conditional_list(request, chat)
+
+    async def aget(self, request, chat_id):
+
+        chat = await self.achat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
+
+        if await sync_to_async(self.mark_messages_as_read)(chat, request.user.id):
+            await aemit_to_chat(
+                "mark_messages_as_read",
+                {"query": {"chat_id": chat_id, "exclude_user_id": request.user.id}},
+                chat_id,
+                skip_sid=await self.aget_sender_sid(request),
+            )
+
+            await aemit_to_users(
+                "update_chat",
+                {
+                    "query": {
+                        "users": [chat.from_user_id, chat.to_user_id],
+                    }
+                },
+                [chat.from_user_id, chat.to_user_id],
+            )
+
+        return await sync_to_async(self.conditional_list)(request, chat)
+
+    def conditional_list(self, request, chat):
+        """
+        Com o If-None-Match da última resposta, retorna 304 se nenhuma mensagem ou
+        confirmação de leitura mudou (chats.etags), sem montar a página.
+        """
+        version, last_modified = messages_version(chat)
+        etag = self.get_etag(request, version)
+        response = self.not_modified(request, etag)
+
+        if response is None:
+            response = self.list_messages(request, chat)
+
+        return self.set_validators(response, etag, last_modified)
+
+    def list_messages(self, request, chat):
+        limit = get_page_size(request.query_params.get("limit"))
+        since = request.query_params.get("since")
+
+        if since:
+            return self.get_changes_since(chat, since, limit)
+
+        return self.get_page(
+            chat,
+            limit,
+            before=request.query_params.get("before"),
+            after=request.query_params.get("after"),
         )
 
-        messages = (
-            ChatMessage.objects.filter(chat=chat_id, deleted_at__isnull=True)
-            .order_by("created_at")
-            .all()
+    def get_page(self, chat, limit, before=None, after=None):
+        """
+        Retorna uma página de mensagens em ordem cronológica usando keyset em (created_at, id).
+        Sem cursores, retorna as mensagens mais recentes.
+        Com `before`, retorna as mensagens anteriores ao cursor; com `after`, as posteriores.
+        O cursor `since` da resposta marca o ponto de sincronização para get_changes_since
+        (ver sync_cursor).
+        """
+        if before and after:
+            raise ValidationError("Use apenas um dos cursores: before ou after.")
+
+        # O ponto de sincronização é lido antes da página, assim nenhuma alteração
+        # feita entre as duas consultas fica de fora da próxima sincronização.
+        last_change = (
+            ChatMessage.objects.filter(chat=chat.id)
+            .order_by("-updated_at", "-id")
+            .values("updated_at", "id")
+            .first()
         )
 
-        serializer = ChatMessageSerializer(messages, many=True)
+        messages = ChatMessage.objects.filter(chat=chat.id, deleted_at__isnull=True)
 
-        socket.emit(
-            "update_chat",
+        if after:
+            messages = messages.filter(keyset_after("created_at", after)).order_by(
+                "created_at", "id"
+            )
+        else:
+            if before:
+                messages = messages.filter(keyset_before("created_at", before))
+            messages = messages.order_by("-created_at", "-id")
+
+        page = list(self.rows(messages)[: limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        if not after:
+            page.reverse()
+
+        return Response(
             {
-                "query": {
-                    "users": [chat.from_user, chat.to_user.id],
-                }
+                "results": self.serialize(chat, page),
+                "has_more": has_more,
+                "before": encode_cursor(*self.position(page[0])) if page else before,
+                "after": encode_cursor(*self.position(page[-1])) if page else after,
+                "since": (
+                    self.sync_cursor(last_change["updated_at"], last_change["id"])
+                    if last_change
+                    else None
+                ),
             },
+            status=status.HTTP_200_OK,
+        )
+
+    def get_changes_since(self, chat, since, limit):
+        """
+        Retorna as mensagens criadas, editadas ou deletadas após o cursor `since`,
+        usando keyset em (updated_at, id).
+        Mensagens deletadas vêm apenas como ids em `deleted`.
+        Confirmações de leitura não alteram as mensagens: vêm sempre em `read`, com a
+        última mensagem lida por cada participante.
+        O cursor `since` da resposta deve ser usado na próxima sincronização. Na última
+        página ele fica para trás da janela de sincronização (ver sync_cursor), então
+        alterações recentes podem vir de novo e devem ser aplicadas pelo id.
+        """
+        changes = list(
+            self.rows(
+                ChatMessage.objects.filter(chat=chat.id)
+                .filter(keyset_after("updated_at", since))
+                .order_by("updated_at", "id"),
+                "deleted_at",
+                "updated_at",
+            )[: limit + 1]
         )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        position = self.position(changes[-1], "updated_at") if changes else decode_cursor(since)
+
+        messages = [message for message in changes if not self.field(message, "deleted_at")]
+        deleted = [
+            self.field(message, "id") for message in changes if self.field(message, "deleted_at")
+        ]
 
         return Response(
             {
-                "results": serializer.data,
+                "results": self.serialize(chat, messages),
+                "deleted": deleted,
+                "read": services.read_receipts(chat),
+                "has_more": has_more,
+                "since": encode_cursor(*position) if has_more else self.sync_cursor(*position),
             },
             status=status.HTTP_200_OK,
         )
 
-    def post(self, request, chat_id):
+    def sync_cursor(self, updated_at, message_id):
         """
-        Cria uma nova mensagem de chat.
-        A mensagem pode ser de texto, áudio ou arquivo.
-        Se for um arquivo, ele deve ser enviado como multipart/form-data.
-        O corpo da mensagem é obrigatório, mas o arquivo ou áudio são opcionais.
-        Retorna a mensagem criada.
+        Cursor `since` para a próxima sincronização, limitado a agora menos
+        MESSAGE_SYNC_WINDOW_SECONDS.
+        O updated_at é definido quando a mensagem é gravada, não quando a transação
+        termina: uma alteração com updated_at anterior ao cursor pode ficar visível só
+        depois desta resposta. Recuar o cursor faz a próxima sincronização ler de novo
+        a janela e entregar essas alterações.
         """
+        horizon = now() - timedelta(seconds=settings.MESSAGE_SYNC_WINDOW_SECONDS)
 
-        body = request.data.get("body")
-        file = request.FILES.get("file")
-        audio = request.FILES.get("audio")
+        if updated_at > horizon:
+            return encode_cursor(horizon, 0)
 
-        chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
+        return encode_cursor(updated_at, message_id)
 
-        self.mark_messages_as_read(chat_id, request.user.id)
+    def rows(self, messages, *fields):
+        """
+        Com FAST_SERIALIZATION, as mensagens são lidas como linhas de `.values()` e
+        montadas por chats.rows; caso contrário, como instâncias, para o ChatMessageSerializer.
+        """
+        if settings.FAST_SERIALIZATION:
+            return messages.values(*MESSAGE_FIELDS, *fields)
 
-        if not body and not file and not audio:
-            raise ValidationError("O corpo da mensagem não pode estar vazio.")
+        return messages.select_related("from_user")
 
-        attachment = None
+    def field(self, message, name):
+        return message[name] if isinstance(message, dict) else getattr(message, name)
 
-        if file:
-            storage = FileSystemStorage(
-                settings.MEDIA_ROOT / "files", settings.MEDIA_URL + "files"
-            )
-            content_type = file.content_type
-            name = file.name.split(".")[0]
-            extension = file.name.split(".")[-1]
-            size = file.size
-
-            self.validate_file(size, extension, content_type)
-
-            file = storage.save(f"{name}-{uuid.uuid4()}.{extension}", file)
-            src = storage.url(file)
-
-            attachment = FileAttachment.objects.create(
-                name=name,
-                extension=extension,
-                size=size,
-                src=src,
-                content_type=content_type,
-            )
+    def position(self, message, field="created_at"):
+        """
+        Posição (campo, id) da mensagem, para os cursores.
+        """
+        return self.field(message, field), self.field(message, "id")
 
-        elif audio:
-            storage = FileSystemStorage(
-                settings.MEDIA_ROOT / "audios", settings.MEDIA_URL + "audios"
-            )
+    def serialize(self, chat, messages):
+        if settings.FAST_SERIALIZATION:
+            with measure_serialization():
+                return serialize_messages(chat, messages)
 
-            audio = storage.save(f"{name}-{uuid.uuid4()}.mp3", audio)
-            src = storage.url(audio)
+        return ChatMessageSerializer(messages, many=True, context={"chat": chat}).data
 
-            attachment = AudioAttachment.objects.create(src=src)
+    def post(self, request, chat_id):
+        """
+        Cria uma nova mensagem de chat.
+        A mensagem pode ser de texto, áudio ou arquivo.
+        Se for um arquivo, ele deve ser enviado como multipart/form-data,
+        ou antes pelo envio em partes (attachments/uploads), informando aqui o `upload_id`.
+        O corpo da mensagem é obrigatório, mas o arquivo ou áudio são opcionais.
+        Retorna a mensagem criada.
+        """
+
+        chat, serializer = self.create_message(request, chat_id)
+
+        emit_to_chat(
+            "update_chat_message",
+            {
+                "type": "create",
+                "message": serializer,
+                "query": {
+                    "chat_id": chat_id,
+                },
+            },
+            chat_id,
+            skip_sid=self.get_sender_sid(request),
+        )
 
-        chat_message = ChatMessage.objects.create(
-            chat_id=chat_id,
-            from_user_id=request.user.id,
-            body=body,
-            attachment_code="FILE" if file else "AUDIO" if audio else None,
-            attachment_id=attachment.id if attachment else None,
+        emit_to_users(
+            "update_chat",
+            {
+                "query": {
+                    "users": [chat.from_user_id, chat.to_user_id],
+                }
+            },
+            [chat.from_user_id, chat.to_user_id],
+        )
+        return Response(
+            {
+                "result": serializer,
+            },
+            status=status.HTTP_201_CREATED,
         )
 
-        serializer = ChatMessageSerializer(
-            chat_message, context={"user_id": request.user.id}
-        ).data
+    async def apost(self, request, chat_id):
+
+        chat, serializer = await sync_to_async(transaction.atomic(self.create_message))(
+            request, chat_id
+        )
 
-        socket.emit(
+        await aemit_to_chat(
             "update_chat_message",
             {
                 "type": "create",
@@ -140,17 +312,18 @@ class ChatMessagesView(BaseView):
                     "chat_id": chat_id,
                 },
             },
+            chat_id,
+            skip_sid=await self.aget_sender_sid(request),
         )
 
-        Chat.objects.filter(id=chat_id).update(viewed_at=now())
-
-        socket.emit(
+        await aemit_to_users(
             "update_chat",
-            data={
+            {
                 "query": {
-                    "users": [chat.from_user, chat.to_user.id],
+                    "users": [chat.from_user_id, chat.to_user_id],
                 }
             },
+            [chat.from_user_id, chat.to_user_id],
         )
         return Response(
             {
@@ -159,6 +332,30 @@ class ChatMessagesView(BaseView):
             status=status.HTTP_201_CREATED,
         )
 
+    def create_message(self, request, chat_id):
+        """
+        Valida e grava a mensagem, seus anexos e os campos desnormalizados do chat.
+        Retorna o chat e a mensagem serializada.
+        """
+        chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
+
+        self.mark_messages_as_read(chat, request.user.id)
+
+        chat_message = services.create_message(
+            chat,
+            request.user.id,
+            body=request.data.get("body"),
+            file=request.FILES.get("file"),
+            audio=request.FILES.get("audio"),
+            upload_id=request.data.get("upload_id"),
+        )
+
+        serializer = ChatMessageSerializer(
+            chat_message, context={"user_id": request.user.id, "chat": chat}
+        ).data
+
+        return chat, serializer
+
 
 class ChatMessageView(BaseView):
     """
@@ -175,18 +372,28 @@ class ChatMessageView(BaseView):
         """
         chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
 
-        deleted_message = ChatMessage.objects.filter(
-            id=message_id,
-            chat=chat_id,
-            from_user=request.user.id,
-            deleted_at__isnull=True,
-        ).update(deleted_at=now())
+        message = (
+            ChatMessage.objects.select_for_update()
+            .filter(
+                id=message_id,
+                chat=chat_id,
+                from_user=request.user.id,
+                deleted_at__isnull=True,
+            )
+            .first()
+        )
 
-        if not deleted_message:
+        if not message:
             raise ValidationError("Mensagem não encontrada ou já deletada.")
 
+        deleted_message = ChatMessage.objects.filter(id=message.id).update(
+            deleted_at=now(), updated_at=now()
+        )
+
+        services.register_deleted_message(chat, message)
+
         if deleted_message:
-            socket.emit(
+            emit_to_chat(
                 "update_chat_message",
                 {
                     "type": "delete",
@@ -195,18 +402,205 @@ class ChatMessageView(BaseView):
                         "message_id": message_id,
                     },
                 },
+                chat_id,
+                skip_sid=self.get_sender_sid(request),
             )
 
-        socket.emit(
+        emit_to_users(
             "update_chat",
             {
                 "query": {
-                    "users": [chat.from_user, chat.to_user.id],
+                    "users": [chat.from_user_id, chat.to_user_id],
                 }
             },
+            [chat.from_user_id, chat.to_user_id],
         )
 
         return Response(
             {"message": "Mensagem deletada com sucesso.", "sucess": True},
             status=status.HTTP_200_OK,
         )
+
+
+class ChatMessagesBatchView(BaseView):
+    """
+    View para enviar ou deletar várias mensagens de um chat em uma requisição
+    (bots, importações e seleção múltipla nos clientes).
+    O chat é validado e as mensagens são lidas uma única vez; as mensagens são gravadas
+    em lote na transação da requisição e cada operação gera um único evento por chat.
+    - POST: Recebe `messages`, uma lista de {`body`, `upload_id`} (anexos pelo envio
+      em partes). Retorna as mensagens criadas, na ordem enviada.
+    - DELETE: Recebe `ids`, as mensagens do usuário a deletar. Se alguma não for
+      encontrada ou já estiver deletada, nenhuma é deletada.
+    """
+
+    def post(self, request, chat_id):
+        items = self.get_batch(request.data.get("messages"), "messages")
+
+        chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
+        self.mark_messages_as_read(chat, request.user.id)
+
+        uploads = self.get_completed_uploads(items, request.user.id)
+
+        messages = []
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValidationError(f"Mensagem {index} inválida.")
+
+            body = item.get("body")
+            upload = uploads.get(self.parse_upload_id(item.get("upload_id")))
+
+            if body is not None and not isinstance(body, str):
+                raise ValidationError(f"Corpo da mensagem {index} inválido.")
+
+            if item.get("upload_id") and not upload:
+                raise ValidationError(f"Envio da mensagem {index} não encontrado ou não concluído.")
+
+            if not body and not upload:
+                raise ValidationError(f"O corpo da mensagem {index} não pode estar vazio.")
+
+            messages.append(
+                ChatMessage(
+                    chat=chat,
+                    from_user=request.user,
+                    body=body,
+                    attachment_code=upload.attachment_code if upload else None,
+                    attachment_id=upload.attachment_id if upload else None,
+                )
+            )
+
+        messages = ChatMessage.objects.bulk_create(messages)
+        services.register_new_messages(chat, messages)
+
+        serializer = ChatMessageSerializer(
+            messages, many=True, context={"user_id": request.user.id, "chat": chat}
+        ).data
+
+        emit_to_chat(
+            "update_chat_message",
+            {
+                "type": "create_batch",
+                "messages": serializer,
+                "query": {
+                    "chat_id": chat_id,
+                },
+            },
+            chat_id,
+            skip_sid=self.get_sender_sid(request),
+        )
+
+        emit_to_users(
+            "update_chat",
+            {
+                "query": {
+                    "users": [chat.from_user_id, chat.to_user_id],
+                }
+            },
+            [chat.from_user_id, chat.to_user_id],
+        )
+
+        return Response(
+            {
+                "result": serializer,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    def delete(self, request, chat_id):
+        ids = self.get_batch(request.data.get("ids"), "ids")
+
+        try:
+            ids = sorted({int(message_id) for message_id in ids})
+        except (TypeError, ValueError):
+            raise ValidationError("Ids de mensagens inválidos.")
+
+        chat = self.chat_belongs_to_user(chat_id=chat_id, user_id=request.user.id)
+
+        messages = list(
+            ChatMessage.objects.select_for_update().filter(
+                id__in=ids,
+                chat=chat_id,
+                from_user=request.user.id,
+                deleted_at__isnull=True,
+            )
+        )
+
+        missing = sorted(set(ids) - {message.id for message in messages})
+
+        if missing:
+            raise ValidationError(f"Mensagens não encontradas ou já deletadas: {missing}.")
+
+        deleted_at = now()
+        ChatMessage.objects.filter(id__in=ids).update(
+            deleted_at=deleted_at, updated_at=deleted_at
+        )
+
+        services.register_deleted_messages(chat, messages)
+
+        emit_to_chat(
+            "update_chat_message",
+            {
+                "type": "delete_batch",
+                "query": {
+                    "chat_id": chat_id,
+                    "message_ids": ids,
+                },
+            },
+            chat_id,
+            skip_sid=self.get_sender_sid(request),
+        )
+
+        emit_to_users(
+            "update_chat",
+            {
+                "query": {
+                    "users": [chat.from_user_id, chat.to_user_id],
+                }
+            },
+            [chat.from_user_id, chat.to_user_id],
+        )
+
+        return Response(
+            {"message": "Mensagens deletadas com sucesso.", "deleted": ids, "sucess": True},
+            status=status.HTTP_200_OK,
+        )
+
+    def get_batch(self, items, field) -> list:
+        """
+        Valida a lista recebida em `field`: não vazia e dentro de MESSAGE_BATCH_MAX_SIZE.
+        """
+        if not isinstance(items, list) or not items:
+            raise ValidationError(f"Informe a lista `{field}`.")
+
+        if len(items) > settings.MESSAGE_BATCH_MAX_SIZE:
+            raise ValidationError(
+                f"Envie no máximo {settings.MESSAGE_BATCH_MAX_SIZE} mensagens por requisição."
+            )
+
+        return items
+
+    def get_completed_uploads(self, items, user_id) -> dict[uuid.UUID, ChunkedUpload]:
+        """
+        Busca em uma consulta os envios em partes concluídos das mensagens do lote.
+        """
+        upload_ids = {
+            self.parse_upload_id(item.get("upload_id"))
+            for item in items
+            if isinstance(item, dict)
+        } - {None}
+
+        uploads = ChunkedUpload.objects.filter(
+            id__in=upload_ids, user_id=user_id, completed_at__isnull=False
+        )
+
+        return {upload.id: upload for upload in uploads}
+
+    def parse_upload_id(self, value) -> uuid.UUID | None:
+        if not value:
+            return None
+
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            return None
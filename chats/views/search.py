@@ -0,0 +1,64 @@
+from rest_framework.response import Response
+from rest_framework import status
+
+from chats.views.base import BaseView
+from chats.pagination import get_page_size
+from chats.search import search_messages
+from chats.serializers import ChatMessageSerializer
+from core.exceptions import ValidationError
+
+
+class ChatSearchView(BaseView):
+    """
+    View de busca nas mensagens de todos os chats do usuário.
+    - GET: Busca `q` no corpo das mensagens e no nome dos arquivos anexados.
+      Retorna as mensagens da mais relevante para a menos relevante, com o chat,
+      a relevância (`rank`) e um trecho com os termos destacados (`snippet`).
+      A paginação usa `limit` e `offset`; `next_offset` é None na última página.
+    """
+
+    def get(self, request):
+        text = request.query_params.get("q", "").strip()
+
+        if not text:
+            raise ValidationError("Informe o termo de busca.")
+
+        limit = get_page_size(request.query_params.get("limit"))
+        offset = self.get_offset(request.query_params.get("offset"))
+
+        messages, has_more = search_messages(request.user.id, text, limit, offset)
+
+        # Serializadas em lote, como em ChatMessagesView; o viewed_at de cada mensagem
+        # vem de message.chat, carregado junto na busca.
+        serialized = ChatMessageSerializer(messages, many=True).data
+
+        return Response(
+            {
+                "results": [
+                    {
+                        "chat_id": message.chat_id,
+                        "rank": message.rank,
+                        "snippet": message.snippet,
+                        "message": data,
+                    }
+                    for message, data in zip(messages, serialized)
+                ],
+                "has_more": has_more,
+                "next_offset": offset + len(messages) if has_more else None,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def get_offset(self, value) -> int:
+        if value in (None, ""):
+            return 0
+
+        try:
+            offset = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError("Offset inválido.")
+
+        if offset < 0:
+            raise ValidationError("Offset inválido.")
+
+        return offset
@@ -5,12 +5,31 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Neste modo o Socket.IO usa o AsyncServer e as views mais usadas são assíncronas,
+sem eventlet nem monkey patch:
+
+    uvicorn core.asgi:application --host 0.0.0.0 --port 8000
 """
 
 import os
 
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('SERVER_MODE', 'asgi')
+
+import socketio
+
 from django.core.asgi import get_asgi_application
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Inicializa o Django antes de importar o servidor Socket.IO, que usa os models.
+django_application = ASGIStaticFilesHandler(get_asgi_application())
+
+from django.conf import settings
+
+from accounts.presence import presence
+from core.socket import socket
+
+application = socketio.ASGIApp(socket, django_application)
 
-application = get_asgi_application()
+presence.start(settings.PRESENCE_FLUSH_INTERVAL)
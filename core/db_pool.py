@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Pool de conexões com tamanho fixo e conexões extras (overflow) limitadas.
+
+    - Até `size` conexões ficam abertas e ociosas no pool entre as requisições.
+    - Sob carga, até `max_overflow` conexões extras são abertas; ao serem devolvidas
+      sem ninguém aguardando, elas são fechadas.
+    - Com tudo em uso, `acquire` aguarda até `timeout` segundos e então gera PoolTimeout,
+      em vez de abrir conexões sem limite até esgotar o `max_connections` do banco.
+    - Uma conexão ociosa há mais de `check_interval` segundos passa por `check` antes de
+      ser entregue; conexões com mais de `recycle` segundos são descartadas.
+
+    Usa apenas primitivas de `threading`, então é seguro entre threads e, com o
+    monkey patch do eventlet (core/wsgi.py), entre greenlets.
+    """
+
+    def __init__(
+        self,
+        connect,
+        size=10,
+        max_overflow=10,
+        timeout=30,
+        recycle=None,
+        check_interval=30,
+        check=None,
+        reset=None,
+        close=None,
+    ):
+        self.connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_interval = check_interval
+        self.check = check
+        self.reset = reset
+        self.close_connection = close or (lambda connection: connection.close())
+
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.created_at = {}
+        self.opened = 0
+        self.waiting = 0
+        self.closed = False
+
+    @property
+    def in_use(self) -> int:
+        with self.condition:
+            return self.opened - len(self.idle)
+
+    def acquire(self, connect=None):
+        """
+        Retorna uma conexão saudável do pool, abrindo uma nova se houver vaga.
+        `connect` substitui a função de abertura padrão nesta chamada.
+        """
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            with self.condition:
+                connection = None
+
+                while True:
+                    if self.idle:
+                        connection, released_at = self.idle.pop()
+                        break
+
+                    if self.opened < self.size + self.max_overflow:
+                        self.opened += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Nenhuma conexão disponível após {self.timeout}s "
+                            f"({self.opened} abertas)."
+                        )
+
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+
+            if connection is None:
+                return self._open(connect or self.connect)
+
+            if self._is_healthy(connection, released_at):
+                return connection
+
+            self._discard(connection)
+
+    def release(self, connection) -> None:
+        """
+        Devolve a conexão ao pool, ou a fecha se estiver quebrada, vencida ou
+        for uma conexão extra que ninguém está aguardando.
+        """
+        try:
+            if self.reset:
+                self.reset(connection)
+        except Exception:
+            self._discard(connection)
+            return
+
+        with self.condition:
+            keep = not self.closed and not self._is_expired(connection) and (
+                self.waiting or self.opened <= self.size
+            )
+
+            if keep:
+                self.idle.append((connection, time.monotonic()))
+                self.condition.notify()
+                return
+
+        self._discard(connection)
+
+    def close(self) -> None:
+        """
+        Fecha as conexões ociosas. As que estão em uso são fechadas ao serem devolvidas,
+        assim um pool substituído (ver core/postgresql) não mantém conexões abertas.
+        """
+        with self.condition:
+            self.closed = True
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+
+        for connection in idle:
+            self._discard(connection)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self.condition:
+                self.opened -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.created_at[id(connection)] = time.monotonic()
+
+        return connection
+
+    def _discard(self, connection) -> None:
+        with self.condition:
+            self.created_at.pop(id(connection), None)
+            self.opened -= 1
+            self.condition.notify()
+
+        try:
+            self.close_connection(connection)
+        except Exception:
+            pass
+
+    def _is_expired(self, connection) -> bool:
+        if not self.recycle:
+            return False
+
+        created_at = self.created_at.get(id(connection), 0)
+        return time.monotonic() - created_at > self.recycle
+
+    def _is_healthy(self, connection, released_at) -> bool:
+        if self._is_expired(connection):
+            return False
+
+        if not self.check or time.monotonic() - released_at < self.check_interval:
+            return True
+
+        try:
+            return bool(self.check(connection))
+        except Exception:
+            return False
@@ -0,0 +1,268 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger("core.metrics")
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+  """
+  Histograma cumulativo no formato do Prometheus, com um rótulo `endpoint`.
+  """
+
+  def __init__(self, name, documentation, buckets):
+    self.name = name
+    self.documentation = documentation
+    self.buckets = tuple(buckets)
+    self.series = {}
+    self.lock = threading.Lock()
+
+  def observe(self, endpoint, value) -> None:
+    with self.lock:
+      counts, total = self.series.get(endpoint, ([0] * (len(self.buckets) + 1), 0))
+      counts[bisect_left(self.buckets, value)] += 1
+      self.series[endpoint] = (counts, total + value)
+
+  def render(self) -> list[str]:
+    lines = [
+      f"# HELP {self.name} {self.documentation}",
+      f"# TYPE {self.name} histogram",
+    ]
+
+    with self.lock:
+      series = {endpoint: (list(counts), total) for endpoint, (counts, total) in self.series.items()}
+
+    for endpoint, (counts, total) in sorted(series.items()):
+      label = endpoint.replace("\\", "\\\\").replace('"', '\\"')
+      cumulative = 0
+
+      for bucket, count in zip(self.buckets, counts):
+        cumulative += count
+        lines.append(f'{self.name}_bucket{{endpoint="{label}",le="{bucket}"}} {cumulative}')
+
+      cumulative += counts[-1]
+      lines.append(f'{self.name}_bucket{{endpoint="{label}",le="+Inf"}} {cumulative}')
+      lines.append(f'{self.name}_sum{{endpoint="{label}"}} {total}')
+      lines.append(f'{self.name}_count{{endpoint="{label}"}} {cumulative}')
+
+    return lines
+
+  def reset(self) -> None:
+    with self.lock:
+      self.series = {}
+
+
+REQUEST_DURATION = Histogram(
+  "chat_api_request_duration_seconds", "Duração total da requisição ou do evento.", DURATION_BUCKETS
+)
+DB_QUERIES = Histogram(
+  "chat_api_db_queries", "Quantidade de consultas ao banco.", COUNT_BUCKETS
+)
+DB_DURATION = Histogram(
+  "chat_api_db_duration_seconds", "Tempo total gasto em consultas ao banco.", DURATION_BUCKETS
+)
+SERIALIZATION_DURATION = Histogram(
+  "chat_api_serialization_duration_seconds", "Tempo gasto nos serializers.", DURATION_BUCKETS
+)
+SOCKET_EMITS = Histogram(
+  "chat_api_socket_emits", "Quantidade de eventos emitidos via socket.", COUNT_BUCKETS
+)
+SOCKET_EMIT_BYTES = Histogram(
+  "chat_api_socket_emit_bytes", "Bytes dos eventos emitidos via socket.", BYTES_BUCKETS
+)
+
+HISTOGRAMS = [
+  REQUEST_DURATION,
+  DB_QUERIES,
+  DB_DURATION,
+  SERIALIZATION_DURATION,
+  SOCKET_EMITS,
+  SOCKET_EMIT_BYTES,
+]
+
+
+class RequestMetrics:
+  """
+  Métricas acumuladas durante uma requisição ou um evento do socket.
+  """
+
+  def __init__(self, endpoint):
+    self.endpoint = endpoint
+    self.started_at = time.perf_counter()
+    self.queries = []
+    self.db_time = 0.0
+    self.serialization_time = 0.0
+    self.serialization_depth = 0
+    self.emits = 0
+    self.emit_bytes = 0
+
+  def record_query(self, duration, sql) -> None:
+    self.db_time += duration
+    self.queries.append((duration, sql))
+
+  def finish(self) -> float:
+    duration = time.perf_counter() - self.started_at
+
+    if self.endpoint is None:
+      return duration
+
+    REQUEST_DURATION.observe(self.endpoint, duration)
+    DB_QUERIES.observe(self.endpoint, len(self.queries))
+    DB_DURATION.observe(self.endpoint, self.db_time)
+    SERIALIZATION_DURATION.observe(self.endpoint, self.serialization_time)
+    SOCKET_EMITS.observe(self.endpoint, self.emits)
+    SOCKET_EMIT_BYTES.observe(self.endpoint, self.emit_bytes)
+
+    if duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+      top_queries = sorted(self.queries, key=lambda query: query[0], reverse=True)[:5]
+      logger.warning(
+        "Requisição lenta %s: %.3fs (banco %.3fs em %d consultas, serialização %.3fs, "
+        "%d emits/%d bytes). Consultas mais lentas:\n%s",
+        self.endpoint,
+        duration,
+        self.db_time,
+        len(self.queries),
+        self.serialization_time,
+        self.emits,
+        self.emit_bytes,
+        "\n".join(f"  {query_time:.4f}s {sql[:300]}" for query_time, sql in top_queries),
+      )
+
+    return duration
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+  """
+  Wrapper de execução do Django instalado em todas as conexões; mede as consultas
+  da requisição atual. Como usa uma ContextVar, também mede as consultas que rodam
+  em outra thread via sync_to_async (views assíncronas e handlers no ASGI).
+  """
+  metrics = _current.get()
+
+  if metrics is None:
+    return execute(sql, params, many, context)
+
+  started_at = time.perf_counter()
+  try:
+    return execute(sql, params, many, context)
+  finally:
+    metrics.record_query(time.perf_counter() - started_at, sql)
+
+
+def install_execute_wrapper(sender, connection, **kwargs) -> None:
+  if execute_wrapper not in connection.execute_wrappers:
+    connection.execute_wrappers.append(execute_wrapper)
+
+
+connection_created.connect(install_execute_wrapper)
+
+
+@contextmanager
+def measure(endpoint=None):
+  """
+  Mede o bloco como uma requisição: consultas, serialização e emits feitos dentro dele.
+  Sem `endpoint` (que pode ser definido depois), nada é registrado.
+  """
+  metrics = RequestMetrics(endpoint)
+  token = _current.set(metrics)
+  install_execute_wrapper(None, connection)
+
+  try:
+    yield metrics
+  finally:
+    _current.reset(token)
+    metrics.finish()
+
+
+@contextmanager
+def measure_serialization():
+  """
+  Soma o tempo de serialização da requisição atual.
+  Serializers aninhados só são contados uma vez, pelo mais externo.
+  """
+  metrics = _current.get()
+
+  if metrics is None or metrics.serialization_depth:
+    yield
+    return
+
+  metrics.serialization_depth += 1
+  started_at = time.perf_counter()
+
+  try:
+    yield
+  finally:
+    metrics.serialization_depth -= 1
+    metrics.serialization_time += time.perf_counter() - started_at
+
+
+def record_emit(data, encoded=None) -> None:
+  """
+  Registra um evento emitido via socket na requisição atual.
+  `encoded` é o JSON dos dados, quando quem emite já o calculou (core.socket.queue_emit).
+  """
+  metrics = _current.get()
+
+  if metrics is None:
+    return
+
+  if encoded is None:
+    encoded = json.dumps(data, separators=(",", ":"), default=str)
+
+  metrics.emits += 1
+  metrics.emit_bytes += len(encoded)
+
+
+def socket_handler(handler):
+  """
+  Decorator para handlers do Socket.IO: mede o evento como uma requisição.
+  """
+
+  @wraps(handler)
+  def wrapper(*args, **kwargs):
+    with measure(f"socket:{handler.__name__}"):
+      return handler(*args, **kwargs)
+
+  return wrapper
+
+
+class MeasuredSerializerMixin:
+  """
+  Mede o tempo de `.data` dos serializers na requisição atual.
+  """
+
+  @property
+  def data(self):
+    with measure_serialization():
+      return super().data
+
+
+def render() -> str:
+  lines = []
+
+  for histogram in HISTOGRAMS:
+    lines.extend(histogram.render())
+
+  return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+  for histogram in HISTOGRAMS:
+    histogram.reset()
@@ -0,0 +1,74 @@
+import hmac
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.conf import settings
+
+from core import metrics
+
+
+INSTRUMENTED_APPS = ("accounts.", "chats.", "attachments.")
+
+
+class MetricsMiddleware:
+    """
+    Mede as requisições das views da API: duração, consultas ao banco,
+    tempo de serialização e eventos emitidos via socket (core/metrics.py).
+    Requisições que não chegam a uma view da API não são registradas.
+    Atende tanto o servidor eventlet (WSGI) quanto o ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with metrics.measure() as request_metrics:
+            request.metrics = request_metrics
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with metrics.measure() as request_metrics:
+            request.metrics = request_metrics
+            return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+
+        if view is None or not view.__module__.startswith(INSTRUMENTED_APPS):
+            return None
+
+        request.metrics.endpoint = f"{view.__name__}.{request.method.lower()}"
+        return None
+
+
+def metrics_view(request):
+    """
+    Exporta as métricas no formato texto do Prometheus para quem envia o token de
+    METRICS_TOKEN (`Authorization: Bearer <token>`) e, se METRICS_ALLOWED_IPS for
+    informado, apenas a partir desses IPs. Sem METRICS_TOKEN, o endpoint fica desativado.
+    Atrás de um proxy todas as requisições chegam do mesmo IP, por isso o IP sozinho
+    não basta.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404()
+
+    scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        token.strip().encode(), settings.METRICS_TOKEN.encode()
+    ):
+        return HttpResponseForbidden()
+
+    if settings.METRICS_ALLOWED_IPS and request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,115 @@
+import threading
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.db.backends.base.base import NO_DB_ALIAS
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.db_pool import ConnectionPool, PoolTimeout
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Backend PostgreSQL (psycopg2) que reaproveita conexões de um ConnectionPool
+    compartilhado pelo processo. Configurado pela chave "POOL" do banco em DATABASES;
+    sem ela, o comportamento é o do backend padrão do Django.
+
+    O Django continua "fechando" a conexão ao fim de cada requisição (CONN_MAX_AGE=0),
+    mas aqui isso apenas a devolve ao pool.
+    """
+
+    # alias -> (parâmetros da conexão, pool)
+    _green_pools = {}
+    _green_pools_lock = threading.Lock()
+
+    # Pool de onde veio a conexão atual, para devolvê-la ao mesmo pool mesmo que o
+    # pool do alias seja trocado enquanto ela está em uso.
+    _connection_pool = None
+
+    def pool_key(self) -> str:
+        """
+        Parâmetros que identificam as conexões do pool: se mudarem (override_settings,
+        troca do NAME pelo banco de testes, novas credenciais), o pool é trocado.
+        """
+        return repr([
+            (key, sorted(value.items(), key=repr) if isinstance(value, dict) else value)
+            for key, value in sorted(self.settings_dict.items())
+            if key in ("NAME", "USER", "PASSWORD", "HOST", "PORT", "OPTIONS", "POOL")
+        ])
+
+    @property
+    def green_pool(self):
+        options = self.settings_dict.get("POOL")
+
+        if self.alias == NO_DB_ALIAS or not options:
+            return None
+
+        key = self.pool_key()
+        stale = None
+
+        with self._green_pools_lock:
+            current = self._green_pools.get(self.alias)
+
+            if current is None or current[0] != key:
+                stale = current and current[1]
+                current = self._green_pools[self.alias] = (
+                    key,
+                    ConnectionPool(
+                        connect=None,
+                        check=self._check_connection,
+                        reset=self._reset_connection,
+                        **options,
+                    ),
+                )
+
+        if stale:
+            stale.close()
+
+        return current[1]
+
+    def get_new_connection(self, conn_params):
+        pool = self.green_pool
+
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        try:
+            connection = pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+        self._connection_pool = pool
+        self.isolation_level = IsolationLevel(
+            self.settings_dict["OPTIONS"].get("isolation_level", IsolationLevel.READ_COMMITTED)
+        )
+        return connection
+
+    def _close(self):
+        pool = self._connection_pool
+
+        if self.connection is None or pool is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            pool.release(self.connection)
+            # A conexão voltou ao pool e não pode mais ser usada por este wrapper.
+            self.connection = None
+            self._connection_pool = None
+
+    @staticmethod
+    def _check_connection(connection) -> bool:
+        if connection.closed:
+            return False
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+        return True
+
+    @staticmethod
+    def _reset_connection(connection) -> None:
+        if connection.closed:
+            raise base.Database.InterfaceError("Conexão fechada.")
+
+        if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
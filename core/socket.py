@@ -1,37 +1,400 @@
+import json
 import socketio
+import weakref
+from inspect import iscoroutinefunction
+from urllib.parse import parse_qs
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
-from django.utils.timezone import now
+from django.db import transaction
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
 
-from chats.models import Chat, ChatMessage
+from accounts.authentication import CachedJWTAuthentication
+from accounts.models import User
+from accounts.presence import presence
+from chats.exceptions import ChatNotFound
+from chats.models import Chat
+from chats.serializers import ChatMessageSerializer
+from chats.services import create_message, mark_messages_as_read, user_chats
+from core.metrics import record_emit, socket_handler
+from core.socket_managers import get_async_client_manager, get_client_manager
 
-socket = socketio.Server(
-    async_mode="eventlet", cors_allowed_origins=settings.CORS_ALLOWED_ORIGINS
-)
+if settings.SERVER_MODE == "asgi":
+    socket = socketio.AsyncServer(
+        async_mode="asgi",
+        cors_allowed_origins=settings.CORS_ALLOWED_ORIGINS,
+        client_manager=get_async_client_manager(settings.SOCKETIO_CLIENT_MANAGER),
+    )
+else:
+    socket = socketio.Server(
+        async_mode="eventlet",
+        cors_allowed_origins=settings.CORS_ALLOWED_ORIGINS,
+        client_manager=get_client_manager(settings.SOCKETIO_CLIENT_MANAGER),
+    )
+
+
+def call(method, *args, **kwargs):
+    """
+    Chama um método do servidor a partir de código síncrono (views e handlers).
+    No AsyncServer os métodos são corrotinas e rodam no event loop.
+    """
+    if iscoroutinefunction(method):
+        return async_to_sync(method)(*args, **kwargs)
+
+    return method(*args, **kwargs)
+
+
+async def acall(method, *args, **kwargs):
+    """
+    Chama um método do servidor a partir de código assíncrono (views assíncronas).
+    """
+    if iscoroutinefunction(method):
+        return await method(*args, **kwargs)
+
+    return await sync_to_async(method)(*args, **kwargs)
+
+
+def socket_event(handler):
+    """
+    Registra um handler de evento medido por core.metrics.
+    Os handlers usam o ORM de forma síncrona; no AsyncServer rodam via sync_to_async.
+    """
+    handler = socket_handler(handler)
+
+    if iscoroutinefunction(socket.emit):
+        async def run(*args):
+            return await sync_to_async(handler)(*args)
+
+        socket.on(handler.__name__, run)
+    else:
+        socket.on(handler.__name__, handler)
+
+    return handler
+
+
+def user_room(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def chat_room(chat_id) -> str:
+    return f"chat:{chat_id}"
+
+
+class EmitBuffer:
+    """
+    Eventos emitidos dentro de uma transação, enviados juntos quando ela é confirmada
+    (transaction.on_commit). Eventos idênticos (mesmo nome, dados, destino e skip_sid)
+    são enviados uma única vez. Se a transação for desfeita, nada é enviado.
+    Há um buffer por nível de savepoint, assim um savepoint desfeito descarta só os seus eventos.
+
+    Os buffers abertos ficam em `registry`, por conexão e savepoints (connection.savepoint_ids),
+    com referências fracas: quem mantém o buffer vivo é o seu flush registrado no on_commit.
+    No commit o flush remove o buffer; num rollback o Django descarta o flush e o buffer some.
+    """
+
+    registry = weakref.WeakKeyDictionary()
+
+    def __init__(self, buffers, key):
+        self.events = {}
+        self.buffers = buffers
+        self.key = key
+
+    def add(self, event, data, to, skip_sid, encoded) -> bool:
+        key = (event, encoded, to if isinstance(to, str) else tuple(sorted(to)), skip_sid)
+
+        if key in self.events:
+            return False
+
+        self.events[key] = (event, data, to, skip_sid)
+        return True
+
+    def flush(self) -> None:
+        if self.buffers.get(self.key) is self:
+            del self.buffers[self.key]
+
+        events = list(self.events.values())
+        self.events.clear()
+        dispatch(events)
+
+    @classmethod
+    def current(cls, connection):
+        """
+        Retorna o buffer do nível de savepoint atual, registrando-o no on_commit se ainda não existir.
+        """
+        buffers = cls.registry.setdefault(connection, weakref.WeakValueDictionary())
+        key = tuple(connection.savepoint_ids)
+        buffer = buffers.get(key)
+
+        if buffer is None:
+            buffer = buffers[key] = cls(buffers, key)
+            transaction.on_commit(buffer.flush)
+
+        return buffer
+
+
+def encode_payload(data) -> str:
+    """
+    Dados do evento em JSON, usados como chave no EmitBuffer e para medir o tamanho do evento.
+    """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def send_events(events) -> None:
+    for event, data, to, skip_sid in events:
+        call(socket.emit, event, data, to=to, skip_sid=skip_sid)
+
+
+async def asend_events(events) -> None:
+    for event, data, to, skip_sid in events:
+        await acall(socket.emit, event, data, to=to, skip_sid=skip_sid)
+
+
+def dispatch(events) -> None:
+    """
+    Envia os eventos. Com SOCKETIO_BACKGROUND_EMITS, o envio roda numa tarefa em segundo
+    plano do servidor (greenlet no eventlet, task no ASGI) e não atrasa a resposta.
+    """
+    if not events:
+        return
+
+    if not settings.SOCKETIO_BACKGROUND_EMITS:
+        return send_events(events)
+
+    if iscoroutinefunction(socket.emit):
+        async def schedule():
+            socket.start_background_task(asend_events, events)
+
+        return async_to_sync(schedule)()
+
+    socket.start_background_task(send_events, events)
+
+
+def queue_emit(event, data, to, skip_sid=None) -> None:
+    """
+    Emite um evento ao fim da transação atual ou, fora de uma transação, imediatamente.
+    """
+    connection = transaction.get_connection()
+
+    if not connection.in_atomic_block:
+        record_emit(data)
+        return dispatch([(event, data, to, skip_sid)])
+
+    encoded = encode_payload(data)
+
+    if EmitBuffer.current(connection).add(event, data, to, skip_sid, encoded):
+        record_emit(data, encoded)
+
+
+async def aqueue_emit(event, data, to, skip_sid=None) -> None:
+    """
+    Versão para views assíncronas, que rodam fora de transação: emite imediatamente.
+    """
+    record_emit(data)
+
+    if not iscoroutinefunction(socket.emit):
+        return await sync_to_async(dispatch)([(event, data, to, skip_sid)])
+
+    if settings.SOCKETIO_BACKGROUND_EMITS:
+        socket.start_background_task(asend_events, [(event, data, to, skip_sid)])
+    else:
+        await asend_events([(event, data, to, skip_sid)])
+
+
+def emit_to_users(event, data, user_ids, skip_sid=None) -> None:
+    """
+    Emite um evento apenas para as conexões dos usuários informados.
+    Dentro de uma transação, o envio espera o commit (ver EmitBuffer).
+    """
+    # Sem destinatários o Socket.IO enviaria para todas as conexões.
+    if not user_ids:
+        return
+
+    queue_emit(event, data, [user_room(user_id) for user_id in set(user_ids)], skip_sid)
+
+
+async def aemit_to_users(event, data, user_ids, skip_sid=None) -> None:
+    if not user_ids:
+        return
+
+    await aqueue_emit(event, data, [user_room(user_id) for user_id in set(user_ids)], skip_sid)
 
 
-@socket.event
+def emit_to_chat(event, data, chat_id, skip_sid=None) -> None:
+    """
+    Emite um evento apenas para as conexões dos participantes de um chat.
+    Dentro de uma transação, o envio espera o commit (ver EmitBuffer).
+    """
+    queue_emit(event, data, chat_room(chat_id), skip_sid)
+
+
+async def aemit_to_chat(event, data, chat_id, skip_sid=None) -> None:
+    await aqueue_emit(event, data, chat_room(chat_id), skip_sid)
+
+
+def join_chat_room(chat_id, user_ids) -> None:
+    """
+    Inscreve as conexões ativas dos usuários informados na sala de um chat recém-criado,
+    inclusive as conexões atendidas por outros processos.
+    """
+    call(
+        socket.manager.join_room_members,
+        [user_room(user_id) for user_id in set(user_ids)],
+        chat_room(chat_id),
+    )
+
+
+async def ajoin_chat_room(chat_id, user_ids) -> None:
+    await acall(
+        socket.manager.join_room_members,
+        [user_room(user_id) for user_id in set(user_ids)],
+        chat_room(chat_id),
+    )
+
+
+def close_chat_room(chat_id) -> None:
+    call(socket.close_room, chat_room(chat_id))
+
+
+def get_session_user_id(sid) -> int | None:
+    """
+    Retorna o id do usuário autenticado na conexão, ou None se a conexão não existir.
+    """
+    try:
+        return call(socket.get_session, sid).get("user_id")
+    except KeyError:
+        return None
+
+
+async def aget_session_user_id(sid) -> int | None:
+    try:
+        return (await acall(socket.get_session, sid)).get("user_id")
+    except KeyError:
+        return None
+
+
+def get_user_chats(user_id) -> list[tuple[int, int]]:
+    """
+    Retorna (id do chat, id do outro participante) dos chats ativos do usuário.
+    """
+    chats = user_chats(user_id).values_list("id", "from_user_id", "to_user_id")
+
+    return [
+        (chat_id, to_user_id if from_user_id == user_id else from_user_id)
+        for chat_id, from_user_id, to_user_id in chats
+    ]
+
+
+def emit_presence(user_id, contact_ids) -> None:
+    """
+    Avisa os contatos que o usuário ficou online ou offline.
+    """
+    last_access = presence.last_seen(user_id)
+
+    emit_to_users(
+        "user_presence",
+        {
+            "user_id": user_id,
+            "online": presence.is_online(user_id),
+            "last_access": last_access.isoformat() if last_access else None,
+        },
+        contact_ids,
+    )
+
+
+def authenticate(environ, auth) -> int | None:
+    """
+    Valida o token de acesso enviado no `auth` da conexão ou na query string (`token`).
+    Retorna o id do usuário se o token for válido e não tiver sido revogado no logout,
+    caso contrário retorna None.
+    """
+    token = (auth or {}).get("token")
+
+    if not token:
+        token = parse_qs(environ.get("QUERY_STRING", "")).get("token", [None])[0]
+
+    if not token:
+        return None
+
+    try:
+        return CachedJWTAuthentication().get_user(AccessToken(token)).id
+    except (TokenError, AuthenticationFailed):
+        return None
+
+
+@socket_event
+def connect(sid, environ, auth=None):
+    user_id = authenticate(environ, auth)
+
+    if not user_id:
+        raise socketio.exceptions.ConnectionRefusedError("Usuário não autenticado.")
+
+    call(socket.save_session, sid, {"user_id": user_id})
+    call(socket.enter_room, sid, user_room(user_id))
+
+    chats = get_user_chats(user_id)
+
+    for chat_id, _ in chats:
+        call(socket.enter_room, sid, chat_room(chat_id))
+
+    if presence.connect(user_id, sid):
+        emit_presence(user_id, [contact_id for _, contact_id in chats])
+
+
+@socket_event
+def disconnect(sid, reason=None):
+    user_id = get_session_user_id(sid)
+
+    if user_id and presence.disconnect(user_id, sid):
+        emit_presence(user_id, [contact_id for _, contact_id in get_user_chats(user_id)])
+
+
+@socket_event
+def get_presence(sid, data):
+    """
+    Retorna (ack) o status dos contatos informados em `user_ids`:
+    [{"user_id", "online", "last_access"}]. Usuários sem chat com quem pediu são ignorados.
+    """
+    user_id = get_session_user_id(sid)
+    contact_ids = {contact_id for _, contact_id in get_user_chats(user_id)}
+    user_ids = [
+        contact_id for contact_id in (data or {}).get("user_ids", []) if contact_id in contact_ids
+    ]
+
+    last_access = dict(User.objects.filter(id__in=user_ids).values_list("id", "last_access"))
+
+    return [
+        {
+            "user_id": contact_id,
+            "online": presence.is_online(contact_id),
+            "last_access": (presence.last_seen(contact_id) or last_access[contact_id]).isoformat(),
+        }
+        for contact_id in user_ids
+        if contact_id in last_access
+    ]
+
+
+@socket_event
 def update_messages_as_read(sid, data):
     chat_id = data.get("chat_id")
+    user_id = get_session_user_id(sid)
 
-    chat = Chat.objects.values("from_user_id", "to_user_id").filter(id=chat_id).first()
+    chat = user_chats(user_id).filter(id=chat_id).first()
 
-    ChatMessage.objects.filter(
-        chat_id=chat_id,
-        viewed_at__isnull=True,
-    ).update(
-        viewed_at=now(),
-    )
+    if not chat or not mark_messages_as_read(chat, user_id):
+        return
 
-    socket.emit(
+    emit_to_users(
         "update_chat",
         {
             "query": {
-                "users": [chat["from_user_id"], chat["to_user_id"]],
+                "users": [chat.from_user_id, chat.to_user_id],
             }
         },
+        [chat.from_user_id, chat.to_user_id],
     )
 
-    socket.emit(
+    emit_to_chat(
         "mark_messages_as_read",
         {
             "query": {
@@ -39,4 +402,81 @@ def update_messages_as_read(sid, data):
                 "exclude_user_id": data.get("exclude_user_id", None),
             }
         },
+        chat_id,
+        skip_sid=sid,
     )
+
+
+@socket_event
+def send_message(sid, data):
+    """
+    Envia uma mensagem pela conexão, sem uma requisição HTTP: o usuário é o que se
+    autenticou no connect. `data`: {"chat_id", "body", "upload_id"} — anexos são
+    enviados antes em partes (attachments/uploads) e referenciados por `upload_id`.
+    Usa a mesma validação e gravação de ChatMessagesView.post e emite os mesmos eventos.
+    Retorna (ack) {"result": mensagem} ou {"error": {"code", "message"}}, com o
+    `client_id` recebido, para o cliente associar a resposta ao envio.
+    """
+    data = data if isinstance(data, dict) else {}
+    user_id = get_session_user_id(sid)
+    ack = {"client_id": data.get("client_id")}
+
+    try:
+        with transaction.atomic():
+            chat = chat_for_message(user_id, data.get("chat_id"))
+            mark_messages_as_read(chat, user_id)
+
+            message = create_message(
+                chat,
+                user_id,
+                body=data.get("body"),
+                upload_id=data.get("upload_id"),
+            )
+            serializer = ChatMessageSerializer(
+                message, context={"user_id": user_id, "chat": chat}
+            ).data
+
+            emit_to_chat(
+                "update_chat_message",
+                {
+                    "type": "create",
+                    "message": serializer,
+                    "query": {
+                        "chat_id": chat.id,
+                    },
+                },
+                chat.id,
+                skip_sid=sid,
+            )
+
+            emit_to_users(
+                "update_chat",
+                {
+                    "query": {
+                        "users": [chat.from_user_id, chat.to_user_id],
+                    }
+                },
+                [chat.from_user_id, chat.to_user_id],
+            )
+    except APIException as error:
+        return {
+            **ack,
+            "error": {"code": error.get_codes(), "message": str(error.detail)},
+        }
+
+    return {**ack, "result": serializer}
+
+
+def chat_for_message(user_id, chat_id) -> Chat:
+    """
+    Chat ativo do usuário em que a mensagem será gravada; lança ChatNotFound.
+    """
+    try:
+        chat = user_chats(user_id).filter(id=int(chat_id)).first()
+    except (TypeError, ValueError):
+        chat = None
+
+    if not chat:
+        raise ChatNotFound
+
+    return chat
@@ -0,0 +1,340 @@
+import json
+import os
+import socket as stdlib_socket
+import struct
+import threading
+import time
+
+import socketio
+from django.core.exceptions import ImproperlyConfigured
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+
+JOIN_ROOM_MEMBERS = "__join_room_members__"
+
+PUBLISHER = b"pub"
+SUBSCRIBER = b"sub"
+
+_header = struct.Struct("!I")
+
+# Espera máxima, em segundos, entre as tentativas de reconectar ao broker.
+MAX_RETRY_SLEEP = 60
+
+
+class RoomMembersMixin:
+    """
+    Permite inscrever numa sala todas as conexões que estão em outras salas,
+    mesmo quando essas conexões pertencem a outros processos.
+    Usado para colocar os participantes de um chat recém-criado na sala do chat.
+    """
+
+    def join_room_members(self, rooms, room, namespace="/"):
+        self._join_room_members(rooms, room, namespace)
+
+        if isinstance(self, socketio.PubSubManager):
+            self._publish(self._join_room_members_message(rooms, room, namespace))
+
+    def _join_room_members_message(self, rooms, room, namespace):
+        return {
+            "method": "emit",
+            "event": JOIN_ROOM_MEMBERS,
+            "data": {"rooms": rooms, "room": room},
+            "namespace": namespace,
+            "room": None,
+            "skip_sid": None,
+            "callback": None,
+            "host_id": self.host_id,
+        }
+
+    def _join_room_members(self, rooms, room, namespace):
+        for sid, eio_sid in list(self.get_participants(namespace, rooms)):
+            socketio.Manager.enter_room(self, sid, namespace, room, eio_sid=eio_sid)
+
+    def _handle_emit(self, message):
+        if message.get("event") == JOIN_ROOM_MEMBERS:
+            data = message["data"]
+            return self._join_room_members(data["rooms"], data["room"], message["namespace"])
+
+        return super()._handle_emit(message)
+
+
+class LocalManager(RoomMembersMixin, socketio.Manager):
+    """
+    Gerenciador em memória, para um único processo.
+    """
+
+
+class RedisManager(RoomMembersMixin, socketio.RedisManager):
+    pass
+
+
+class KafkaManager(RoomMembersMixin, socketio.KafkaManager):
+    pass
+
+
+class KombuManager(RoomMembersMixin, socketio.KombuManager):
+    pass
+
+
+class AsyncRoomMembersMixin(RoomMembersMixin):
+    """
+    Versão do RoomMembersMixin para os gerenciadores do AsyncServer (ASGI).
+    """
+
+    async def join_room_members(self, rooms, room, namespace="/"):
+        await self._join_room_members(rooms, room, namespace)
+
+        if isinstance(self, AsyncPubSubManager):
+            await self._publish(self._join_room_members_message(rooms, room, namespace))
+
+    async def _join_room_members(self, rooms, room, namespace):
+        for sid, eio_sid in list(self.get_participants(namespace, rooms)):
+            await socketio.AsyncManager.enter_room(self, sid, namespace, room, eio_sid=eio_sid)
+
+    async def _handle_emit(self, message):
+        if message.get("event") == JOIN_ROOM_MEMBERS:
+            data = message["data"]
+            return await self._join_room_members(data["rooms"], data["room"], message["namespace"])
+
+        return await super()._handle_emit(message)
+
+
+class AsyncLocalManager(AsyncRoomMembersMixin, socketio.AsyncManager):
+    """
+    Gerenciador em memória do AsyncServer, para um único processo.
+    """
+
+
+class AsyncRedisManager(AsyncRoomMembersMixin, socketio.AsyncRedisManager):
+    pass
+
+
+class AsyncAioPikaManager(AsyncRoomMembersMixin, socketio.AsyncAioPikaManager):
+    pass
+
+
+def _send_frame(sock, data: bytes) -> None:
+    sock.sendall(_header.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size: int) -> bytes | None:
+    chunks = []
+
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _recv_frame(sock) -> bytes | None:
+    header = _recv_exactly(sock, _header.size)
+
+    if header is None:
+        return None
+
+    return _recv_exactly(sock, _header.unpack(header)[0])
+
+
+class UnixSocketManager(RoomMembersMixin, socketio.PubSubManager):
+    """
+    Gerenciador pub/sub que troca eventos entre processos da mesma máquina
+    através de um broker em socket Unix (ver run_broker e o comando socket_broker).
+    Substitui o Redis em testes e em instalações de um único servidor.
+
+    URL: unix:///caminho/do/broker.sock
+    """
+
+    name = "unix"
+
+    def __init__(self, url="unix:///tmp/chat-api-socketio.sock", channel="socketio",
+                 write_only=False, logger=None):
+        if not url.startswith("unix://"):
+            raise ValueError("URL inesperada para o broker: " + url)
+
+        self.path = url[len("unix://"):]
+        self.publisher = None
+        self.publisher_lock = None
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _socket_module(self):
+        if self.server is not None and self.server.async_mode == "eventlet":
+            from eventlet.green import socket
+
+            return socket
+
+        return stdlib_socket
+
+    def _lock(self):
+        if self.server is not None and self.server.async_mode == "eventlet":
+            from eventlet.semaphore import Semaphore
+
+            return Semaphore()
+
+        return threading.Lock()
+
+    def _connect(self, role: bytes):
+        module = self._socket_module()
+        sock = module.socket(module.AF_UNIX, module.SOCK_STREAM)
+        sock.connect(self.path)
+        _send_frame(sock, role)
+        return sock
+
+    def _publish(self, data):
+        frame = json.dumps({"channel": self.channel, "data": data}).encode()
+
+        if self.publisher_lock is None:
+            self.publisher_lock = self._lock()
+
+        with self.publisher_lock:
+            for retry in (False, True):
+                try:
+                    if self.publisher is None:
+                        self.publisher = self._connect(PUBLISHER)
+                    _send_frame(self.publisher, frame)
+                    return
+                except OSError:
+                    self.publisher = None
+                    if retry:
+                        raise
+
+    def _sleep(self, seconds):
+        if self.server is not None:
+            return self.server.sleep(seconds)
+
+        time.sleep(seconds)
+
+    def _listen(self):
+        """
+        Recebe os eventos publicados pelos outros processos. Se o broker estiver fora
+        do ar ou fechar a conexão, tenta de novo com espera exponencial (até
+        MAX_RETRY_SLEEP segundos), como o RedisManager, registrando uma linha por falha.
+        """
+        retry_sleep = 1
+
+        while True:
+            subscriber = None
+
+            try:
+                subscriber = self._connect(SUBSCRIBER)
+                retry_sleep = 1
+
+                while True:
+                    frame = _recv_frame(subscriber)
+                    if frame is None:
+                        raise ConnectionResetError("conexão fechada pelo broker")
+
+                    message = json.loads(frame)
+                    if message.get("channel") == self.channel:
+                        yield message["data"]
+            except OSError as error:
+                self._get_logger().error(
+                    "Broker do Socket.IO indisponível em %s (%s), nova tentativa em %ss",
+                    self.path, error, retry_sleep,
+                )
+            finally:
+                if subscriber is not None:
+                    subscriber.close()
+
+            self._sleep(retry_sleep)
+            retry_sleep = min(retry_sleep * 2, MAX_RETRY_SLEEP)
+
+def get_client_manager(url: str | None):
+    """
+    Cria o gerenciador de clientes do Socket.IO a partir da URL configurada
+    em SOCKETIO_CLIENT_MANAGER. Sem URL, usa o gerenciador em memória.
+    """
+    if not url:
+        return LocalManager()
+
+    if url.startswith("unix://"):
+        return UnixSocketManager(url)
+
+    if url.startswith(("redis://", "rediss://", "valkey://", "unix+redis://")):
+        return RedisManager(url)
+
+    if url.startswith("kafka://"):
+        return KafkaManager(url)
+
+    return KombuManager(url)
+
+
+def get_async_client_manager(url: str | None):
+    """
+    Equivalente de get_client_manager para o AsyncServer (ASGI).
+    O broker em socket Unix só atende o servidor eventlet; no ASGI use Redis ou AMQP.
+    """
+    if not url:
+        return AsyncLocalManager()
+
+    if url.startswith(("redis://", "rediss://", "valkey://", "unix+redis://")):
+        return AsyncRedisManager(url)
+
+    if url.startswith(("amqp://", "amqps://")):
+        return AsyncAioPikaManager(url)
+
+    raise ImproperlyConfigured(
+        f"SOCKETIO_CLIENT_MANAGER não suportado no modo ASGI: {url}. Use Redis ou AMQP."
+    )
+
+
+def run_broker(path: str, ready: threading.Event | None = None) -> None:
+    """
+    Broker simples para o UnixSocketManager.
+    Cada conexão se identifica como publicadora ou assinante no primeiro frame;
+    todo frame publicado é repassado para todos os assinantes.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = stdlib_socket.socket(stdlib_socket.AF_UNIX, stdlib_socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    subscribers = set()
+    lock = threading.Lock()
+
+    def publish(frame):
+        with lock:
+            for subscriber in list(subscribers):
+                try:
+                    _send_frame(subscriber, frame)
+                except OSError:
+                    subscribers.discard(subscriber)
+
+    def handle(conn):
+        try:
+            role = _recv_frame(conn)
+
+            if role == SUBSCRIBER:
+                with lock:
+                    subscribers.add(conn)
+                # Assinantes não enviam nada; a leitura só detecta o fechamento.
+                while conn.recv(1):
+                    pass
+                return
+
+            while role == PUBLISHER:
+                frame = _recv_frame(conn)
+                if frame is None:
+                    break
+                publish(frame)
+        except OSError:
+            pass
+        finally:
+            with lock:
+                subscribers.discard(conn)
+            conn.close()
+
+    if ready is not None:
+        ready.set()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        server.close()
@@ -15,12 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from django.conf.urls.static import static
+from django.urls import path, include, re_path
 from django.conf import settings
+from attachments.views import MediaView
+from core.middleware import metrics_view
 
 urlpatterns = [
     path('api/v1/accounts/', include('accounts.urls')),
     path('api/v1/chats/', include('chats.urls')),
+    path('api/v1/attachments/', include('attachments.urls')),
     path('admin/', admin.site.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view),
+    re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.+)$", MediaView.as_view()),
+]
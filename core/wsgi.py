@@ -1,18 +1,40 @@
+import eventlet
+
+# Antes de qualquer outro import: torna threading, sockets e o psycopg2 cooperativos,
+# assim cada greenlet tem a sua conexão do Django e o pool de conexões não bloqueia o servidor.
+eventlet.monkey_patch()
+
+from eventlet.support.psycopg2_patcher import make_psycopg_green
+
+make_psycopg_green()
+
 import os
+import multiprocessing
 import eventlet.wsgi
 import socketio
-import eventlet
 
 from django.core.wsgi import get_wsgi_application
 from django.contrib.staticfiles.handlers import StaticFilesHandler
-from core.socket import socket
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Inicializa o Django antes de importar o servidor Socket.IO, que usa os models,
+# assim o servidor também pode ser iniciado com `python -m core.wsgi`.
 application = StaticFilesHandler(get_wsgi_application())
+
+from django.conf import settings
+
+from accounts.presence import presence
+from core.socket import socket
+
 application = socketio.WSGIApp(socket, application)
 
-eventlet.wsgi.server(
-    eventlet.listen(('', 8000)),
-    application,
-)
\ No newline at end of file
+# Os processos do pool de miniaturas (attachments/thumbnails) importam este módulo
+# ao iniciar e não devem subir o servidor.
+if multiprocessing.parent_process() is None:
+    presence.start(settings.PRESENCE_FLUSH_INTERVAL)
+
+    eventlet.wsgi.server(
+        eventlet.listen(('', 8000)),
+        application,
+    )
\ No newline at end of file